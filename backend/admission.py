@@ -0,0 +1,198 @@
+from collections import OrderedDict
+import asyncio
+import json
+import math
+import os
+import threading
+import time
+import metrics
+
+# Контроль нагрузки: запросы делятся на классы, у каждого класса свой лимит
+# одновременно выполняемых запросов и ограниченная очередь ожидания. Когда
+# очередь заполнена или ожидание затянулось, запрос сразу отклоняется (503),
+# а не занимает поток и соединение с БД. Дополнительно у каждого клиента
+# есть лимит частоты запросов (token bucket, 429)
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.getenv(name, str(default)))
+
+def _env_float(name: str, default: float) -> float:
+    return float(os.getenv(name, str(default)))
+
+# Классы запросов: изменения (бронирования, заселение), обычное чтение
+# и тяжёлые отчёты/выгрузки
+WRITE, READ, BULK = "write", "read", "bulk"
+
+# Лимиты по классам: одновременно выполняемые запросы, длина очереди, время ожидания (с)
+ADMISSION_LIMITS = {
+    WRITE: (_env_int("ADMISSION_WRITE_CONCURRENCY", 16), _env_int("ADMISSION_WRITE_QUEUE", 64), _env_float("ADMISSION_WRITE_TIMEOUT", 5)),
+    READ: (_env_int("ADMISSION_READ_CONCURRENCY", 16), _env_int("ADMISSION_READ_QUEUE", 64), _env_float("ADMISSION_READ_TIMEOUT", 2)),
+    BULK: (_env_int("ADMISSION_BULK_CONCURRENCY", 4), _env_int("ADMISSION_BULK_QUEUE", 8), _env_float("ADMISSION_BULK_TIMEOUT", 1)),
+}
+
+# Лимит частоты запросов одного клиента: пополнение в секунду и запас.
+# Страницы фронтенда загружают детали записей отдельными запросами, поэтому
+# запас большой. RATE_LIMIT_PER_SECOND=0 отключает ограничение
+RATE_LIMIT_PER_SECOND = _env_float("RATE_LIMIT_PER_SECOND", 100)
+RATE_LIMIT_BURST = _env_float("RATE_LIMIT_BURST", 300)
+
+# Стоимость запроса в токенах: тяжёлые запросы расходуют лимит быстрее
+REQUEST_COST = {WRITE: 1, READ: 1, BULK: 5}
+
+# Отчёты, аналитика и выгрузки
+BULK_PREFIXES = ("/analytics", "/sync", "/reports", "/update-room-statuses")
+
+# Не ограничиваются: долгоживущая лента событий, метрики и документация
+EXEMPT_PREFIXES = ("/events", "/metrics", "/docs", "/redoc", "/openapi.json")
+
+# Сколько клиентов помнить для лимита частоты
+RATE_LIMIT_CLIENTS = 10000
+
+in_flight_gauge = metrics.gauge(
+    "inncontrol_admission_in_flight", "Выполняемые запросы по классам", ("request_class",)
+)
+queue_depth_gauge = metrics.gauge(
+    "inncontrol_admission_queue_depth", "Запросы в очереди ожидания по классам", ("request_class",)
+)
+admitted_counter = metrics.counter(
+    "inncontrol_admission_admitted_total", "Принятые запросы по классам", ("request_class",)
+)
+shed_counter = metrics.counter(
+    "inncontrol_admission_shed_total", "Отклонённые запросы по классам и причинам", ("request_class", "reason")
+)
+
+def classify(scope) -> str:
+    path = scope.get("path", "")
+    if path.startswith(EXEMPT_PREFIXES) or path == "/":
+        return None
+    if path.startswith(BULK_PREFIXES):
+        return BULK
+    method = scope.get("method", "GET")
+    if method in ("GET", "HEAD"):
+        # Потоковая выдача истории (NDJSON) тоже относится к тяжёлым запросам
+        for name, value in scope.get("headers", ()):
+            if name == b"accept" and b"application/x-ndjson" in value:
+                return BULK
+        return READ
+    if method == "OPTIONS":
+        return None
+    return WRITE
+
+def client_key(scope) -> str:
+    for name, value in scope.get("headers", ()):
+        if name == b"authorization":
+            return value.decode("latin-1")
+    client = scope.get("client")
+    return client[0] if client else ""
+
+# Ограничение одновременных запросов одного класса с очередью ожидания
+class ClassLimiter:
+    def __init__(self, request_class: str, concurrency: int, queue_size: int, timeout: float):
+        self.request_class = request_class
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.active = 0
+        self.waiting = 0
+        self._semaphore = None
+
+    async def acquire(self):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        if self._semaphore.locked() and self.waiting >= self.queue_size:
+            return "queue_full"
+        self.waiting += 1
+        queue_depth_gauge.set(self.waiting, request_class=self.request_class)
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            return "timeout"
+        finally:
+            self.waiting -= 1
+            queue_depth_gauge.set(self.waiting, request_class=self.request_class)
+        self.active += 1
+        in_flight_gauge.set(self.active, request_class=self.request_class)
+        return None
+
+    def release(self):
+        self.active -= 1
+        in_flight_gauge.set(self.active, request_class=self.request_class)
+        self._semaphore.release()
+
+# Лимит частоты запросов по клиентам (token bucket)
+class RateLimiter:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    # Возвращает 0, если запрос разрешён, иначе через сколько секунд повторить
+    def take(self, key: str, cost: float) -> float:
+        if self.rate <= 0:
+            return 0
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens >= cost:
+                self._buckets[key] = (tokens - cost, now)
+                retry_after = 0
+            else:
+                self._buckets[key] = (tokens, now)
+                retry_after = (cost - tokens) / self.rate
+            self._buckets.move_to_end(key)
+            if len(self._buckets) > RATE_LIMIT_CLIENTS:
+                self._buckets.popitem(last=False)
+        return retry_after
+
+async def _reject(send, status_code: int, detail: str, retry_after: float):
+    body = json.dumps({"detail": detail}, ensure_ascii=False).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status_code,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+# ASGI-мидлвар контроля нагрузки
+class AdmissionMiddleware:
+    def __init__(self, app, limits: dict = None, rate: float = RATE_LIMIT_PER_SECOND, burst: float = RATE_LIMIT_BURST):
+        self.app = app
+        self.limiters = {
+            request_class: ClassLimiter(request_class, *values)
+            for request_class, values in (limits or ADMISSION_LIMITS).items()
+        }
+        self.rate_limiter = RateLimiter(rate, burst)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        request_class = classify(scope)
+        if request_class is None:
+            await self.app(scope, receive, send)
+            return
+
+        retry_after = self.rate_limiter.take(client_key(scope), REQUEST_COST[request_class])
+        if retry_after:
+            shed_counter.inc(request_class=request_class, reason="rate_limit")
+            await _reject(send, 429, "Слишком много запросов. Повторите попытку позже", retry_after)
+            return
+
+        limiter = self.limiters[request_class]
+        reason = await limiter.acquire()
+        if reason is not None:
+            shed_counter.inc(request_class=request_class, reason=reason)
+            await _reject(send, 503, "Сервер перегружен. Повторите попытку позже", 1)
+            return
+
+        admitted_counter.inc(request_class=request_class)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.release()
@@ -0,0 +1,224 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import event, func, cast, case, and_, select, true, literal_column, Date
+from collections import OrderedDict
+from datetime import date, timedelta
+import threading
+import models
+import crud
+import etl
+import pricing
+
+# Допустимые варианты группировки для аналитики
+GROUP_BY_OPTIONS = ("day", "week", "month", "room_type", "floor")
+
+# Кеш результатов за закрытые периоды (полностью в прошлом): такие данные
+# больше не меняются, поэтому повторные отчёты не обращаются к БД
+CLOSED_PERIOD_CACHE_SIZE = 256
+_closed_period_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+def clear_cache():
+    with _cache_lock:
+        _closed_period_cache.clear()
+
+# Изменения прошлых дат (бронирования, уборки, цены) отмечаются для пересчёта
+# витрин в etl_dirty_ranges - в etl.track_dirty_ranges и etl.mark_dirty.
+# Такие отметки означают, что закрытый период изменился: после фиксации
+# транзакции кеш сбрасывается
+_STALE_KEY = "analytics_cache_stale"
+
+@event.listens_for(Session, "after_flush")
+def _note_closed_period_changes(session, flush_context):
+    today = date.today()
+    if any(isinstance(obj, models.EtlDirtyRange) and obj.start_date < today for obj in session.new):
+        session.info[_STALE_KEY] = True
+
+@event.listens_for(Session, "after_commit")
+def _clear_cache_after_commit(session):
+    if session.info.pop(_STALE_KEY, False):
+        clear_cache()
+
+@event.listens_for(Session, "after_rollback")
+def _forget_closed_period_changes(session):
+    session.info.pop(_STALE_KEY, None)
+
+def _bucket_columns(group_by: str, day):
+    # Выражения группировки: ключ периода и его подпись
+    if group_by == "day":
+        return [day]
+    if group_by == "week":
+        return [cast(func.date_trunc("week", day), Date)]
+    if group_by == "month":
+        return [cast(func.date_trunc("month", day), Date)]
+    if group_by == "room_type":
+        return [models.RoomType.type_id, models.RoomType.name]
+    return [models.Room.floor]
+
+# Считает по каждой группе номеро-ночи (доступные и проданные) и выручку.
+# Основной источник - витрина daily_room_occupancy (см. etl.py). Если период
+# выходит за её покрытие или в нём есть даты, ожидающие пересчёта, календарь
+# строится в SQL через generate_series, каждая ночь соединяется с номерами
+# и пересекающими её бронированиями
+def _query_room_nights(db: Session, start: date, end: date, group_by: str, hotel_id: int = None):
+    if _facts_cover(db, start, end) and not _facts_dirty(db, start, end):
+        rows = _query_room_nights_from_facts(db, start, end, group_by, hotel_id)
+        return _rows_to_stats(rows, group_by)
+
+    days = select(
+        cast(func.generate_series(start, end, literal_column("interval '1 day'")), Date).label("day")
+    ).subquery("days")
+    day = days.c.day
+
+    bucket = _bucket_columns(group_by, day)
+
+    query = db.query(
+        *bucket,
+        func.count().label("available"),
+        func.count(models.Booking.booking_id).label("sold"),
+        func.coalesce(func.sum(case(
+            (models.Booking.booking_id.isnot(None), pricing.night_revenue()),
+            else_=0
+        )), 0).label("revenue"),
+    ).select_from(days).join(
+        models.Room, true()
+    ).join(
+        models.RoomType, models.RoomType.type_id == models.Room.type_id
+    ).outerjoin(
+        models.Booking, and_(
+            models.Booking.room_id == models.Room.room_id,
+            models.Booking.check_in_date <= day,
+            models.Booking.check_out_date > day,
+            # Границы по дате заезда ограничивают чтение нужными секциями bookings
+            models.Booking.check_in_date.between(start - timedelta(days=crud.MAX_STAY_DAYS), end),
+            models.Booking.status != crud.CANCELLED_BOOKING_STATUS
+        )
+    )
+
+    if hotel_id is not None:
+        query = query.filter(models.Room.hotel_id == hotel_id)
+
+    rows = query.group_by(*bucket).order_by(*bucket).all()
+    return _rows_to_stats(rows, group_by)
+
+def _rows_to_stats(rows, group_by: str):
+    stats = []
+    for row in rows:
+        if group_by == "room_type":
+            key, label = str(row[0]), row[1]
+        elif group_by == "floor":
+            key, label = str(row[0]), f"Этаж {row[0]}"
+        else:
+            key = label = row[0].isoformat()
+        stats.append(_make_stat(key, label, row.available, row.sold, row.revenue))
+    return stats
+
+# Тот же расчёт по витрине daily_room_occupancy: одна строка на номер и дату,
+# таблицы бронирований при этом не читаются
+def _query_room_nights_from_facts(db: Session, start: date, end: date, group_by: str, hotel_id: int = None):
+    facts = models.DailyRoomOccupancy
+    if group_by == "room_type":
+        bucket = [models.RoomType.type_id, models.RoomType.name]
+    elif group_by == "floor":
+        bucket = [facts.floor]
+    else:
+        bucket = _bucket_columns(group_by, facts.day)
+
+    query = db.query(
+        *bucket,
+        func.count().label("available"),
+        func.count(facts.booking_id).label("sold"),
+        func.coalesce(func.sum(facts.revenue), 0).label("revenue"),
+    ).select_from(facts).filter(facts.day.between(start, end))
+
+    if group_by == "room_type":
+        query = query.join(models.RoomType, models.RoomType.type_id == facts.type_id)
+    if hotel_id is not None:
+        query = query.filter(facts.hotel_id == hotel_id)
+
+    return query.group_by(*bucket).order_by(*bucket).all()
+
+# Витрина используется, если она покрывает весь запрошенный период
+def _facts_cover(db: Session, start: date, end: date):
+    state = etl.get_state(db)
+    return state is not None and state.facts_start <= start and end <= state.facts_end
+
+# Даты периода, изменённые после последнего обновления витрины (отметки etl_dirty_ranges
+# ещё не обработаны): витрина по ним устарела, и период считается по бронированиям
+def _facts_dirty(db: Session, start: date, end: date):
+    dirty = models.EtlDirtyRange
+    return db.query(dirty.id).filter(
+        dirty.source != "cleaning",
+        dirty.start_date <= end,
+        (dirty.end_date.is_(None)) | (dirty.end_date >= start)
+    ).first() is not None
+
+def _make_stat(key, label, available, sold, revenue):
+    revenue = float(revenue or 0)
+    return {
+        "key": key,
+        "label": label,
+        "available_room_nights": available,
+        "sold_room_nights": sold,
+        "revenue": round(revenue, 2),
+        # Заполняемость в процентах
+        "occupancy": round(sold * 100.0 / available, 2) if available else 0.0,
+        # ADR - средняя цена проданной номеро-ночи
+        "adr": round(revenue / sold, 2) if sold else 0.0,
+        # RevPAR - выручка на доступную номеро-ночь
+        "revpar": round(revenue / available, 2) if available else 0.0,
+    }
+
+def get_room_night_stats(db: Session, start: date, end: date, group_by: str = "day", hotel_id: int = None):
+    # Периоды, которые уже закончились, берём из кеша
+    closed = end < date.today()
+    cache_key = (start, end, group_by, hotel_id)
+    if closed:
+        with _cache_lock:
+            cached = _closed_period_cache.get(cache_key)
+            if cached is not None:
+                _closed_period_cache.move_to_end(cache_key)
+                return cached
+
+    stats = _query_room_nights(db, start, end, group_by, hotel_id)
+
+    if closed:
+        with _cache_lock:
+            _closed_period_cache[cache_key] = stats
+            if len(_closed_period_cache) > CLOSED_PERIOD_CACHE_SIZE:
+                _closed_period_cache.popitem(last=False)
+    return stats
+
+# Статус завершённой уборки
+COMPLETED_CLEANING_STATUS = "Завершена"
+
+# Статистика уборок по витрине daily_cleaning_summary
+def get_cleaning_stats(db: Session, start: date, end: date, group_by: str = "day", hotel_id: int = None):
+    summary = models.DailyCleaningSummary
+    if group_by == "floor":
+        bucket = [summary.floor]
+    else:
+        bucket = _bucket_columns(group_by, summary.day)
+
+    query = db.query(
+        *bucket,
+        func.count().label("assigned"),
+        func.count(case((summary.status == COMPLETED_CLEANING_STATUS, 1))).label("completed"),
+    ).filter(summary.day.between(start, end))
+
+    if hotel_id is not None:
+        query = query.filter(summary.hotel_id == hotel_id)
+
+    stats = []
+    for row in query.group_by(*bucket).order_by(*bucket).all():
+        if group_by == "floor":
+            key, label = str(row[0]), f"Этаж {row[0]}"
+        else:
+            key = label = row[0].isoformat()
+        stats.append({
+            "key": key,
+            "label": label,
+            "assigned": row.assigned,
+            "completed": row.completed,
+            "completion": round(row.completed * 100.0 / row.assigned, 2) if row.assigned else 0.0,
+        })
+    return stats
\ No newline at end of file
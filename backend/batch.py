@@ -0,0 +1,185 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import select, update
+from datetime import date
+from fastapi import HTTPException
+import models
+import schemas
+import crud
+import etl
+import inventory
+import tenancy
+
+# Массовые изменения по спискам идентификаторов: смена статуса бронирований,
+# завершение уборок и изменение номеров. Каждая операция - одна транзакция:
+# строки блокируются одним SELECT ... FOR UPDATE, меняются одним UPDATE,
+# статусы затронутых номеров пересчитываются один раз в конце.
+# UPDATE идёт в обход ORM, поэтому то, что для одиночных изменений делают
+# обработчики событий сессии (учёт inventory, диапазоны ETL, версии записей,
+# гостиница бронирований), здесь выполняется явно. Время изменения
+# (updated_at) выставляет сам UPDATE.
+# Изменённые записи возвращаются уже в виде схем ответа: они собираются до
+# commit, чтобы не перечитывать каждую запись после него
+
+# Результаты по отдельным записям
+UPDATED = "updated"
+UNCHANGED = "unchanged"
+NOT_FOUND = "not_found"
+
+CLEANING_COMPLETED = "Завершена"
+
+def _item_results(ids, rows, changed_ids, key: str):
+    versions = {getattr(row, key): row.version for row in rows}
+    items = []
+    for item_id in ids:
+        if item_id not in versions:
+            items.append({"id": item_id, "result": NOT_FOUND, "version": None})
+        elif item_id in changed_ids:
+            items.append({"id": item_id, "result": UPDATED, "version": versions[item_id] + 1})
+        else:
+            items.append({"id": item_id, "result": UNCHANGED, "version": versions[item_id]})
+    return {"updated": len(changed_ids), "items": items}
+
+# Порядок идентификаторов из запроса без повторов
+def _unique(ids):
+    return list(dict.fromkeys(ids))
+
+# Смена статуса нескольких бронирований (например, выселение группы).
+# Возвращает результат по каждому бронированию, пары (изменённое бронирование,
+# гостиница) и номера, статус которых изменился
+def set_booking_statuses(db: Session, booking_ids, status: str):
+    ids = _unique(booking_ids)
+    rows = db.execute(
+        select(models.Booking.booking_id, models.Booking.room_id, models.Booking.check_in_date,
+               models.Booking.check_out_date, models.Booking.status, models.Booking.version)
+        .where(models.Booking.booking_id.in_(ids))
+        .order_by(models.Booking.booking_id)
+        .with_for_update()
+    ).all()
+    changed = [row for row in rows if row.status != status]
+    changed_ids = {row.booking_id for row in changed}
+    result = _item_results(ids, rows, changed_ids, "booking_id")
+    if not changed:
+        return result, [], []
+
+    db.execute(
+        update(models.Booking)
+        .where(models.Booking.booking_id.in_(changed_ids))
+        .values(status=status, version=models.Booking.version + 1)
+        .execution_options(synchronize_session=False)
+    )
+    inventory.apply_booking_changes(db, [
+        (
+            inventory.BookingState(row.room_id, row.check_in_date, row.check_out_date, inventory.is_active(row.status)),
+            inventory.BookingState(row.room_id, row.check_in_date, row.check_out_date, inventory.is_active(status)),
+        )
+        for row in changed
+    ])
+    etl.mark_dirty(
+        db, "booking",
+        min(row.check_in_date for row in changed),
+        max(row.check_out_date for row in changed)
+    )
+    changed_rooms = crud.refresh_room_statuses(db, {row.room_id for row in changed})
+
+    # Перечитывание бронирований сохраняет и новые статусы номеров (autoflush)
+    bookings = [(schemas.Booking.model_validate(db_booking), db_booking.hotel_id) for db_booking in db.scalars(
+        select(models.Booking)
+        .where(models.Booking.booking_id.in_(changed_ids))
+        .order_by(models.Booking.booking_id)
+        .execution_options(populate_existing=True)
+    )]
+    rooms = [schemas.Room.model_validate(room) for room in changed_rooms]
+    db.commit()
+    return result, bookings, rooms
+
+# Завершение нескольких уборок (например, всех уборок этажа или дня).
+# Возвращает результат по каждой записи и пары (изменённая запись, гостиница)
+def complete_cleaning_logs(db: Session, log_ids):
+    ids = _unique(log_ids)
+    rows = db.execute(
+        select(models.CleaningLog.log_id, models.CleaningLog.cleaning_date,
+               models.CleaningLog.status, models.CleaningLog.version)
+        .where(models.CleaningLog.log_id.in_(ids))
+        .order_by(models.CleaningLog.log_id)
+        .with_for_update()
+    ).all()
+    changed = [row for row in rows if row.status != CLEANING_COMPLETED]
+    changed_ids = {row.log_id for row in changed}
+    result = _item_results(ids, rows, changed_ids, "log_id")
+    if not changed:
+        return result, []
+
+    db.execute(
+        update(models.CleaningLog)
+        .where(models.CleaningLog.log_id.in_(changed_ids))
+        .values(status=CLEANING_COMPLETED, version=models.CleaningLog.version + 1)
+        .execution_options(synchronize_session=False)
+    )
+    etl.mark_dirty(
+        db, "cleaning",
+        min(row.cleaning_date for row in changed),
+        max(row.cleaning_date for row in changed)
+    )
+
+    logs = [(schemas.CleaningLog.model_validate(db_log), db_log.hotel_id) for db_log in db.scalars(
+        select(models.CleaningLog)
+        .where(models.CleaningLog.log_id.in_(changed_ids))
+        .order_by(models.CleaningLog.log_id)
+        .execution_options(populate_existing=True)
+    )]
+    db.commit()
+    return result, logs
+
+# Одинаковые изменения нескольких номеров (гостиница, тип, этаж).
+# changes - только переданные поля; статус номера меняется лишь автоматически
+def update_rooms(db: Session, room_ids, changes: dict):
+    # Пользователь гостиницы не может перенести номера в другую гостиницу
+    if "hotel_id" in changes:
+        tenancy.resolve_hotel_id(tenancy.current_hotel_id(db), changes["hotel_id"])
+    if "hotel_id" in changes and crud.get_hotel(db, changes["hotel_id"]) is None:
+        raise HTTPException(status_code=404, detail="Гостиница не найдена")
+    if "type_id" in changes and crud.get_room_type(db, changes["type_id"]) is None:
+        raise HTTPException(status_code=404, detail="Тип номера не найден")
+
+    ids = _unique(room_ids)
+    rows = db.execute(
+        select(models.Room.room_id, models.Room.hotel_id, models.Room.type_id,
+               models.Room.floor, models.Room.version)
+        .where(models.Room.room_id.in_(ids))
+        .order_by(models.Room.room_id)
+        .with_for_update()
+    ).all()
+    changed = [row for row in rows if any(getattr(row, field) != value for field, value in changes.items())]
+    changed_ids = {row.room_id for row in changed}
+    result = _item_results(ids, rows, changed_ids, "room_id")
+    if not changed:
+        return result, []
+
+    db.execute(
+        update(models.Room)
+        .where(models.Room.room_id.in_(changed_ids))
+        .values(**changes, version=models.Room.version + 1)
+        .execution_options(synchronize_session=False)
+    )
+    moved = []
+    for row in changed:
+        old_key = (row.hotel_id, row.type_id)
+        new_key = (changes.get("hotel_id", row.hotel_id), changes.get("type_id", row.type_id))
+        if old_key != new_key:
+            moved.append((row.room_id, old_key, new_key))
+    if moved:
+        inventory.apply_room_moves(db, moved)
+    if "hotel_id" in changes:
+        # Бронирования хранят гостиницу своего номера (см. tenancy.py)
+        tenancy.move_rooms(db, [row.room_id for row in changed if row.hotel_id != changes["hotel_id"]], changes["hotel_id"])
+    # Изменение номерного фонда влияет на витрину с сегодняшнего дня
+    etl.mark_dirty(db, "room", date.today())
+
+    rooms = [schemas.Room.model_validate(room) for room in db.scalars(
+        select(models.Room)
+        .where(models.Room.room_id.in_(changed_ids))
+        .order_by(models.Room.room_id)
+        .execution_options(populate_existing=True)
+    )]
+    db.commit()
+    return result, rooms
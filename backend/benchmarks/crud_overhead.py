@@ -0,0 +1,80 @@
+import os
+import sys
+import timeit
+from datetime import date, timedelta
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import models
+import crud
+
+# Накладные расходы Python на вызов частых функций crud.py: прежний вариант
+# (новая цепочка db.query(...).filter(...) при каждом вызове) и текущий
+# (Session.get и запросы, собранные при импорте). База - SQLite в памяти,
+# поэтому время почти целиком уходит на построение и компиляцию запросов.
+# Запуск: python benchmarks/crud_overhead.py [число вызовов]
+
+def old_get_room(db, room_id):
+    return db.query(models.Room).filter(models.Room.room_id == room_id).first()
+
+def old_find_conflict(db, room_id, start, end):
+    return db.query(models.Booking).filter(
+        models.Booking.room_id == room_id,
+        crud.booking_overlaps(start, end),
+        models.Booking.status.notin_(crud.INACTIVE_BOOKING_STATUSES)
+    ).first()
+
+def setup():
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    tables = [models.Hotel.__table__, models.RoomType.__table__, models.Room.__table__,
+              models.Client.__table__, models.Booking.__table__]
+    # SQLite не поддерживает автоинкремент в составном ключе секционированной
+    # таблицы bookings; идентификаторы ниже задаются явно
+    models.Booking.__table__.c.booking_id.autoincrement = False
+    models.Base.metadata.create_all(engine, tables=tables)
+    db = sessionmaker(bind=engine)()
+    db.add(models.Hotel(hotel_id=1, name="Гостиница"))
+    db.add(models.RoomType(type_id=1, name="Стандарт", capacity=2, price_per_night=3500))
+    db.add_all(models.Room(room_id=i, hotel_id=1, type_id=1, floor=1, room_number=str(i)) for i in range(1, 101))
+    db.add(models.Client(client_id=1, first_name="Иван", last_name="Иванов"))
+    db.add_all(
+        models.Booking(booking_id=i, room_id=i, client_id=1, check_in_date=date(2026, 1, 1),
+                       check_out_date=date(2026, 1, 5), status="Подтверждено")
+        for i in range(1, 101)
+    )
+    db.commit()
+    return db
+
+def run(label, func, number):
+    seconds = min(timeit.repeat(func, number=number, repeat=5))
+    print(f"  {label:<42} {seconds / number * 1e6:7.1f} мкс/вызов")
+
+def main(number: int):
+    db = setup()
+    start, end = date(2026, 1, 3), date(2026, 1, 4)
+
+    print("get_room, объект ещё не загружен в сессию")
+    def cold(func):
+        def call():
+            db.expunge_all()
+            func(db, 42)
+        return call
+    run("до: db.query(...).filter(...).first()", cold(old_get_room), number)
+    run("после: Session.get", cold(crud.get_room), number)
+
+    print("get_room, объект уже в сессии (повторное обращение)")
+    db.expunge_all()
+    # Сессия хранит объекты по слабым ссылкам, поэтому загруженный номер удерживается
+    room = crud.get_room(db, 42)
+    run("до: db.query(...).filter(...).first()", lambda: old_get_room(db, 42), number)
+    run("после: Session.get", lambda: crud.get_room(db, 42), number)
+
+    print("проверка пересечения бронирований")
+    run("до: db.query(Booking).filter(...).first()", lambda: old_find_conflict(db, 42, start, end), number)
+    run("после: find_booking_conflict", lambda: crud.find_booking_conflict(db, 42, start, end), number)
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -0,0 +1,89 @@
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import time
+
+import httpx
+from fastapi import FastAPI
+from fastapi.middleware.cors import CORSMiddleware
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import middleware
+
+# Накладные расходы мидлваров на запрос: одно и то же приложение без мидлваров,
+# с прежней связкой CORSMiddleware + @app.middleware("http") и с HTTPMiddleware.
+# Запросы подаются в ASGI-приложение через httpx, без сети и базы данных.
+# Запуск (нужен httpx: pip install httpx): python benchmarks/middleware_overhead.py [число запросов]
+
+ROOM_TYPES = [
+    {"type_id": i, "name": f"Тип {i}", "capacity": 2, "price_per_night": 3500.0}
+    for i in range(1, 13)
+]
+
+def build_app(stack: str):
+    app = FastAPI()
+
+    @app.get("/")
+    def read_root():
+        return {"message": "Добро пожаловать в API системы администрирования гостиниц"}
+
+    @app.get("/room-types/")
+    def read_room_types():
+        return ROOM_TYPES
+
+    if stack == "legacy":
+        app.add_middleware(
+            CORSMiddleware,
+            allow_origins=["*"],
+            allow_credentials=False,
+            allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS", "PATCH"],
+            allow_headers=["*"],
+            expose_headers=["Content-Length", "Access-Control-Allow-Origin", "ETag"],
+            max_age=600,
+        )
+
+        @app.middleware("http")
+        async def add_cors_headers(request, call_next):
+            response = await call_next(request)
+            response.headers["Access-Control-Allow-Origin"] = "*"
+            response.headers["Access-Control-Allow-Methods"] = "GET, POST, PUT, DELETE, OPTIONS, PATCH"
+            response.headers["Access-Control-Allow-Headers"] = "*"
+            return response
+    elif stack == "asgi":
+        app.add_middleware(middleware.HTTPMiddleware)
+    return app
+
+# Модули приложения включают логирование INFO, а httpx пишет строку на каждый запрос
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+HEADERS = {"Origin": "http://localhost:3000", "Accept-Encoding": "gzip"}
+
+async def measure(app, path: str, count: int) -> float:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://localhost") as client:
+        # Прогрев: первый запрос собирает стек мидлваров
+        for _ in range(50):
+            await client.get(path, headers=HEADERS)
+        started = time.perf_counter()
+        for _ in range(count):
+            await client.get(path, headers=HEADERS)
+    return (time.perf_counter() - started) / count * 1e6
+
+async def main(count: int):
+    apps = {stack: build_app(stack) for stack in ("bare", "legacy", "asgi")}
+    for path in ("/", "/room-types/"):
+        # Замеры чередуются, чтобы фоновая нагрузка распределялась между вариантами поровну
+        samples = {stack: [] for stack in apps}
+        for _ in range(5):
+            for stack, app in apps.items():
+                samples[stack].append(await measure(app, path, count))
+        results = {stack: statistics.median(values) for stack, values in samples.items()}
+        print(f"{path}")
+        for stack, micros in results.items():
+            overhead = micros - results["bare"]
+            print(f"  {stack:<7} {micros:8.1f} мкс/запрос  (мидлвары: {overhead:+.1f} мкс)")
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 300))
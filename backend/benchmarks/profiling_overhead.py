@@ -0,0 +1,45 @@
+import asyncio
+import os
+import statistics
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import profiling
+from middleware_overhead import build_app, measure
+
+# Стоимость выключенного профилирования: запрос без заголовка X-Profile
+# через ProfilingMiddleware и обработчики SQL-событий вне профиля.
+# Запуск (нужен httpx: pip install httpx): python benchmarks/profiling_overhead.py [число запросов]
+
+def build_profiled_app():
+    app = build_app("asgi")
+    app.add_middleware(profiling.ProfilingMiddleware, sample_rate=0)
+    return app
+
+async def main(count: int):
+    apps = {"без профилирования": build_app("asgi"), "выключено": build_profiled_app()}
+    for path in ("/", "/room-types/"):
+        samples = {name: [] for name in apps}
+        for _ in range(5):
+            for name, app in apps.items():
+                samples[name].append(await measure(app, path, count))
+        results = {name: statistics.median(values) for name, values in samples.items()}
+        base = results["без профилирования"]
+        print(path)
+        for name, micros in results.items():
+            print(f"  {name:<20} {micros:8.1f} мкс/запрос  ({micros - base:+.1f} мкс)")
+
+    # Обработчики before/after_cursor_execute на каждый SQL-запрос
+    number = 1000000
+    seconds = timeit.timeit(
+        lambda: (
+            profiling._before_cursor_execute(None, None, "", None, None, False),
+            profiling._after_cursor_execute(None, None, "", None, None, False),
+        ),
+        number=number
+    )
+    print(f"SQL-события вне профиля: {seconds / number * 1e9:.0f} нс/запрос")
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 300))
@@ -0,0 +1,105 @@
+from sqlalchemy.orm import Session
+from sqlalchemy.engine import Engine
+from sqlalchemy import event
+from fastapi import HTTPException, Request, status
+import logging
+import os
+import admission
+import metrics
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Бюджеты запросов к БД по классам запросов (см. admission.py): время одного
+# SQL-запроса и число строк, которое можно запросить параметром limit.
+# Время задаётся в PostgreSQL через SET LOCAL statement_timeout в начале каждой
+# транзакции сессии запроса: запрос, превысивший бюджет, отменяет сам сервер
+# БД, соединение освобождается, а клиент получает 503 вместо зависшего ответа.
+# limit больше бюджета отклоняется с 422 ещё до обращения к БД.
+# Фоновые задачи, выгрузки и служебные сессии бюджетов не имеют
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.getenv(name, str(default)))
+
+# Бюджеты по классам: время SQL-запроса (мс, 0 - без ограничения), наибольший limit
+QUERY_BUDGETS = {
+    admission.WRITE: (_env_int("QUERY_WRITE_TIMEOUT_MS", 5000), _env_int("QUERY_WRITE_MAX_ROWS", 1000)),
+    admission.READ: (_env_int("QUERY_READ_TIMEOUT_MS", 3000), _env_int("QUERY_READ_MAX_ROWS", 1000)),
+    admission.BULK: (_env_int("QUERY_BULK_TIMEOUT_MS", 30000), _env_int("QUERY_BULK_MAX_ROWS", 10000)),
+}
+
+# Через сколько секунд клиенту предлагается повторить запрос после отмены
+QUERY_TIMEOUT_RETRY_AFTER = 5
+
+# Ключ бюджета в Session.info и в Connection.info: (класс, маршрут, время)
+BUDGET_KEY = "query_budget"
+
+# Код ошибки PostgreSQL query_canceled (в том числе по statement_timeout)
+QUERY_CANCELED = "57014"
+
+timeouts_counter = metrics.counter(
+    "inncontrol_query_timeouts_total",
+    "SQL-запросы, отменённые по истечении бюджета времени, по классам и маршрутам",
+    ("request_class", "route")
+)
+
+# Бюджет класса запроса: (время в мс, наибольший limit) или None
+def budget_for(request: Request):
+    request_class = admission.classify(request.scope)
+    if request_class is None:
+        return None, None
+    return request_class, QUERY_BUDGETS[request_class]
+
+# Применение бюджета к сессии запроса (вызывается в зависимостях get_db и др.)
+def apply(db: Session, request: Request):
+    request_class, budget = budget_for(request)
+    if budget is None:
+        return db
+    timeout_ms, max_rows = budget
+    limit = request.query_params.get("limit")
+    if limit is not None and limit.lstrip("-").isdigit() and int(limit) > max_rows:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"Параметр limit не может быть больше {max_rows}"
+        )
+    route = request.scope.get("route")
+    request.state.query_budget = (request_class, timeout_ms)
+    db.info[BUDGET_KEY] = (request_class, route.path if route is not None else request.url.path, timeout_ms)
+    return db
+
+# Перенос бюджета в другую сессию того же запроса (например, для потоковой выдачи)
+def copy_budget(source: Session, target: Session):
+    if BUDGET_KEY in source.info:
+        target.info[BUDGET_KEY] = source.info[BUDGET_KEY]
+    return target
+
+@event.listens_for(Session, "after_begin")
+def set_statement_timeout(session, transaction, connection):
+    budget = session.info.get(BUDGET_KEY)
+    # Соединение возвращается в пул: бюджет предыдущей сессии не должен остаться в нём
+    connection.info[BUDGET_KEY] = budget
+    if budget is None or not budget[2] or connection.dialect.name != "postgresql":
+        return
+    # SET LOCAL действует до конца транзакции и не переходит к следующему владельцу соединения
+    connection.exec_driver_sql(f"SET LOCAL statement_timeout = {int(budget[2])}")
+
+def is_timeout(exc) -> bool:
+    orig = getattr(exc, "orig", exc)
+    return getattr(orig, "pgcode", None) == QUERY_CANCELED
+
+# Учёт отменённых запросов в одном месте: и для ответов, и для потоковой выдачи
+@event.listens_for(Engine, "handle_error")
+def count_timeout(context):
+    if not is_timeout(context.original_exception):
+        return
+    budget = context.connection.info.get(BUDGET_KEY) if context.connection is not None else None
+    request_class, route = (budget[0], budget[1]) if budget else ("none", "")
+    timeouts_counter.inc(request_class=request_class, route=route)
+    logger.warning(f"Запрос к БД отменён по бюджету времени: {request_class} {route}")
+
+def timeout_detail(request: Request) -> str:
+    budget = getattr(request.state, "query_budget", None)
+    if budget is None:
+        return "Запрос к базе данных выполнялся слишком долго. Повторите попытку позже"
+    return f"Запрос к базе данных превысил лимит времени ({budget[1]} мс). Сузьте выборку или повторите попытку позже"
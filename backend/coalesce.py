@@ -0,0 +1,145 @@
+from collections import OrderedDict
+import asyncio
+import os
+import time
+import metrics
+
+# Объединение одинаковых одновременных GET-запросов (single-flight). Первый
+# запрос (ведущий) выполняется как обычно, а такие же запросы, пришедшие до его
+# завершения, ждут и получают копию того же ответа: один запрос к БД и одна
+# сериализация на всех. Дополнительно ответ можно хранить COALESCE_TTL_MS
+# миллисекунд (микро-кеш). Ключ - путь, параметры и клиент (Authorization),
+# а также заголовки, влияющие на ответ
+
+# Время жизни ответа в микро-кеше (0 - только объединение одновременных запросов)
+COALESCE_TTL_MS = float(os.getenv("COALESCE_TTL_MS", "0"))
+
+# Ответы больше этого размера не копируются: ожидающие выполняют запрос сами
+COALESCE_MAX_BYTES = int(os.getenv("COALESCE_MAX_BYTES", str(2 * 1024 * 1024)))
+
+COALESCE_CACHE_SIZE = 256
+
+# Долгоживущая лента событий, служебные и отладочные эндпоинты не объединяются
+EXEMPT_PREFIXES = ("/events", "/metrics", "/debug", "/docs", "/redoc", "/openapi.json")
+
+# Заголовки, от которых зависит ответ
+KEY_HEADERS = (b"authorization", b"accept", b"x-read-primary", b"x-last-write", b"range", b"if-range")
+
+requests_counter = metrics.counter(
+    "inncontrol_coalesce_requests_total",
+    "GET-запросы по результату: leader - выполнен, follower - получил ответ ведущего, "
+    "cache - из микро-кеша, bypass - без объединения",
+    ("result",)
+)
+ratio_gauge = metrics.gauge(
+    "inncontrol_coalesce_ratio", "Доля GET-запросов, обслуженных без обращения к приложению"
+)
+
+class _Flight:
+    def __init__(self):
+        self.messages = []
+        self.size = 0
+        self.complete = False
+        self.overflow = False
+        self.done = asyncio.Event()
+
+class CoalescingMiddleware:
+    def __init__(self, app, ttl_ms: float = COALESCE_TTL_MS, max_bytes: int = COALESCE_MAX_BYTES):
+        self.app = app
+        self.ttl = ttl_ms / 1000
+        self.max_bytes = max_bytes
+        self._flights = {}
+        self._cache = OrderedDict()
+        # Номер поколения меняется после каждого изменяющего запроса: запросы,
+        # пришедшие после изменения, не получают ответ, начатый до него
+        self._generation = 0
+        self._served = 0
+        self._shared = 0
+
+    def _count(self, result: str):
+        requests_counter.inc(result=result)
+        if result == "bypass":
+            return
+        self._served += 1
+        if result in ("follower", "cache"):
+            self._shared += 1
+        ratio_gauge.set(round(self._shared / self._served, 4))
+
+    def _key(self, scope):
+        headers = tuple(
+            (name, value) for name, value in scope["headers"] if name in KEY_HEADERS
+        )
+        return (self._generation, scope["method"], scope["path"], scope.get("query_string", b""), tuple(sorted(headers)))
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        if method not in ("GET", "HEAD"):
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                if method != "OPTIONS":
+                    self._generation += 1
+                    self._cache.clear()
+            return
+
+        if scope["path"].startswith(EXEMPT_PREFIXES) or any(name == b"x-profile" for name, _ in scope["headers"]):
+            self._count("bypass")
+            await self.app(scope, receive, send)
+            return
+
+        key = self._key(scope)
+
+        cached = self._cache.get(key)
+        if cached is not None:
+            expires, messages = cached
+            if expires > time.monotonic():
+                self._count("cache")
+                await self._replay(messages, send)
+                return
+            del self._cache[key]
+
+        flight = self._flights.get(key)
+        if flight is not None:
+            await flight.done.wait()
+            if flight.complete:
+                self._count("follower")
+                await self._replay(flight.messages, send)
+            else:
+                # Ведущий запрос завершился ошибкой или ответ слишком большой
+                self._count("bypass")
+                await self.app(scope, receive, send)
+            return
+
+        flight = _Flight()
+        self._flights[key] = flight
+        self._count("leader")
+
+        async def send_wrapper(message):
+            if not flight.overflow:
+                flight.size += len(message.get("body", b""))
+                if flight.size > self.max_bytes:
+                    flight.overflow = True
+                    flight.messages = []
+                else:
+                    flight.messages.append(message)
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                flight.complete = not flight.overflow
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            del self._flights[key]
+            flight.done.set()
+            if flight.complete and self.ttl > 0 and flight.messages[0].get("status") == 200:
+                self._cache[key] = (time.monotonic() + self.ttl, flight.messages)
+                if len(self._cache) > COALESCE_CACHE_SIZE:
+                    self._cache.popitem(last=False)
+
+    async def _replay(self, messages, send):
+        for message in messages:
+            await send(message)
@@ -1,6 +1,8 @@
 from sqlalchemy.orm import Session, joinedload
-import models, schemas
-from datetime import date, datetime
+from sqlalchemy import and_, func, case, select, bindparam, text
+import models, schemas, pricing, tenancy, etl
+from datetime import date, datetime, timedelta
+import heapq
 from fastapi import HTTPException, status
 from passlib.context import CryptContext
 
@@ -23,9 +25,81 @@ def get_db():
     finally:
         db.close()
 
-# Функции для работы с гостиницами
+# Максимальная длительность проживания в одном бронировании (в днях)
+MAX_STAY_DAYS = 365
+
+# Статус отменённого бронирования: такое бронирование не занимает номер
+# и не приносит выручку (в том числе в аналитике, витринах и отчётах)
+CANCELLED_BOOKING_STATUS = "Отменено"
+
+# Статусы бронирований, которые не занимают номер
+INACTIVE_BOOKING_STATUSES = [CANCELLED_BOOKING_STATUS, "Выселен"]
+
+# Условие пересечения бронирования с периодом. Нижняя граница по дате заезда
+# следует из ограничения длительности и позволяет PostgreSQL читать только
+# нужные секции таблицы bookings
+def booking_overlaps(start: date, end: date):
+    return and_(
+        models.Booking.check_in_date <= end,
+        models.Booking.check_out_date >= start,
+        models.Booking.check_in_date >= start - timedelta(days=MAX_STAY_DAYS)
+    )
+
+# То же условие с именованными параметрами для запросов, собранных заранее (см. ниже).
+# Значения передаются через overlap_params
+def booking_overlaps_bound():
+    return and_(
+        models.Booking.check_in_date <= bindparam("end"),
+        models.Booking.check_out_date >= bindparam("start"),
+        models.Booking.check_in_date >= bindparam("earliest_check_in")
+    )
+
+def overlap_params(start: date, end: date) -> dict:
+    return {"start": start, "end": end, "earliest_check_in": start - timedelta(days=MAX_STAY_DAYS)}
+
+# Самые частые проверки бронирований собраны один раз при импорте модуля:
+# при вызове не строится новое выражение, а скомпилированный SQL берётся из кеша
+# SQLAlchemy. Пересекающееся активное бронирование номера; exclude_booking_id
+# исключает изменяемое бронирование (0 - ничего не исключать)
+_ROOM_CONFLICT = select(models.Booking.booking_id).where(
+    models.Booking.room_id == bindparam("room_id"),
+    models.Booking.booking_id != bindparam("exclude_booking_id"),
+    booking_overlaps_bound(),
+    models.Booking.status.notin_(INACTIVE_BOOKING_STATUSES)
+).limit(1)
+
+# Другое действующее бронирование номера (при удалении бронирований клиента)
+_OTHER_ACTIVE_BOOKING = select(models.Booking.booking_id).where(
+    models.Booking.room_id == bindparam("room_id"),
+    models.Booking.booking_id != bindparam("booking_id"),
+    models.Booking.status.in_(["Активно", "Подтверждено"])
+).limit(1)
+
+# Бронирование клиента в другой гостинице. Запрос текстовый, поэтому условие
+# по гостинице пользователя (см. tenancy.py) к нему не добавляется
+_CLIENT_BOOKING_ELSEWHERE = text(
+    "SELECT 1 FROM bookings WHERE client_id = :client_id AND hotel_id IS DISTINCT FROM :hotel_id LIMIT 1"
+)
+
+# Идентификатор бронирования номера, пересекающегося с периодом, или None
+def find_booking_conflict(db: Session, room_id: int, start: date, end: date, exclude_booking_id: int = None):
+    return db.execute(_ROOM_CONFLICT, {
+        "room_id": room_id,
+        "exclude_booking_id": exclude_booking_id or 0,
+        **overlap_params(start, end)
+    }).scalar()
+
+def check_stay_length(check_in_date: date, check_out_date: date):
+    if (check_out_date - check_in_date).days > MAX_STAY_DAYS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Длительность проживания не может превышать {MAX_STAY_DAYS} дней"
+        )
+
+# Функции для работы с гостиницами. Поиск по первичному ключу идёт через
+# Session.get: уже загруженный в сессии объект возвращается без запроса к БД
 def get_hotel(db: Session, hotel_id: int):
-    return db.query(models.Hotel).filter(models.Hotel.hotel_id == hotel_id).first()
+    return db.get(models.Hotel, hotel_id)
 
 def get_hotels(db: Session, skip: int = 0, limit: int = 100):
     return db.query(models.Hotel).offset(skip).limit(limit).all()
@@ -39,7 +113,7 @@ def create_hotel(db: Session, hotel: schemas.HotelCreate):
 
 # Функции для работы с типами номеров
 def get_room_type(db: Session, type_id: int):
-    return db.query(models.RoomType).filter(models.RoomType.type_id == type_id).first()
+    return db.get(models.RoomType, type_id)
 
 def get_room_types(db: Session, skip: int = 0, limit: int = 100):
     return db.query(models.RoomType).offset(skip).limit(limit).all()
@@ -51,9 +125,72 @@ def create_room_type(db: Session, room_type: schemas.RoomTypeCreate):
     db.refresh(db_room_type)
     return db_room_type
 
+# Функции для работы с ценами типов номеров на даты
+def get_room_rates(db: Session, type_id: int, start: date, end: date):
+    return db.query(models.RoomRate).filter(
+        models.RoomRate.type_id == type_id,
+        models.RoomRate.rate_date.between(start, end)
+    ).order_by(models.RoomRate.rate_date).all()
+
+def set_room_rates(db: Session, type_id: int, rates):
+    db_rates = [
+        db.merge(models.RoomRate(type_id=type_id, rate_date=rate.rate_date, price=rate.price))
+        for rate in rates
+    ]
+    # Цена ночи входит в выручку витрин и аналитики: даты пересчитываются при обновлении витрин
+    if db_rates:
+        dates = [db_rate.rate_date for db_rate in db_rates]
+        etl.mark_dirty(db, "booking", min(dates), max(dates))
+    db.commit()
+    pricing.invalidate(type_id)
+    return db_rates
+
+def delete_room_rate(db: Session, type_id: int, rate_date: date):
+    db_rate = db.get(models.RoomRate, (type_id, rate_date))
+    if not db_rate:
+        raise HTTPException(status_code=404, detail="Цена на эту дату не задана")
+    db.delete(db_rate)
+    etl.mark_dirty(db, "booking", rate_date, rate_date)
+    db.commit()
+    pricing.invalidate(type_id)
+    return db_rate
+
+# Стоимость нескольких вариантов проживания: календари цен нужных типов
+# строятся (или берутся из кеша) один раз, каждый вариант считается за O(1)
+def quote_stays(db: Session, stays):
+    periods = {}
+    for stay in stays:
+        if stay.check_out_date <= stay.check_in_date:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Дата выезда должна быть позже даты заезда"
+            )
+        check_stay_length(stay.check_in_date, stay.check_out_date)
+        first_day, last_day = periods.get(stay.type_id, (stay.check_in_date, stay.check_out_date))
+        periods[stay.type_id] = (min(first_day, stay.check_in_date), max(last_day, stay.check_out_date))
+
+    calendars = pricing.get_calendars(db, periods)
+    missing = sorted(set(periods) - set(calendars))
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Тип номера не найден: {missing[0]}")
+
+    quotes = []
+    for stay in stays:
+        nights = (stay.check_out_date - stay.check_in_date).days
+        total = calendars[stay.type_id].total(stay.check_in_date, stay.check_out_date)
+        quotes.append({
+            "type_id": stay.type_id,
+            "check_in_date": stay.check_in_date,
+            "check_out_date": stay.check_out_date,
+            "nights": nights,
+            "total": total,
+            "average_per_night": round(total / nights, 2),
+        })
+    return quotes
+
 # Функции для работы с номерами
 def get_room(db: Session, room_id: int):
-    return db.query(models.Room).filter(models.Room.room_id == room_id).first()
+    return db.get(models.Room, room_id)
 
 def get_rooms(db: Session, skip: int = 0, limit: int = 100):
     return db.query(models.Room).offset(skip).limit(limit).all()
@@ -67,8 +204,7 @@ def get_rooms_by_type(db: Session, type_id: int):
 def get_available_rooms(db: Session, check_in_date: date, check_out_date: date):
     # Получаем идентификаторы комнат, которые заняты в указанный период
     booked_room_ids = db.query(models.Booking.room_id).filter(
-        (models.Booking.check_in_date <= check_out_date) & 
-        (models.Booking.check_out_date >= check_in_date)
+        booking_overlaps(check_in_date, check_out_date)
     ).all()
     
     # Преобразуем список кортежей в плоский список
@@ -98,7 +234,7 @@ def update_room_status(db: Session, room_id: int, status: str):
 
 # Функции для работы с клиентами
 def get_client(db: Session, client_id: int):
-    return db.query(models.Client).filter(models.Client.client_id == client_id).first()
+    return db.get(models.Client, client_id)
 
 def get_clients(db: Session, skip: int = 0, limit: int = 100):
     return db.query(models.Client).offset(skip).limit(limit).all()
@@ -113,9 +249,55 @@ def create_client(db: Session, client: schemas.ClientCreate):
     db.refresh(db_client)
     return db_client
 
+# Удаление клиента вместе со всеми бронированиями.
+# progress - необязательная функция (done, total) для фоновой задачи
+def delete_client(db: Session, client_id: int, progress=None):
+    db_client = get_client(db, client_id)
+    if not db_client:
+        raise HTTPException(status_code=404, detail="Клиент не найден")
+    
+    # Пользователь гостиницы видит только её бронирования: клиента с бронированиями
+    # в других гостиницах удаляет администратор сети
+    hotel_id = tenancy.current_hotel_id(db)
+    if hotel_id is not None and db.execute(
+        _CLIENT_BOOKING_ELSEWHERE, {"client_id": client_id, "hotel_id": hotel_id}
+    ).first():
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="У клиента есть бронирования в других гостиницах"
+        )
+    
+    # Получаем все бронирования клиента
+    client_bookings = db.query(models.Booking).filter(models.Booking.client_id == client_id).all()
+    
+    # Удаляем все бронирования клиента
+    for index, booking in enumerate(client_bookings):
+        # Если номер был занят этим бронированием, обновляем его статус
+        room = get_room(db, room_id=booking.room_id)
+        if room and room.status == "Занят":
+            # Проверяем, есть ли другие активные бронирования для этого номера
+            other_bookings = db.execute(_OTHER_ACTIVE_BOOKING, {
+                "room_id": booking.room_id, "booking_id": booking.booking_id
+            }).scalar()
+            
+            if not other_bookings:
+                room.status = "Свободен"
+        
+        # Удаляем бронирование
+        db.delete(booking)
+        
+        if progress is not None:
+            progress(index + 1, len(client_bookings))
+    
+    # Удаляем клиента
+    db.delete(db_client)
+    db.commit()
+    
+    return db_client
+
 # Функции для работы с бронированиями
 def get_booking(db: Session, booking_id: int):
-    return db.query(models.Booking).filter(models.Booking.booking_id == booking_id).first()
+    return db.get(models.Booking, booking_id)
 
 def get_bookings(db: Session, skip: int = 0, limit: int = 100):
     return db.query(models.Booking).offset(skip).limit(limit).all()
@@ -127,21 +309,21 @@ def get_bookings_by_room(db: Session, room_id: int, skip: int = 0, limit: int =
     return db.query(models.Booking).filter(models.Booking.room_id == room_id).offset(skip).limit(limit).all()
 
 def create_booking(db: Session, booking: schemas.BookingCreate):
-    # Проверяем, доступен ли номер в указанные даты
-    conflicts = db.query(models.Booking).filter(
-        models.Booking.room_id == booking.room_id,
-        models.Booking.check_in_date <= booking.check_out_date,
-        models.Booking.check_out_date >= booking.check_in_date,
-        models.Booking.status.notin_(["Отменено", "Выселен"])
-    ).first()
+    check_stay_length(booking.check_in_date, booking.check_out_date)
+    
+    # Блокируем номер до конца транзакции, чтобы параллельный подбор номеров
+    # (allocate_rooms) не занял его одновременно
+    db.get(models.Room, booking.room_id, with_for_update=True)
     
-    if conflicts:
+    # Проверяем, доступен ли номер в указанные даты
+    if find_booking_conflict(db, booking.room_id, booking.check_in_date, booking.check_out_date):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Номер уже забронирован на указанные даты"
         )
     
     db_booking = models.Booking(**booking.dict())
+    db_booking.total_price = pricing.booking_total(db, booking.room_id, booking.check_in_date, booking.check_out_date)
     db.add(db_booking)
     db.commit()
     db.refresh(db_booking)
@@ -151,6 +333,117 @@ def create_booking(db: Session, booking: schemas.BookingCreate):
     
     return db_booking
 
+# Сколько дней до и после проживания учитывается при оценке свободного окна номера.
+# Более длинные окна считаются одинаково свободными
+ALLOCATION_HORIZON_DAYS = 60
+
+# Автоматический подбор номеров (best fit). Для каждого подходящего номера находим
+# свободное окно вокруг запрошенных дат и выбираем номера с самыми короткими окнами,
+# в которые помещается проживание. Так заполняются промежутки между бронированиями,
+# а длинные свободные периоды остаются для длительных проживаний.
+# Всё выполняется в одной транзакции: номера блокируются, бронирования вставляются пачкой
+def allocate_rooms(db: Session, allocation: schemas.BookingAllocationRequest):
+    check_in = allocation.check_in_date
+    check_out = allocation.check_out_date
+    if check_out <= check_in:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Дата выезда должна быть позже даты заезда"
+        )
+    check_stay_length(check_in, check_out)
+    if allocation.type_id is None and allocation.capacity is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Укажите тип номера или требуемую вместимость"
+        )
+    if not get_client(db, allocation.client_id):
+        raise HTTPException(status_code=404, detail="Указанный клиент не найден")
+
+    rooms_query = db.query(models.Room)
+    if allocation.type_id is not None:
+        rooms_query = rooms_query.filter(models.Room.type_id == allocation.type_id)
+    if allocation.capacity is not None:
+        rooms_query = rooms_query.join(
+            models.RoomType, models.RoomType.type_id == models.Room.type_id
+        ).filter(models.RoomType.capacity >= allocation.capacity)
+    if allocation.hotel_id is not None:
+        rooms_query = rooms_query.filter(models.Room.hotel_id == allocation.hotel_id)
+
+    # Номера блокируются до конца транзакции. Номера, которые в этот момент
+    # подбирает другой запрос, пропускаются без ожидания и повторных попыток
+    rooms = rooms_query.order_by(models.Room.room_id).with_for_update(
+        skip_locked=True, of=models.Room
+    ).all()
+    rooms_by_id = {room.room_id: room for room in rooms}
+
+    # Бронирования подходящих номеров в окрестности запрошенных дат (одним запросом)
+    free_before = {room_id: ALLOCATION_HORIZON_DAYS for room_id in rooms_by_id}
+    free_after = dict(free_before)
+    busy = set()
+    if rooms_by_id:
+        nearby = db.query(
+            models.Booking.room_id, models.Booking.check_in_date, models.Booking.check_out_date
+        ).filter(
+            models.Booking.room_id.in_(list(rooms_by_id)),
+            booking_overlaps(
+                check_in - timedelta(days=ALLOCATION_HORIZON_DAYS),
+                check_out + timedelta(days=ALLOCATION_HORIZON_DAYS)
+            ),
+            models.Booking.status.notin_(INACTIVE_BOOKING_STATUSES)
+        ).all()
+        for room_id, start, end in nearby:
+            if start <= check_out and end >= check_in:
+                busy.add(room_id)
+            elif end < check_in:
+                free_before[room_id] = min(free_before[room_id], (check_in - end).days)
+            else:
+                free_after[room_id] = min(free_after[room_id], (start - check_out).days)
+
+    # Лучшие номера: сначала самое короткое свободное окно, затем номер,
+    # примыкающий к соседнему бронированию вплотную
+    candidates = [room_id for room_id in rooms_by_id if room_id not in busy]
+    chosen = heapq.nsmallest(allocation.quantity, candidates, key=lambda room_id: (
+        free_before[room_id] + free_after[room_id],
+        min(free_before[room_id], free_after[room_id]),
+        room_id
+    ))
+    if len(chosen) < allocation.quantity:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Недостаточно свободных номеров: найдено {len(chosen)} из {allocation.quantity}"
+        )
+
+    calendars = pricing.get_calendars(db, {
+        rooms_by_id[room_id].type_id: (check_in, check_out) for room_id in chosen
+    })
+    db_bookings = [
+        models.Booking(
+            room_id=room_id,
+            client_id=allocation.client_id,
+            check_in_date=check_in,
+            check_out_date=check_out,
+            status=allocation.status,
+            total_price=calendars[rooms_by_id[room_id].type_id].total(check_in, check_out)
+        )
+        for room_id in sorted(chosen)
+    ]
+    db.add_all(db_bookings)
+
+    # Если проживание уже идёт, номера сразу становятся занятыми
+    today = date.today()
+    if check_in <= today <= check_out and allocation.status not in INACTIVE_BOOKING_STATUSES:
+        for room_id in chosen:
+            rooms_by_id[room_id].status = "Занят"
+
+    db.flush()
+    # Ответ собирается до commit, чтобы не перечитывать каждую запись после него
+    result = schemas.BookingAllocation(
+        bookings=[schemas.Booking.model_validate(db_booking) for db_booking in db_bookings]
+    )
+    rooms = [schemas.Room.model_validate(rooms_by_id[room_id]) for room_id in sorted(chosen)]
+    db.commit()
+    return result, rooms
+
 # Функция для автоматического обновления статуса номера на основе бронирований
 def update_room_status_based_on_bookings(db: Session, room_id: int):
     # Получаем номер
@@ -162,12 +455,7 @@ def update_room_status_based_on_bookings(db: Session, room_id: int):
     today = date.today()
     
     # Проверяем, есть ли активные бронирования на текущую дату
-    active_booking = db.query(models.Booking).filter(
-        models.Booking.room_id == room_id,
-        models.Booking.check_in_date <= today,
-        models.Booking.check_out_date >= today,
-        models.Booking.status.notin_(["Отменено", "Выселен"])
-    ).first()
+    active_booking = find_booking_conflict(db, room_id, today, today)
     
     # Устанавливаем статус в зависимости от наличия активного бронирования
     new_status = "Занят" if active_booking else "Свободен"
@@ -181,23 +469,19 @@ def update_room_status_based_on_bookings(db: Session, room_id: int):
     return room
 
 # Функция для обновления статусов всех номеров
-def update_all_room_statuses(db: Session):
+# progress - необязательная функция (done, total) для фоновой задачи
+def update_all_room_statuses(db: Session, progress=None):
     # Получаем все номера
-    rooms = get_rooms(db)
+    rooms = db.query(models.Room).order_by(models.Room.room_id).all()
     
     updated_rooms = []
     
     # Получаем текущую дату
     today = date.today()
     
-    for room in rooms:
+    for index, room in enumerate(rooms):
         # Проверяем, есть ли активные бронирования на текущую дату
-        active_booking = db.query(models.Booking).filter(
-            models.Booking.room_id == room.room_id,
-            models.Booking.check_in_date <= today,
-            models.Booking.check_out_date >= today,
-            models.Booking.status.notin_(["Отменено", "Выселен"])
-        ).first()
+        active_booking = find_booking_conflict(db, room.room_id, today, today)
         
         # Устанавливаем статус в зависимости от наличия активного бронирования
         new_status = "Занят" if active_booking else "Свободен"
@@ -208,12 +492,38 @@ def update_all_room_statuses(db: Session):
             db.commit()
             db.refresh(room)
             updated_rooms.append(room)
+        
+        if progress is not None:
+            progress(index + 1, len(rooms))
     
     return updated_rooms
 
+# Пересчёт статусов нескольких номеров после массового изменения бронирований:
+# один запрос на занятые сегодня номера вместо проверки каждого. Без commit,
+# изменения сохраняются в транзакции вызывающего. Возвращает изменённые номера
+def refresh_room_statuses(db: Session, room_ids):
+    today = date.today()
+    occupied = set(db.scalars(
+        select(models.Booking.room_id).where(
+            models.Booking.room_id.in_(room_ids),
+            booking_overlaps(today, today),
+            models.Booking.status.notin_(INACTIVE_BOOKING_STATUSES)
+        )
+    ))
+    rooms = db.scalars(
+        select(models.Room).where(models.Room.room_id.in_(room_ids)).order_by(models.Room.room_id)
+    ).all()
+    changed_rooms = []
+    for room in rooms:
+        new_status = "Занят" if room.room_id in occupied else "Свободен"
+        if room.status != new_status:
+            room.status = new_status
+            changed_rooms.append(room)
+    return changed_rooms
+
 # Функции для работы с сотрудниками
 def get_employee(db: Session, employee_id: int):
-    return db.query(models.Employee).filter(models.Employee.employee_id == employee_id).first()
+    return db.get(models.Employee, employee_id)
 
 def get_employees(db: Session, skip: int = 0, limit: int = 100):
     return db.query(models.Employee).offset(skip).limit(limit).all()
@@ -243,7 +553,7 @@ def update_employee_status(db: Session, employee_id: int, status: str):
 
 # Функции для работы с расписанием уборок
 def get_cleaning_schedule(db: Session, schedule_id: int):
-    return db.query(models.CleaningSchedule).filter(models.CleaningSchedule.schedule_id == schedule_id).first()
+    return db.get(models.CleaningSchedule, schedule_id)
 
 def get_cleaning_schedules(db: Session, skip: int = 0, limit: int = 100):
     return db.query(models.CleaningSchedule).offset(skip).limit(limit).all()
@@ -279,7 +589,7 @@ def create_cleaning_schedule(db: Session, schedule: schemas.CleaningScheduleCrea
 
 # Функции для работы с журналом уборок
 def get_cleaning_log(db: Session, log_id: int):
-    return db.query(models.CleaningLog).filter(models.CleaningLog.log_id == log_id).first()
+    return db.get(models.CleaningLog, log_id)
 
 def get_cleaning_logs(db: Session, skip: int = 0, limit: int = 100):
     return db.query(models.CleaningLog).offset(skip).limit(limit).all()
@@ -290,11 +600,35 @@ def get_cleaning_logs_by_employee(db: Session, employee_id: int):
 def get_cleaning_logs_by_date(db: Session, cleaning_date: date):
     return db.query(models.CleaningLog).filter(models.CleaningLog.cleaning_date == cleaning_date).all()
 
-def get_cleaning_logs_by_date_and_floor(db: Session, cleaning_date: date, floor_id: int):
-    return db.query(models.CleaningLog).filter(
+# Номера этажей повторяются в разных гостиницах, поэтому этаж ищется в гостинице сотрудника
+def get_cleaning_logs_by_date_and_floor(db: Session, cleaning_date: date, floor_id: int, hotel_id: int = None):
+    query = db.query(models.CleaningLog).filter(
         models.CleaningLog.cleaning_date == cleaning_date,
         models.CleaningLog.floor_id == floor_id
-    ).all()
+    )
+    if hotel_id is not None:
+        query = query.filter(models.CleaningLog.hotel_id == hotel_id)
+    return query.all()
+
+# Потоковые версии запросов истории для выдачи в формате NDJSON.
+# Строки читаются из серверного курсора пачками по STREAM_BATCH_SIZE,
+# поэтому расход памяти не зависит от объёма истории
+STREAM_BATCH_SIZE = 500
+
+def iter_bookings_by_room(db: Session, room_id: int):
+    return db.query(models.Booking).filter(
+        models.Booking.room_id == room_id
+    ).order_by(models.Booking.booking_id).yield_per(STREAM_BATCH_SIZE)
+
+def iter_cleaning_logs_by_employee(db: Session, employee_id: int):
+    return db.query(models.CleaningLog).filter(
+        models.CleaningLog.employee_id == employee_id
+    ).order_by(models.CleaningLog.log_id).yield_per(STREAM_BATCH_SIZE)
+
+def iter_cleaning_logs_by_date(db: Session, cleaning_date: date):
+    return db.query(models.CleaningLog).filter(
+        models.CleaningLog.cleaning_date == cleaning_date
+    ).order_by(models.CleaningLog.log_id).yield_per(STREAM_BATCH_SIZE)
 
 def create_cleaning_log(db: Session, log: schemas.CleaningLogCreate):
     db_log = models.CleaningLog(**log.dict())
@@ -313,6 +647,130 @@ def complete_cleaning(db: Session, log_id: int):
     db.refresh(db_log)
     return db_log
 
+# Нормы времени на уборку номера (в минутах): после выезда - полная уборка,
+# для продолжающегося проживания - текущая
+DEPARTURE_CLEANING_MINUTES = 45
+STAYOVER_CLEANING_MINUTES = 20
+
+# Объём уборки по этажам на дату: выезды и продолжающиеся проживания считаются
+# одним агрегирующим запросом по номерам и бронированиям
+def get_floor_workloads(db: Session, cleaning_date: date, hotel_id: int):
+    departures = func.count(case((models.Booking.check_out_date == cleaning_date, 1)))
+    stayovers = func.count(case((and_(
+        models.Booking.check_in_date < cleaning_date,
+        models.Booking.check_out_date > cleaning_date
+    ), 1)))
+    query = db.query(models.Room.floor, departures, stayovers).outerjoin(
+        models.Booking, and_(
+            models.Booking.room_id == models.Room.room_id,
+            booking_overlaps(cleaning_date, cleaning_date),
+            models.Booking.status != CANCELLED_BOOKING_STATUS
+        )
+    ).filter(models.Room.hotel_id == hotel_id)
+    return {
+        floor: departures_count * DEPARTURE_CLEANING_MINUTES + stayovers_count * STAYOVER_CLEANING_MINUTES
+        for floor, departures_count, stayovers_count in query.group_by(models.Room.floor).all()
+    }
+
+# Распределение уборки этажей на дату между активными сотрудниками.
+# Один этаж убирает один сотрудник, поэтому задача сводится к распределению
+# этажей по сотрудникам с минимальной максимальной нагрузкой. Используется
+# жадный алгоритм LPT: этажи по убыванию объёма отдаются наименее загруженному
+# сотруднику (куча по нагрузке). При равной нагрузке предпочтение отдаётся
+# сотруднику, за которым этаж закреплён в расписании на этот день недели.
+# Этажи, на которые уже есть записи в журнале, не переназначаются.
+# Номера этажей в разных гостиницах повторяются, поэтому распределение
+# выполняется в пределах одной гостиницы и только между её сотрудниками
+def optimize_cleaning_assignments(db: Session, cleaning_date: date, hotel_id: int):
+    # Параллельные распределения одной гостиницы на одну дату выполняются на PostgreSQL
+    # по очереди (блокировка до конца транзакции): второе видит записи журнала,
+    # созданные первым, и не назначает те же этажи ещё раз
+    if db.get_bind().dialect.name == "postgresql":
+        db.execute(
+            text("SELECT pg_advisory_xact_lock(hashtext(:key))"),
+            {"key": f"cleaning_optimize:{hotel_id}:{cleaning_date.isoformat()}"}
+        )
+    employees = {employee.employee_id: employee for employee in db.query(models.Employee).filter(
+        models.Employee.status == "Активен",
+        models.Employee.hotel_id == hotel_id
+    ).all()}
+    if not employees:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Нет активных сотрудников для распределения уборки"
+        )
+
+    workloads = get_floor_workloads(db, cleaning_date, hotel_id)
+
+    # Уже назначенные на эту дату этажи учитываются в нагрузке сотрудников
+    loads = {employee_id: 0 for employee_id in employees}
+    assigned_floors = {employee_id: [] for employee_id in employees}
+    existing = db.query(models.CleaningLog.floor_id, models.CleaningLog.employee_id).filter(
+        models.CleaningLog.cleaning_date == cleaning_date,
+        models.CleaningLog.hotel_id == hotel_id
+    ).all()
+    taken = set()
+    for floor, employee_id in existing:
+        taken.add(floor)
+        if employee_id in loads:
+            loads[employee_id] += workloads.get(floor, 0)
+            assigned_floors[employee_id].append(floor)
+
+    weekday = list(models.Weekday)[cleaning_date.weekday()].value
+    scheduled = {}
+    for floor, employee_id in db.query(models.CleaningSchedule.floor, models.CleaningSchedule.employee_id).filter(
+        models.CleaningSchedule.day_of_week == weekday,
+        models.CleaningSchedule.hotel_id == hotel_id
+    ).all():
+        if employee_id in employees:
+            scheduled.setdefault(floor, set()).add(employee_id)
+
+    pending = sorted(
+        ((minutes, floor) for floor, minutes in workloads.items() if floor not in taken and minutes > 0),
+        key=lambda item: (-item[0], item[1])
+    )
+
+    heap = [(load, employee_id) for employee_id, load in loads.items()]
+    heapq.heapify(heap)
+    plan = []
+    for minutes, floor in pending:
+        # Устаревшие записи кучи (нагрузка с тех пор выросла) пропускаются
+        while heap[0][0] != loads[heap[0][1]]:
+            heapq.heappop(heap)
+        min_load = heap[0][0]
+        preferred = sorted(
+            employee_id for employee_id in scheduled.get(floor, ())
+            if loads[employee_id] == min_load
+        )
+        employee_id = preferred[0] if preferred else heapq.heappop(heap)[1]
+        loads[employee_id] += minutes
+        assigned_floors[employee_id].append(floor)
+        heapq.heappush(heap, (loads[employee_id], employee_id))
+        plan.append((floor, employee_id))
+
+    db_logs = [
+        models.CleaningLog(floor_id=floor, employee_id=employee_id, cleaning_date=cleaning_date, status="Не начата")
+        for floor, employee_id in plan
+    ]
+    db.add_all(db_logs)
+    db.flush()
+    # Ответ собирается до commit, чтобы не перечитывать каждую запись после него.
+    # Гостиница записей (для ленты событий) выставлена при flush
+    result = schemas.CleaningPlan(
+        cleaning_date=cleaning_date,
+        logs=[schemas.CleaningLog.model_validate(db_log) for db_log in db_logs],
+        workloads=[
+            schemas.EmployeeWorkload(
+                employee_id=employee_id,
+                floors=sorted(floors),
+                minutes=loads[employee_id]
+            )
+            for employee_id, floors in sorted(assigned_floors.items()) if floors
+        ]
+    )
+    db.commit()
+    return result
+
 # Функции для работы с пользователями
 def get_user(db: Session, user_id: int):
     return db.query(models.User).filter(models.User.id == user_id).first()
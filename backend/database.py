@@ -1,9 +1,11 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
 import os
 from dotenv import load_dotenv
 import logging
+import threading
+import time
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
@@ -32,8 +34,95 @@ SQLALCHEMY_DATABASE_URL = f"postgresql://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{PO
 # Создаем экземпляр SQLAlchemy engine
 engine = create_engine(SQLALCHEMY_DATABASE_URL)
 
+# Ключ Session.info: пока он установлен, commit() сессии только отправляет
+# изменения в БД (flush), а транзакцию завершает тот, кто его установил.
+# Так действие вместе с сохранением его результата (см. idempotency.py)
+# выполняется в одной транзакции, даже если код действия вызывает commit()
+DEFER_COMMIT = "defer_commit"
+
+class AppSession(Session):
+    def commit(self):
+        if self.info.get(DEFER_COMMIT):
+            self.flush()
+            return
+        super().commit()
+
 # Создаем фабрику сессий
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine, class_=AppSession)
+
+# Реплика только для чтения (необязательно). Включается переменной POSTGRES_REPLICA_SERVER,
+# остальные параметры по умолчанию совпадают с основным сервером
+POSTGRES_REPLICA_SERVER = os.getenv("POSTGRES_REPLICA_SERVER")
+POSTGRES_REPLICA_PORT = os.getenv("POSTGRES_REPLICA_PORT", POSTGRES_PORT)
+POSTGRES_REPLICA_USER = os.getenv("POSTGRES_REPLICA_USER", POSTGRES_USER)
+POSTGRES_REPLICA_PASSWORD = os.getenv("POSTGRES_REPLICA_PASSWORD", POSTGRES_PASSWORD)
+POSTGRES_REPLICA_DB = os.getenv("POSTGRES_REPLICA_DB", POSTGRES_DB)
+
+# Максимально допустимое отставание реплики (в секундах). При большем отставании
+# или недоступности реплики чтение идёт с основного сервера
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "5"))
+
+# Как часто перепроверять отставание реплики (в секундах)
+REPLICA_CHECK_INTERVAL_SECONDS = float(os.getenv("REPLICA_CHECK_INTERVAL_SECONDS", "2"))
+
+replica_engine = None
+ReplicaSessionLocal = None
+if POSTGRES_REPLICA_SERVER:
+    logger.info(f"Реплика для чтения: {POSTGRES_REPLICA_USER}@{POSTGRES_REPLICA_SERVER}:{POSTGRES_REPLICA_PORT}/{POSTGRES_REPLICA_DB}")
+    REPLICA_DATABASE_URL = f"postgresql://{POSTGRES_REPLICA_USER}:{POSTGRES_REPLICA_PASSWORD}@{POSTGRES_REPLICA_SERVER}:{POSTGRES_REPLICA_PORT}/{POSTGRES_REPLICA_DB}"
+    replica_engine = create_engine(REPLICA_DATABASE_URL, pool_pre_ping=True)
+    ReplicaSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=replica_engine)
+
+# Отставание реплики: если все полученные WAL-записи применены, реплика актуальна,
+# иначе считаем время с последней применённой транзакции
+REPLICA_LAG_SQL = text(
+    "SELECT CASE "
+    "WHEN NOT pg_is_in_recovery() THEN 0 "
+    "WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+)
+
+_replica_state = {"checked_at": None, "healthy": False}
+_replica_lock = threading.Lock()
+
+def replica_lag_seconds():
+    with replica_engine.connect() as conn:
+        if conn.dialect.name != "postgresql":
+            return 0.0
+        return float(conn.execute(REPLICA_LAG_SQL).scalar())
+
+# Можно ли сейчас читать с реплики. Результат проверки кешируется на
+# REPLICA_CHECK_INTERVAL_SECONDS, чтобы не добавлять запрос к каждому чтению
+def replica_available() -> bool:
+    if replica_engine is None:
+        return False
+    now = time.monotonic()
+    with _replica_lock:
+        checked_at = _replica_state["checked_at"]
+        if checked_at is not None and now - checked_at < REPLICA_CHECK_INTERVAL_SECONDS:
+            return _replica_state["healthy"]
+        # Остальные запросы до конца проверки используют прежний результат
+        _replica_state["checked_at"] = now
+
+    try:
+        lag = replica_lag_seconds()
+        healthy = lag <= REPLICA_MAX_LAG_SECONDS
+        if not healthy:
+            logger.warning(f"Реплика отстаёт на {lag:.1f} с, чтение переключено на основной сервер")
+    except Exception as e:
+        healthy = False
+        logger.warning(f"Реплика недоступна, чтение переключено на основной сервер: {str(e)}")
+
+    with _replica_lock:
+        _replica_state["healthy"] = healthy
+    return healthy
+
+# Сессия для запросов только на чтение: реплика, если она настроена и не отстаёт,
+# иначе основной сервер
+def get_read_session(use_primary: bool = False):
+    if not use_primary and replica_available():
+        return ReplicaSessionLocal()
+    return SessionLocal()
 
 # Создаем базовый класс для моделей
 Base = declarative_base() 
\ No newline at end of file
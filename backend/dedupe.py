@@ -0,0 +1,295 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import event, inspect, select, update, delete, func, text
+from fastapi import HTTPException, status
+from database import SessionLocal, engine
+import logging
+import re
+import sys
+import models
+import schemas
+import jobs
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Поиск и объединение дублей клиентов. У каждого клиента хранятся
+# нормализованный номер паспорта (passport_norm) и ключ имени (name_key):
+# они выставляются перед flush и служат ключами блоков. Кандидаты в дубли
+# ищутся только внутри блока (одинаковый паспорт или одинаковое имя),
+# поэтому поиск - это GROUP BY по индексу, а не сравнение всех пар записей.
+# В блоке с одинаковым именем клиенты считаются одним человеком, если номера
+# паспортов отличаются не более чем одной опечаткой, а если паспорт указан
+# не у обоих - если совпадает город. Одно совпадение имени без второго
+# признака - это однофамильцы, а не дубль
+
+# Блоки с одинаковым именем больше этого размера не разбираются: это
+# однофамильцы, а сравнение пар внутри блока растёт квадратично
+DEDUPE_MAX_BLOCK = 50
+
+BACKFILL_BATCH_SIZE = 5000
+
+# Фоновая задача заполнения ключей (обработчик - в tasks.py)
+BACKFILL_JOB = "dedupe_backfill"
+
+# Кириллические буквы, совпадающие по написанию с латинскими: номер
+# иностранного паспорта часто вводят в русской раскладке
+_LOOKALIKES = str.maketrans("АВЕКМНОРСТУХ", "ABEKMHOPCTYX")
+_PASSPORT_JUNK = re.compile(r"[^0-9A-ZА-ЯЁ]")
+_NAME_JUNK = re.compile(r"[^0-9a-zа-я]+")
+
+def normalize_passport(value: str) -> str:
+    if not value:
+        return ""
+    return _PASSPORT_JUNK.sub("", value.upper().translate(_LOOKALIKES))[:20]
+
+def normalize_name(value: str) -> str:
+    if not value:
+        return ""
+    return _NAME_JUNK.sub(" ", value.lower().replace("ё", "е")).strip()
+
+def name_key(last_name: str, first_name: str) -> str:
+    return f"{normalize_name(last_name)}|{normalize_name(first_name)}"[:120]
+
+def _changed(obj, attr: str) -> bool:
+    return inspect(obj).attrs[attr].history.has_changes()
+
+@event.listens_for(Session, "before_flush")
+def assign_keys(session, flush_context, instances):
+    for obj in list(session.new) + list(session.dirty):
+        if not isinstance(obj, models.Client):
+            continue
+        if obj.passport_norm is None or _changed(obj, "passport_number"):
+            obj.passport_norm = normalize_passport(obj.passport_number)
+        if obj.name_key is None or _changed(obj, "last_name") or _changed(obj, "first_name"):
+            obj.name_key = name_key(obj.last_name, obj.first_name)
+
+# Проверка перед созданием или изменением клиента: клиент с тем же номером
+# паспорта уже есть (в гостинице пользователя, см. tenancy.py). На PostgreSQL
+# проверка и вставка одного номера в параллельных запросах выполняются по
+# очереди (блокировка до конца транзакции)
+def check_duplicate(db: Session, passport_number: str, exclude_client_id: int = None):
+    passport_norm = normalize_passport(passport_number)
+    if not passport_norm:
+        return
+    if db.get_bind().dialect.name == "postgresql":
+        db.execute(text("SELECT pg_advisory_xact_lock(hashtext(:key))"), {"key": f"client_passport:{passport_norm}"})
+    query = select(models.Client.client_id).where(models.Client.passport_norm == passport_norm)
+    if exclude_client_id is not None:
+        query = query.where(models.Client.client_id != exclude_client_id)
+    existing_id = db.scalar(query.limit(1))
+    if existing_id is not None:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Клиент с таким номером паспорта уже существует (ID {existing_id})"
+        )
+
+# Расстояние Дамерау-Левенштейна не больше 1: замена, вставка, удаление
+# или перестановка соседних символов
+def _within_one_edit(a: str, b: str) -> bool:
+    if a == b:
+        return True
+    if abs(len(a) - len(b)) > 1:
+        return False
+    if len(a) > len(b):
+        a, b = b, a
+    i = 0
+    while i < len(a) and a[i] == b[i]:
+        i += 1
+    if len(a) == len(b):
+        return a[i + 1:] == b[i + 1:] or (a[i + 1:i + 2] == b[i:i + 1] and a[i:i + 1] == b[i + 1:i + 2] and a[i + 2:] == b[i + 2:])
+    return a[i:] == b[i + 1:]
+
+def _same_person(a: models.Client, b: models.Client) -> bool:
+    if a.passport_norm and b.passport_norm:
+        return _within_one_edit(a.passport_norm, b.passport_norm)
+    city = normalize_name(a.city)
+    return bool(city) and city == normalize_name(b.city)
+
+# Группы клиентов-однофамильцев, которые похожи на одного человека
+def _name_clusters(clients):
+    parent = list(range(len(clients)))
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+    for i in range(len(clients)):
+        for j in range(i + 1, len(clients)):
+            if _same_person(clients[i], clients[j]):
+                parent[find(i)] = find(j)
+    clusters = {}
+    for i, client in enumerate(clients):
+        clusters.setdefault(find(i), []).append(client)
+    return [
+        cluster for cluster in clusters.values()
+        # Группы с одинаковым паспортом уже есть в поиске по паспорту
+        if len(cluster) > 1 and not (cluster[0].passport_norm and len({c.passport_norm for c in cluster}) == 1)
+    ]
+
+# Группы возможных дублей по паспорту или по имени. Группы упорядочены
+# по ключу блока; следующая страница начинается после ключа последней группы (after)
+def find_duplicates(db: Session, by: str = "passport", after: str = None, limit: int = 100):
+    column = models.Client.passport_norm if by == "passport" else models.Client.name_key
+    blocks = select(column).where(column.isnot(None), column != "").group_by(column)
+    if by == "passport":
+        blocks = blocks.having(func.count() > 1)
+    else:
+        blocks = blocks.having(func.count().between(2, DEDUPE_MAX_BLOCK))
+    if after is not None:
+        blocks = blocks.where(column > after)
+    keys = list(db.scalars(blocks.order_by(column).limit(limit)))
+    if not keys:
+        return []
+
+    members = {}
+    for client in db.scalars(
+        select(models.Client).where(column.in_(keys)).order_by(models.Client.client_id)
+    ):
+        members.setdefault(getattr(client, column.key), []).append(client)
+
+    groups = []
+    for key in keys:
+        clients = members.get(key, [])
+        clusters = [clients] if by == "passport" else _name_clusters(clients)
+        for cluster in clusters:
+            groups.append(schemas.DuplicateGroup(
+                key=key,
+                reason=by,
+                clients=[schemas.Client.model_validate(client) for client in cluster]
+            ))
+    return groups
+
+# Объединение клиентов: бронирования source_ids переносятся на target_id одним
+# UPDATE, записи source_ids удаляются. Пустые поля основной записи заполняются
+# из объединяемых. Возвращает результат и пары (перенесённое бронирование, гостиница)
+def merge_clients(db: Session, target_id: int, source_ids):
+    source_ids = list(dict.fromkeys(source_ids))
+    if target_id in source_ids:
+        raise HTTPException(status_code=400, detail="Клиент не может быть объединён сам с собой")
+
+    # Блокировка в порядке идентификаторов, чтобы параллельные объединения не ждали друг друга по кругу
+    ids = [target_id] + source_ids
+    clients = {client.client_id: client for client in db.scalars(
+        select(models.Client)
+        .where(models.Client.client_id.in_(ids))
+        .order_by(models.Client.client_id)
+        .with_for_update()
+    )}
+    missing = [client_id for client_id in ids if client_id not in clients]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Клиенты не найдены: {', '.join(map(str, missing))}")
+
+    target = clients[target_id]
+    for field in ("first_name", "last_name", "passport_number", "city"):
+        if not getattr(target, field):
+            value = next((getattr(clients[i], field) for i in source_ids if getattr(clients[i], field)), None)
+            if value:
+                setattr(target, field, value)
+
+    moved_ids = list(db.scalars(
+        update(models.Booking)
+        .where(models.Booking.client_id.in_(source_ids))
+        .values(client_id=target_id, version=models.Booking.version + 1)
+        .returning(models.Booking.booking_id)
+        .execution_options(synchronize_session=False)
+    ))
+    db.execute(
+        delete(models.Client)
+        .where(models.Client.client_id.in_(source_ids))
+        .execution_options(synchronize_session=False)
+    )
+    # Удаление в обход ORM: отметки для GET /sync добавляются явно (см. sync.py)
+    db.add_all(
+        models.DeletedRecord(entity="clients", entity_id=client_id, hotel_id=clients[client_id].hotel_id)
+        for client_id in source_ids
+    )
+    for client_id in source_ids:
+        db.expunge(clients[client_id])
+
+    bookings = []
+    if moved_ids:
+        bookings = [(schemas.Booking.model_validate(db_booking), db_booking.hotel_id) for db_booking in db.scalars(
+            select(models.Booking)
+            .where(models.Booking.booking_id.in_(moved_ids))
+            .order_by(models.Booking.booking_id)
+            .execution_options(populate_existing=True)
+        )]
+    db.flush()
+    result = schemas.ClientMergeResult(
+        client=schemas.Client.model_validate(target),
+        merged_client_ids=source_ids,
+        bookings_moved=len(moved_ids)
+    )
+    db.commit()
+    return result, bookings
+
+# Колонки ключей в базе, созданной до их появления, и индексы для поиска
+def migrate(conn):
+    columns = {column["name"] for column in inspect(conn).get_columns("clients")}
+    for name, column_type in (("passport_norm", "VARCHAR(20)"), ("name_key", "VARCHAR(120)")):
+        if name not in columns:
+            logger.info(f"Добавление колонки {name} в таблицу clients")
+            conn.execute(text(f"ALTER TABLE clients ADD COLUMN {name} {column_type}"))
+    for table in (models.Client.__table__, models.Booking.__table__):
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+
+# Задача заполнения ключей ставится при запуске API, если у части клиентов
+# их нет и такая задача ещё не ждёт в очереди и не выполняется. Повторный
+# запуск задачи безопасен: она обрабатывает только клиентов без ключей
+def schedule_backfill(db: Session):
+    if db.scalar(select(models.Client.client_id).where(models.Client.passport_norm.is_(None)).limit(1)) is None:
+        return None
+    job = db.scalar(
+        select(models.Job)
+        .where(models.Job.kind == BACKFILL_JOB, models.Job.status.in_([jobs.STATUS_QUEUED, jobs.STATUS_RUNNING]))
+        .limit(1)
+    )
+    if job is None:
+        job = jobs.enqueue(db, BACKFILL_JOB)
+        logger.info(f"У части клиентов нет ключей поиска дублей, поставлена задача {job.job_id}")
+    return job
+
+# Заполнение ключей существующих клиентов пачками по первичному ключу.
+# Время и номер изменения записей сохраняются, чтобы GET /sync не отдавал их заново
+def backfill(db: Session):
+    last_id = 0
+    total = 0
+    while True:
+        rows = db.execute(
+            select(models.Client.client_id, models.Client.first_name, models.Client.last_name,
+                   models.Client.passport_number, models.Client.updated_at, models.Client.change_id)
+            .where(models.Client.client_id > last_id, models.Client.passport_norm.is_(None))
+            .order_by(models.Client.client_id)
+            .limit(BACKFILL_BATCH_SIZE)
+        ).all()
+        if not rows:
+            return total
+        db.execute(update(models.Client), [
+            {
+                "client_id": row.client_id,
+                "passport_norm": normalize_passport(row.passport_number),
+                "name_key": name_key(row.last_name, row.first_name),
+                "updated_at": row.updated_at,
+                "change_id": row.change_id,
+            }
+            for row in rows
+        ])
+        db.commit()
+        last_id = rows[-1].client_id
+        total += len(rows)
+        logger.info(f"Заполнены ключи {total} клиентов")
+
+# Заполнение ключей вручную, без очереди задач: python dedupe.py backfill
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != "backfill":
+        logger.error("Использование: python dedupe.py backfill")
+        sys.exit(1)
+    with engine.begin() as conn:
+        migrate(conn)
+    db = SessionLocal()
+    try:
+        logger.info(f"Готово, обработано клиентов: {backfill(db)}")
+    finally:
+        db.close()
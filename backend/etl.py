@@ -0,0 +1,259 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import event, inspect, func, cast, case, and_, select, insert, true, literal_column, text, Date
+from datetime import date, datetime, timedelta
+from database import SessionLocal
+import models
+import crud
+import pricing
+import logging
+import sys
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Витрины строятся от первого бронирования до сегодняшнего дня плюс горизонт
+FACTS_HORIZON_DAYS = 365
+
+# Пересчёт идёт кусками, чтобы не строить календарь за много лет одним запросом
+FACTS_CHUNK_DAYS = 92
+
+STATE_NAME = "daily_facts"
+
+# Значения атрибута до и после изменения (для поиска затронутых дат)
+def _attr_values(obj, attr):
+    history = inspect(obj).attrs[attr].history
+    values = list(history.added or ()) + list(history.unchanged or ()) + list(history.deleted or ())
+    return [value for value in values if value is not None]
+
+_DATE_ATTRS = {"check_in_date", "check_out_date", "cleaning_date"}
+
+# Отслеживание изменений: при каждом flush запоминаем диапазоны дат,
+# которые нужно пересчитать в витринах при следующем запуске
+@event.listens_for(Session, "before_flush")
+def track_dirty_ranges(session, flush_context, instances):
+    ranges = []
+    changed = list(session.new) + list(session.deleted) + [
+        obj for obj in session.dirty if session.is_modified(obj, include_collections=False)
+    ]
+    for obj in changed:
+        # Атрибуты удаляемой записи могли устареть после commit: даты читаем из базы
+        if obj in session.deleted and isinstance(obj, (models.Booking, models.CleaningLog)):
+            expired = inspect(obj).expired_attributes.intersection(_DATE_ATTRS)
+            if expired:
+                session.refresh(obj, list(expired))
+        if isinstance(obj, models.Booking):
+            dates = _attr_values(obj, "check_in_date") + _attr_values(obj, "check_out_date")
+            if dates:
+                ranges.append(("booking", min(dates), max(dates)))
+        elif isinstance(obj, models.CleaningLog):
+            dates = _attr_values(obj, "cleaning_date")
+            if dates:
+                ranges.append(("cleaning", min(dates), max(dates)))
+        elif isinstance(obj, models.Room):
+            # Изменение номерного фонда влияет на витрину с сегодняшнего дня до конца покрытия
+            ranges.append(("room", date.today(), None))
+
+    for source, start, end in set(ranges):
+        session.add(models.EtlDirtyRange(source=source, start_date=start, end_date=end))
+
+# Ручная отметка диапазона для изменений, сделанных в обход ORM (массовые UPDATE)
+def mark_dirty(db: Session, source: str, start_date: date, end_date: date = None):
+    db.add(models.EtlDirtyRange(source=source, start_date=start_date, end_date=end_date))
+
+# Объединение пересекающихся и соседних диапазонов
+def _merge_ranges(ranges):
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + timedelta(days=1):
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+def _chunks(start: date, end: date):
+    while start <= end:
+        chunk_end = min(end, start + timedelta(days=FACTS_CHUNK_DAYS - 1))
+        yield start, chunk_end
+        start = chunk_end + timedelta(days=1)
+
+# Пересчёт витрины занятости за период: календарь × номера с пересекающим ночь бронированием
+def rebuild_room_occupancy(db: Session, start: date, end: date):
+    db.query(models.DailyRoomOccupancy).filter(
+        models.DailyRoomOccupancy.day.between(start, end)
+    ).delete(synchronize_session=False)
+
+    days = select(
+        cast(func.generate_series(start, end, literal_column("interval '1 day'")), Date).label("day")
+    ).subquery("days")
+
+    rows = select(
+        days.c.day,
+        models.Room.room_id,
+        models.Room.hotel_id,
+        models.Room.type_id,
+        models.Room.floor,
+        models.Booking.booking_id,
+        case(
+            (models.Booking.booking_id.isnot(None), pricing.night_revenue()),
+            else_=0
+        ),
+    ).select_from(days).join(
+        models.Room, true()
+    ).outerjoin(
+        models.RoomType, models.RoomType.type_id == models.Room.type_id
+    ).outerjoin(
+        models.Booking, and_(
+            models.Booking.room_id == models.Room.room_id,
+            models.Booking.check_in_date <= days.c.day,
+            models.Booking.check_out_date > days.c.day,
+            # Границы по дате заезда ограничивают чтение нужными секциями bookings
+            models.Booking.check_in_date.between(start - timedelta(days=crud.MAX_STAY_DAYS), end),
+            models.Booking.status != crud.CANCELLED_BOOKING_STATUS
+        )
+    ).distinct(
+        days.c.day, models.Room.room_id
+    ).order_by(
+        days.c.day, models.Room.room_id, models.Booking.booking_id
+    )
+
+    db.execute(insert(models.DailyRoomOccupancy).from_select(
+        ["day", "room_id", "hotel_id", "type_id", "floor", "booking_id", "revenue"], rows
+    ))
+
+# Пересчёт витрины уборок за период: один этаж гостиницы - одна запись журнала в день
+def rebuild_cleaning_summary(db: Session, start: date, end: date):
+    db.query(models.DailyCleaningSummary).filter(
+        models.DailyCleaningSummary.day.between(start, end)
+    ).delete(synchronize_session=False)
+
+    rows = select(
+        models.CleaningLog.cleaning_date,
+        models.CleaningLog.floor_id,
+        models.Employee.hotel_id,
+        models.CleaningLog.log_id,
+        models.CleaningLog.employee_id,
+        models.CleaningLog.status,
+    ).join(
+        models.Employee, models.Employee.employee_id == models.CleaningLog.employee_id
+    ).where(
+        models.CleaningLog.cleaning_date.between(start, end),
+        models.CleaningLog.floor_id.isnot(None),
+        models.Employee.hotel_id.isnot(None)
+    ).distinct(
+        models.CleaningLog.cleaning_date, models.Employee.hotel_id, models.CleaningLog.floor_id
+    ).order_by(
+        models.CleaningLog.cleaning_date, models.Employee.hotel_id, models.CleaningLog.floor_id,
+        models.CleaningLog.log_id.desc()
+    )
+
+    db.execute(insert(models.DailyCleaningSummary).from_select(
+        ["day", "floor", "hotel_id", "log_id", "employee_id", "status"], rows
+    ))
+
+# Витрина уборок, созданная с ключом (день, этаж): ключ расширяется гостиницей,
+# а все даты журнала уборок отмечаются для пересчёта при следующем обновлении
+# витрин (до этого в витрине была только одна гостиница на каждый этаж)
+def migrate(conn):
+    if conn.dialect.name != "postgresql":
+        return
+    primary_key = inspect(conn).get_pk_constraint("daily_cleaning_summary")
+    if "hotel_id" in primary_key["constrained_columns"]:
+        return
+    logger.info("Добавление гостиницы в ключ витрины daily_cleaning_summary")
+    conn.execute(text(f'ALTER TABLE daily_cleaning_summary DROP CONSTRAINT "{primary_key["name"]}"'))
+    conn.execute(text("DELETE FROM daily_cleaning_summary WHERE hotel_id IS NULL"))
+    conn.execute(text("ALTER TABLE daily_cleaning_summary ADD PRIMARY KEY (day, hotel_id, floor)"))
+    first_log, last_log = conn.execute(
+        select(func.min(models.CleaningLog.cleaning_date), func.max(models.CleaningLog.cleaning_date))
+    ).one()
+    if first_log is not None:
+        conn.execute(insert(models.EtlDirtyRange).values(source="cleaning", start_date=first_log, end_date=last_log))
+
+def get_state(db: Session):
+    return db.get(models.EtlState, STATE_NAME)
+
+# Обновление витрин. При первом запуске (или full=True) строится всё покрытие,
+# далее пересчитываются только даты, затронутые изменениями с прошлого запуска,
+# и новые дни на горизонте
+def refresh_facts(db: Session, full: bool = False):
+    today = date.today()
+    horizon_end = today + timedelta(days=FACTS_HORIZON_DAYS)
+
+    # Фиксируем верхнюю границу обрабатываемых отметок: изменения, сделанные
+    # во время пересчёта, попадут в следующий запуск
+    max_dirty_id = db.query(func.max(models.EtlDirtyRange.id)).scalar()
+    state = get_state(db)
+
+    occupancy_ranges = []
+    cleaning_ranges = []
+
+    if state is None or full:
+        first_booking = db.query(func.min(models.Booking.check_in_date)).scalar()
+        if state is None:
+            state = models.EtlState(name=STATE_NAME)
+            db.add(state)
+        rebuild_start = min(first_booking or today, today)
+        # Строки витрины за периоды, уже выгруженные в архив (см. partitions.py),
+        # не пересчитываются и сохраняют историю
+        state.facts_start = min(rebuild_start, state.facts_start or rebuild_start)
+        state.facts_end = horizon_end
+        occupancy_ranges.append((rebuild_start, state.facts_end))
+
+        first_log, last_log = db.query(
+            func.min(models.CleaningLog.cleaning_date), func.max(models.CleaningLog.cleaning_date)
+        ).one()
+        if first_log is not None:
+            cleaning_ranges.append((first_log, last_log))
+    else:
+        if state.facts_end < horizon_end:
+            occupancy_ranges.append((state.facts_end + timedelta(days=1), horizon_end))
+            state.facts_end = horizon_end
+
+        if max_dirty_id is not None:
+            dirty = db.query(models.EtlDirtyRange).filter(models.EtlDirtyRange.id <= max_dirty_id).all()
+            for item in dirty:
+                if item.source == "cleaning":
+                    cleaning_ranges.append((item.start_date, item.end_date or item.start_date))
+                    continue
+                start = item.start_date
+                end = min(item.end_date or state.facts_end, state.facts_end)
+                if start < state.facts_start:
+                    state.facts_start = start
+                if start <= end:
+                    occupancy_ranges.append((start, end))
+
+    occupancy_days = 0
+    for start, end in _merge_ranges(occupancy_ranges):
+        for chunk_start, chunk_end in _chunks(start, end):
+            rebuild_room_occupancy(db, chunk_start, chunk_end)
+        occupancy_days += (end - start).days + 1
+
+    cleaning_days = 0
+    for start, end in _merge_ranges(cleaning_ranges):
+        for chunk_start, chunk_end in _chunks(start, end):
+            rebuild_cleaning_summary(db, chunk_start, chunk_end)
+        cleaning_days += (end - start).days + 1
+
+    if max_dirty_id is not None:
+        db.query(models.EtlDirtyRange).filter(
+            models.EtlDirtyRange.id <= max_dirty_id
+        ).delete(synchronize_session=False)
+
+    state.last_run = datetime.now()
+    db.commit()
+
+    logger.info(f"Витрины обновлены: дней занятости {occupancy_days}, дней уборок {cleaning_days}")
+    return {"occupancy_days": occupancy_days, "cleaning_days": cleaning_days}
+
+# Запуск по расписанию (например, из cron): python etl.py [--full]
+if __name__ == "__main__":
+    db = SessionLocal()
+    try:
+        refresh_facts(db, full="--full" in sys.argv)
+    except Exception as e:
+        logger.error(f"Ошибка при обновлении витрин: {e}")
+        db.rollback()
+        raise
+    finally:
+        db.close()
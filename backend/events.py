@@ -0,0 +1,235 @@
+from sqlalchemy import select, func
+from database import engine, SQLALCHEMY_DATABASE_URL, POSTGRES_USER, POSTGRES_PASSWORD, POSTGRES_SERVER, POSTGRES_PORT, POSTGRES_DB
+from contextlib import contextmanager
+import asyncio
+import json
+import logging
+import os
+import queue
+import select as select_module
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Канал PostgreSQL, через который рассылаются события об изменениях
+EVENTS_CHANNEL = "inncontrol_events"
+
+# Способ доставки событий: postgres (LISTEN/NOTIFY между процессами) или memory (в пределах процесса, для тестов)
+EVENTS_BACKEND = os.getenv("EVENTS_BACKEND", "postgres" if SQLALCHEMY_DATABASE_URL.startswith("postgresql") else "memory")
+
+# Максимальная длина очереди подписчика. Переполненный подписчик отключается
+# и получает событие resync, после которого клиент перезагружает данные целиком
+SUBSCRIBER_QUEUE_SIZE = 1000
+
+# Наибольшее число событий в одной транзакции NOTIFY и время на отправку
+# оставшихся событий при остановке процесса
+PUBLISH_BATCH_SIZE = 500
+PUBLISH_STOP_TIMEOUT_SECONDS = 5
+
+# Подписка одного клиента: очередь в его цикле событий и фильтр по гостинице
+class Subscription:
+    def __init__(self, loop, hotel_id=None):
+        self.loop = loop
+        self.hotel_id = hotel_id
+        self.queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.overflowed = False
+
+    # Подписчик гостиницы получает только события своей гостиницы: события
+    # без гостиницы могут относиться к любой из них и видны только без фильтра
+    def matches(self, event: dict) -> bool:
+        return self.hotel_id is None or event.get("hotel_id") == self.hotel_id
+
+    def put(self, event):
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(None)
+
+# Брокер в памяти процесса: раздаёт события всем подходящим подписчикам
+class MemoryBroker:
+    def __init__(self):
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self, hotel_id=None) -> Subscription:
+        subscription = Subscription(asyncio.get_running_loop(), hotel_id)
+        with self._lock:
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    # Вызывается из любого потока: события передаются в цикл событий подписчика
+    def dispatch(self, event: dict):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            if subscription.matches(event):
+                subscription.loop.call_soon_threadsafe(subscription.put, event)
+
+    def publish(self, event: dict):
+        self.dispatch(event)
+
+    def publish_many(self, events: list):
+        for event in events:
+            self.dispatch(event)
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+# Брокер на PostgreSQL: событие отправляется через NOTIFY, а фоновый поток
+# каждого процесса API слушает канал (LISTEN) и раздаёт события своим подписчикам.
+# Отправка тоже выполняется фоновым потоком: запрос только ставит события
+# в очередь, а поток отправляет накопившиеся события пачкой в одной транзакции
+class PostgresBroker(MemoryBroker):
+    def __init__(self):
+        super().__init__()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._publisher = None
+        self._outbox = queue.Queue()
+
+    def publish(self, event: dict):
+        self.publish_many([event])
+
+    # Пока поток отправки не запущен (например, в скриптах), события отправляются сразу
+    def publish_many(self, events: list):
+        if self._publisher is None:
+            self._send(events)
+            return
+        for event in events:
+            self._outbox.put(event)
+
+    # Отдельное короткое соединение, чтобы не затрагивать сессию запроса
+    def _send(self, events: list):
+        with engine.begin() as conn:
+            for event in events:
+                payload = json.dumps(event, ensure_ascii=False, default=str)
+                conn.execute(select(func.pg_notify(EVENTS_CHANNEL, payload)))
+
+    def _publish_loop(self):
+        while True:
+            event = self._outbox.get()
+            if event is None:
+                return
+            batch = [event]
+            while len(batch) < PUBLISH_BATCH_SIZE:
+                try:
+                    event = self._outbox.get_nowait()
+                except queue.Empty:
+                    break
+                if event is None:
+                    self._outbox.put(None)
+                    break
+                batch.append(event)
+            try:
+                self._send(batch)
+            except Exception as e:
+                logger.error(f"Не удалось опубликовать {len(batch)} событий: {e}")
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stopped.clear()
+        self._publisher = threading.Thread(target=self._publish_loop, name="events-publisher", daemon=True)
+        self._publisher.start()
+        self._thread = threading.Thread(target=self._listen, name="events-listener", daemon=True)
+        self._thread.start()
+
+    # Уже поставленные в очередь события отправляются до остановки
+    def stop(self):
+        self._stopped.set()
+        if self._publisher is not None:
+            self._outbox.put(None)
+            self._publisher.join(timeout=PUBLISH_STOP_TIMEOUT_SECONDS)
+            self._publisher = None
+        self._thread = None
+
+    def _listen(self):
+        import psycopg2
+        while not self._stopped.is_set():
+            try:
+                conn = psycopg2.connect(
+                    user=POSTGRES_USER, password=POSTGRES_PASSWORD,
+                    host=POSTGRES_SERVER, port=POSTGRES_PORT, dbname=POSTGRES_DB
+                )
+                conn.autocommit = True
+                with conn.cursor() as cursor:
+                    cursor.execute(f"LISTEN {EVENTS_CHANNEL}")
+                logger.info("Подписка на канал событий PostgreSQL установлена")
+                while not self._stopped.is_set():
+                    if select_module.select([conn], [], [], 5) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        notify = conn.notifies.pop(0)
+                        try:
+                            self.dispatch(json.loads(notify.payload))
+                        except ValueError:
+                            logger.warning("Получено событие в неверном формате")
+                conn.close()
+            except Exception as e:
+                # Соединение потеряно: переподключаемся после паузы
+                logger.error(f"Ошибка подписки на канал событий: {e}")
+                time.sleep(3)
+
+broker = PostgresBroker() if EVENTS_BACKEND == "postgres" else MemoryBroker()
+
+# Отложенная публикация: события, опубликованные этим потоком внутри deferred(),
+# собираются в список и отправляются вызовом send() после фиксации транзакции
+# (см. idempotency.py). Если транзакция откатилась, события не отправляются
+_deferred = threading.local()
+
+@contextmanager
+def deferred():
+    pending = []
+    _deferred.events = pending
+    try:
+        yield pending
+    finally:
+        _deferred.events = None
+
+def send(batch: list):
+    if not batch:
+        return
+    try:
+        broker.publish_many(batch)
+    except Exception as e:
+        logger.error(f"Не удалось опубликовать {len(batch)} событий: {e}")
+
+# Публикация компактного события об изменении записи. Ошибка доставки
+# не должна отменять уже сохранённое изменение, поэтому она только логируется
+def publish(entity: str, action: str, entity_id: int, hotel_id=None, data=None):
+    event = {"entity": entity, "action": action, "id": entity_id, "hotel_id": hotel_id, "data": data}
+    pending = getattr(_deferred, "events", None)
+    if pending is not None:
+        pending.append(event)
+        return
+    try:
+        broker.publish(event)
+    except Exception as e:
+        logger.error(f"Не удалось опубликовать событие {entity}.{action}: {e}")
+
+# Публикация нескольких событий одним обращением к брокеру (массовые изменения).
+# Элементы - кортежи (entity, action, entity_id, hotel_id, data)
+def publish_many(items):
+    batch = [
+        {"entity": entity, "action": action, "id": entity_id, "hotel_id": hotel_id, "data": data}
+        for entity, action, entity_id, hotel_id, data in items
+    ]
+    pending = getattr(_deferred, "events", None)
+    if pending is not None:
+        pending.extend(batch)
+        return
+    send(batch)
@@ -0,0 +1,581 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import select, func
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from datetime import date, datetime, timedelta
+from xml.sax.saxutils import escape
+from database import get_read_session
+import csv
+import hashlib
+import json
+import logging
+import os
+import re
+import sys
+import time
+import uuid
+import zipfile
+import models
+import crud
+import analytics
+import jobs
+import tenancy
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Выгрузка отчётов в CSV, XLSX и PDF. POST /reports/{kind}/export ставит фоновую
+# задачу (см. jobs.py). Задача читает строки отчёта серверным курсором пачками
+# по EXPORT_CHUNK_ROWS и сразу дописывает их в файл, поэтому память не зависит
+# от длины периода. Готовый файл хранится EXPORT_TTL_HOURS часов в EXPORT_DIR
+# и отдаётся через GET /reports/exports/{export_id} с поддержкой Range (докачка).
+# Файл называется по хешу содержимого: одинаковые выгрузки хранятся один раз,
+# а повторная выгрузка закрытого периода (целиком в прошлом) с теми же
+# параметрами сразу получает готовый файл без новой задачи
+
+EXPORT_DIR = os.getenv("EXPORT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "exports"))
+EXPORT_TTL_HOURS = int(os.getenv("EXPORT_TTL_HOURS", "24"))
+EXPORT_CHUNK_ROWS = 2000
+
+# Файлы моложе этого времени не удаляются при очистке: задача могла записать
+# файл, но ещё не сохранить ссылку на него
+EXPORT_PURGE_GRACE_SECONDS = 3600
+
+# PDF предназначен для печати, большие выгрузки делаются в CSV или XLSX
+EXPORT_PDF_MAX_ROWS = 20000
+# Шрифт с кириллицей для PDF
+EXPORT_PDF_FONT = os.getenv("EXPORT_PDF_FONT", "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf")
+
+XLSX_MAX_ROWS = 1048576
+
+FILE_CHUNK_SIZE = 64 * 1024
+
+# Формат: тип содержимого и расширение файла (charset для text/csv добавляет Starlette)
+FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "xlsx": ("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", "xlsx"),
+    "pdf": ("application/pdf", "pdf"),
+}
+
+# Финансовый отчёт: бронирования, пересекающие период, со стоимостью проживания.
+# Возвращает число строк и пачки строк
+def _financial_rows(db: Session, params: dict):
+    start = date.fromisoformat(params["start"])
+    end = date.fromisoformat(params["end"])
+    query = select(
+        models.Booking.booking_id,
+        models.Client.first_name,
+        models.Client.last_name,
+        models.Room.room_number,
+        models.Booking.check_in_date,
+        models.Booking.check_out_date,
+        models.Booking.status,
+        models.RoomType.price_per_night,
+        models.Booking.total_price,
+    ).select_from(models.Booking).join(
+        models.Room, models.Room.room_id == models.Booking.room_id
+    ).outerjoin(
+        models.Client, models.Client.client_id == models.Booking.client_id
+    ).outerjoin(
+        models.RoomType, models.RoomType.type_id == models.Room.type_id
+    ).where(
+        crud.booking_overlaps(start, end),
+        models.Booking.status != crud.CANCELLED_BOOKING_STATUS
+    )
+    if params.get("hotel_id") is not None:
+        query = query.where(models.Booking.hotel_id == params["hotel_id"])
+    total = db.scalar(select(func.count()).select_from(query.subquery()))
+
+    def chunks():
+        nights_total = 0
+        income = 0.0
+        result = db.execute(
+            query.order_by(models.Room.room_number, models.Booking.check_in_date, models.Booking.booking_id)
+            .execution_options(stream_results=True, yield_per=EXPORT_CHUNK_ROWS)
+        )
+        for partition in result.partitions():
+            rows = []
+            for row in partition:
+                nights = (row.check_out_date - row.check_in_date).days
+                price = row.price_per_night or 0
+                amount = row.total_price if row.total_price is not None else nights * price
+                nights_total += nights
+                income += amount
+                rows.append([
+                    row.booking_id,
+                    f"{row.first_name or ''} {row.last_name or ''}".strip(),
+                    row.room_number,
+                    row.check_in_date.isoformat(),
+                    row.check_out_date.isoformat(),
+                    row.status,
+                    nights,
+                    price,
+                    round(amount, 2),
+                ])
+            yield rows
+        yield [["Итого", "", "", "", "", "", nights_total, "", round(income, 2)]]
+
+    return total + 1, chunks()
+
+# Отчёты по аналитике: строк немного (по одной на группу), поэтому одна пачка
+def _occupancy_rows(db: Session, params: dict):
+    stats = analytics.get_room_night_stats(
+        db, date.fromisoformat(params["start"]), date.fromisoformat(params["end"]),
+        group_by=params["group_by"], hotel_id=params.get("hotel_id")
+    )
+    rows = [
+        [stat["label"], stat["available_room_nights"], stat["sold_room_nights"], stat["occupancy"],
+         stat["revenue"], stat["adr"], stat["revpar"]]
+        for stat in stats
+    ]
+    return len(rows), iter([rows])
+
+def _cleaning_rows(db: Session, params: dict):
+    stats = analytics.get_cleaning_stats(
+        db, date.fromisoformat(params["start"]), date.fromisoformat(params["end"]),
+        group_by=params["group_by"], hotel_id=params.get("hotel_id")
+    )
+    rows = [[stat["label"], stat["assigned"], stat["completed"], stat["completion"]] for stat in stats]
+    return len(rows), iter([rows])
+
+# Отчёты: название, столбцы, допустимые группировки (None - без группировки) и строки
+REPORTS = {
+    "financial": (
+        "Финансовый отчёт",
+        ["ID", "Клиент", "Номер", "Дата заезда", "Дата выезда", "Статус", "Ночей", "Цена за ночь", "Сумма"],
+        None,
+        _financial_rows,
+    ),
+    "occupancy": (
+        "Заполняемость и выручка",
+        ["Период", "Доступно номеро-ночей", "Продано номеро-ночей", "Заполняемость, %", "Выручка", "ADR", "RevPAR"],
+        analytics.GROUP_BY_OPTIONS,
+        _occupancy_rows,
+    ),
+    "cleaning": (
+        "Выполнение уборок",
+        ["Период", "Назначено", "Выполнено", "Выполнение, %"],
+        ("day", "week", "month", "floor"),
+        _cleaning_rows,
+    ),
+}
+
+# Проверка и нормализация параметров выгрузки
+def export_params(kind: str, format: str, start: date, end: date, group_by: str = "day", hotel_id: int = None) -> dict:
+    if kind not in REPORTS:
+        raise HTTPException(status_code=404, detail=f"Отчёт не найден. Доступны: {', '.join(REPORTS)}")
+    if end < start:
+        raise HTTPException(status_code=400, detail="Дата окончания периода раньше даты начала")
+    if format == "pdf":
+        reason = pdf_unavailable_reason()
+        if reason is not None:
+            raise HTTPException(status_code=501, detail=reason)
+    params = {"start": start.isoformat(), "end": end.isoformat(), "hotel_id": hotel_id}
+    group_options = REPORTS[kind][2]
+    if group_options is not None:
+        if group_by not in group_options:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Недопустимая группировка. Используйте: {', '.join(group_options)}"
+            )
+        params["group_by"] = group_by
+    return params
+
+def _request_hash(kind: str, format: str, params: dict) -> str:
+    data = json.dumps({"kind": kind, "format": format, "params": params}, sort_keys=True)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+def _file_path(content_hash: str, format: str) -> str:
+    return os.path.join(EXPORT_DIR, f"{content_hash}.{FORMATS[format][1]}")
+
+def export_status(export: models.ReportExport) -> dict:
+    return {
+        "export_id": export.export_id,
+        "kind": export.kind,
+        "format": export.format,
+        "rows": export.rows,
+        "size": export.size,
+        "content_hash": export.content_hash,
+        "expires_at": export.expires_at,
+        "download_url": f"/reports/exports/{export.export_id}",
+    }
+
+# Выгрузка по запросу: для закрытого периода - уже готовая или выполняемая
+# с теми же параметрами, иначе новая фоновая задача. Возвращает задачу
+def request_export(db: Session, kind: str, format: str, params: dict):
+    request_hash = _request_hash(kind, format, params)
+    closed = date.fromisoformat(params["end"]) < date.today()
+    now = datetime.utcnow()
+    expires_at = now + timedelta(hours=EXPORT_TTL_HOURS)
+
+    if closed:
+        # Задача видна только гостинице, которая её поставила (см. jobs.get_job):
+        # чужая выгрузка с теми же параметрами не переиспользуется
+        existing = db.execute(
+            select(models.ReportExport, models.Job)
+            .join(models.Job, models.Job.job_id == models.ReportExport.job_id)
+            .where(
+                models.ReportExport.request_hash == request_hash,
+                models.ReportExport.expires_at > now,
+                models.Job.status != jobs.STATUS_FAILED,
+                models.Job.hotel_id == tenancy.current_hotel_id(db)
+            )
+            .order_by(models.ReportExport.created_at.desc())
+            .limit(1)
+        ).first()
+        if existing is not None:
+            export, job = existing
+            # Срок хранения не продлевается: файл удаляется в срок, назначенный
+            # при создании, сколько бы раз его ни запрашивали
+            if export.content_hash is None or os.path.exists(_file_path(export.content_hash, format)):
+                return job
+
+    export = models.ReportExport(
+        export_id=uuid.uuid4().hex,
+        kind=kind,
+        format=format,
+        params=json.dumps(params, sort_keys=True),
+        request_hash=request_hash,
+        closed=closed,
+        created_at=now,
+        expires_at=expires_at
+    )
+    db.add(export)
+    job = jobs.enqueue(db, "report_export", {"export_id": export.export_id})
+    export.job_id = job.job_id
+    db.commit()
+    return job
+
+# Пачки строк с подсчётом и отметкой о ходе выполнения
+class _RowCounter:
+    def __init__(self, chunks, total: int, progress=None):
+        self.chunks = chunks
+        self.total = total
+        self.progress = progress
+        self.count = 0
+
+    def __iter__(self):
+        for rows in self.chunks:
+            self.count += len(rows)
+            if self.progress is not None:
+                self.progress(min(self.count, self.total), self.total)
+            yield rows
+
+# CSV в UTF-8 с BOM: так Excel определяет кодировку и показывает кириллицу
+def _write_csv(path: str, title: str, columns, chunks):
+    with open(path, "w", encoding="utf-8-sig", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        for rows in chunks:
+            writer.writerows(rows)
+
+_XLSX_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '</Types>'
+)
+_XLSX_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+_XLSX_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="{name}" sheetId="1" r:id="rId1"/></sheets>'
+    '</workbook>'
+)
+_XLSX_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+    'Target="worksheets/sheet1.xml"/>'
+    '</Relationships>'
+)
+
+def _xlsx_cell(value) -> str:
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return f"<c><v>{value}</v></c>"
+    return f'<c t="inlineStr"><is><t>{escape(str(value))}</t></is></c>'
+
+def _xlsx_row(values) -> bytes:
+    return ("<row>" + "".join(_xlsx_cell(value) for value in values) + "</row>").encode("utf-8")
+
+def _zip_entry(name: str) -> zipfile.ZipInfo:
+    # Постоянная дата в архиве: одинаковые данные дают одинаковый файл (и хеш)
+    info = zipfile.ZipInfo(name, date_time=(1980, 1, 1, 0, 0, 0))
+    info.compress_type = zipfile.ZIP_DEFLATED
+    return info
+
+# XLSX - zip-архив с XML. Лист пишется в архив потоком, строка за строкой,
+# строки хранятся в ячейках (inlineStr) без общей таблицы строк
+def _write_xlsx(path: str, title: str, columns, chunks):
+    with zipfile.ZipFile(path, "w") as archive:
+        archive.writestr(_zip_entry("[Content_Types].xml"), _XLSX_CONTENT_TYPES)
+        archive.writestr(_zip_entry("_rels/.rels"), _XLSX_ROOT_RELS)
+        archive.writestr(_zip_entry("xl/workbook.xml"), _XLSX_WORKBOOK.format(name=escape(title[:31])))
+        archive.writestr(_zip_entry("xl/_rels/workbook.xml.rels"), _XLSX_WORKBOOK_RELS)
+        with archive.open(_zip_entry("xl/worksheets/sheet1.xml"), "w", force_zip64=True) as sheet:
+            sheet.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+            )
+            sheet.write(_xlsx_row(columns))
+            for rows in chunks:
+                sheet.write(b"".join(_xlsx_row(row) for row in rows))
+            sheet.write(b"</sheetData></worksheet>")
+
+# PDF строится пакетом reportlab со шрифтом EXPORT_PDF_FONT (нужна кириллица)
+def pdf_unavailable_reason():
+    try:
+        import reportlab
+    except ImportError:
+        return "Выгрузка в PDF недоступна: требуется пакет reportlab"
+    if not os.path.exists(EXPORT_PDF_FONT):
+        return f"Выгрузка в PDF недоступна: не найден шрифт {EXPORT_PDF_FONT}"
+    return None
+
+PDF_FONT_NAME = "ExportFont"
+PDF_FONT_SIZE = 8
+PDF_ROW_HEIGHT = 12
+PDF_MARGIN = 36
+
+def _write_pdf(path: str, title: str, columns, chunks):
+    try:
+        from reportlab.lib.pagesizes import A4, landscape
+        from reportlab.pdfbase import pdfmetrics
+        from reportlab.pdfbase.ttfonts import TTFont
+        from reportlab.pdfgen import canvas
+    except ImportError:
+        raise RuntimeError("Для выгрузки в PDF требуется пакет reportlab")
+
+    if PDF_FONT_NAME not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(TTFont(PDF_FONT_NAME, EXPORT_PDF_FONT))
+
+    width, height = landscape(A4)
+    column_width = (width - 2 * PDF_MARGIN) / len(columns)
+
+    def fit(text: str) -> str:
+        while text and pdfmetrics.stringWidth(text, PDF_FONT_NAME, PDF_FONT_SIZE) > column_width - 4:
+            text = text[:-1]
+        return text
+
+    def draw_row(values, y, bold=False):
+        pdf.setFont(PDF_FONT_NAME, PDF_FONT_SIZE)
+        for index, value in enumerate(values):
+            pdf.drawString(PDF_MARGIN + index * column_width, y, fit(str(value)))
+        if bold:
+            pdf.line(PDF_MARGIN, y - 3, width - PDF_MARGIN, y - 3)
+
+    # invariant - без даты создания и случайного идентификатора, чтобы
+    # одинаковые данные давали одинаковый файл
+    pdf = canvas.Canvas(path, pagesize=(width, height), invariant=1)
+    pdf.setTitle(title)
+    page = 1
+
+    def start_page():
+        pdf.setFont(PDF_FONT_NAME, PDF_FONT_SIZE + 4)
+        pdf.drawString(PDF_MARGIN, height - PDF_MARGIN, title)
+        pdf.setFont(PDF_FONT_NAME, PDF_FONT_SIZE)
+        pdf.drawRightString(width - PDF_MARGIN, PDF_MARGIN / 2, f"Страница {page}")
+        y = height - PDF_MARGIN - 2 * PDF_ROW_HEIGHT
+        draw_row(columns, y, bold=True)
+        return y - PDF_ROW_HEIGHT
+
+    y = start_page()
+    for rows in chunks:
+        for row in rows:
+            if y < PDF_MARGIN:
+                pdf.showPage()
+                page += 1
+                y = start_page()
+            draw_row(row, y)
+            y -= PDF_ROW_HEIGHT
+    pdf.save()
+
+WRITERS = {"csv": _write_csv, "xlsx": _write_xlsx, "pdf": _write_pdf}
+
+def _file_hash(path: str):
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(FILE_CHUNK_SIZE)
+            if not block:
+                break
+            digest.update(block)
+            size += len(block)
+    return digest.hexdigest(), size
+
+# Формирование файла выгрузки (выполняется фоновой задачей).
+# progress - необязательная функция (done, total)
+def run_export(db: Session, export_id: str, progress=None):
+    purge_expired(db)
+    export = db.get(models.ReportExport, export_id)
+    if export is None:
+        raise HTTPException(status_code=404, detail="Выгрузка не найдена")
+    params = json.loads(export.params)
+    title, columns, _, rows_func = REPORTS[export.kind]
+    title = f"{title} за {params['start']} - {params['end']}"
+
+    # Строки отчёта читаются с реплики, если она настроена
+    read_db = get_read_session()
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    tmp_path = os.path.join(EXPORT_DIR, f"{export_id}.tmp")
+    try:
+        total, chunks = rows_func(read_db, params)
+        if export.format == "pdf" and total > EXPORT_PDF_MAX_ROWS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Слишком много строк для PDF ({total}, допустимо {EXPORT_PDF_MAX_ROWS}). Используйте CSV или XLSX"
+            )
+        if export.format == "xlsx" and total >= XLSX_MAX_ROWS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Слишком много строк для XLSX ({total}). Используйте CSV"
+            )
+        counter = _RowCounter(chunks, total, progress)
+        WRITERS[export.format](tmp_path, title, columns, counter)
+        content_hash, size = _file_hash(tmp_path)
+        path = _file_path(content_hash, export.format)
+        if os.path.exists(path):
+            # Такой же файл уже сохранён другой выгрузкой
+            os.remove(tmp_path)
+        else:
+            os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    finally:
+        read_db.close()
+
+    export.content_hash = content_hash
+    export.size = size
+    export.rows = counter.count
+    export.expires_at = max(export.expires_at, datetime.utcnow() + timedelta(hours=EXPORT_TTL_HOURS))
+    db.commit()
+    logger.info(f"Выгрузка {export_id} ({export.kind}, {export.format}): {counter.count} строк, {size} байт")
+    return export_status(export)
+
+# Удаление просроченных выгрузок и файлов, на которые больше нет ссылок
+def purge_expired(db: Session):
+    removed = db.query(models.ReportExport).filter(
+        models.ReportExport.expires_at <= datetime.utcnow()
+    ).delete(synchronize_session=False)
+    db.commit()
+    if not os.path.isdir(EXPORT_DIR):
+        return removed
+    referenced = set(db.scalars(
+        select(models.ReportExport.content_hash).where(models.ReportExport.content_hash.isnot(None))
+    ))
+    threshold = time.time() - EXPORT_PURGE_GRACE_SECONDS
+    for entry in os.scandir(EXPORT_DIR):
+        name = entry.name.split(".", 1)[0]
+        if name in referenced or entry.stat().st_mtime > threshold:
+            continue
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass
+    return removed
+
+_RANGE = re.compile(r"bytes=(\d*)-(\d*)")
+
+# Один диапазон из заголовка Range: "bytes=начало-конец", "bytes=начало-" или
+# "bytes=-длина". Несколько диапазонов не поддерживаются: отдаётся весь файл
+def parse_range(header: str, size: int):
+    match = _RANGE.fullmatch(header.strip())
+    if match is None or not (match.group(1) or match.group(2)):
+        return None
+    first, last = match.group(1), match.group(2)
+    if first:
+        start = int(first)
+        # Некорректный диапазон (конец раньше начала) игнорируется
+        if last and int(last) < start:
+            return None
+        end = min(int(last), size - 1) if last else size - 1
+        satisfiable = start < size
+    else:
+        start = max(size - int(last), 0)
+        end = size - 1
+        satisfiable = int(last) > 0
+    if not satisfiable:
+        raise HTTPException(
+            status_code=416,
+            detail="Запрошенный диапазон недоступен",
+            headers={"Content-Range": f"bytes */{size}"}
+        )
+    return start, end
+
+def _read_file(path: str, start: int, end: int):
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            block = f.read(min(FILE_CHUNK_SIZE, remaining))
+            if not block:
+                break
+            remaining -= len(block)
+            yield block
+
+# Ответ с файлом выгрузки. ETag - хеш содержимого; If-Range с другим ETag
+# означает, что у клиента другая версия файла, и он получает файл целиком
+def export_file_response(db: Session, export_id: str, range_header: str = None, if_range: str = None):
+    export = db.get(models.ReportExport, export_id)
+    if export is None or export.expires_at <= datetime.utcnow():
+        raise HTTPException(status_code=404, detail="Выгрузка не найдена или устарела")
+    if export.content_hash is None:
+        raise HTTPException(status_code=409, detail="Выгрузка ещё не готова")
+    path = _file_path(export.content_hash, export.format)
+    params = json.loads(export.params)
+    # Пользователь гостиницы получает только выгрузки своей гостиницы
+    tenant_hotel_id = tenancy.current_hotel_id(db)
+    if not os.path.exists(path) or tenant_hotel_id not in (None, params.get("hotel_id")):
+        raise HTTPException(status_code=404, detail="Выгрузка не найдена или устарела")
+
+    media_type, extension = FORMATS[export.format]
+    etag = f'"{export.content_hash}"'
+    size = os.path.getsize(path)
+    headers = {
+        "Accept-Ranges": "bytes",
+        "ETag": etag,
+        "Content-Disposition": f'attachment; filename="{export.kind}_{params["start"]}_{params["end"]}.{extension}"',
+    }
+    start, end = 0, size - 1
+    status_code = 200
+    if range_header and (if_range is None or if_range.strip() == etag):
+        byte_range = parse_range(range_header, size)
+        if byte_range is not None:
+            start, end = byte_range
+            status_code = 206
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(
+        _read_file(path, start, end), status_code=status_code, media_type=media_type, headers=headers
+    )
+
+# Очистка просроченных выгрузок (например, из cron): python exports.py purge
+if __name__ == "__main__":
+    from database import SessionLocal
+    if len(sys.argv) < 2 or sys.argv[1] != "purge":
+        logger.error("Использование: python exports.py purge")
+        sys.exit(1)
+    db = SessionLocal()
+    try:
+        removed = purge_expired(db)
+        logger.info(f"Удалено просроченных выгрузок: {removed}")
+    finally:
+        db.close()
@@ -0,0 +1,162 @@
+from fastapi import Header, HTTPException, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from datetime import datetime, timedelta
+from typing import Optional
+from database import DEFER_COMMIT
+import hashlib
+import json
+import os
+import models
+import events
+
+# Время хранения ответа для ключа идемпотентности
+IDEMPOTENCY_TTL_HOURS = int(os.getenv("IDEMPOTENCY_TTL_HOURS", "24"))
+
+# Отпечаток тела запроса: повтор с тем же ключом должен совпадать с исходным запросом
+def request_fingerprint(payload) -> str:
+    data = json.dumps(jsonable_encoder(payload), sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+def _replay(stored: models.IdempotencyKey):
+    return JSONResponse(
+        status_code=stored.status_code,
+        content=json.loads(stored.response_body),
+        headers={"Idempotent-Replayed": "true"}
+    )
+
+# Сколько секунд ключ считается занятым выполняющимся запросом. Если процесс
+# упал, не сохранив ответ, по истечении этого времени ключ можно использовать снова
+IDEMPOTENCY_LOCK_SECONDS = int(os.getenv("IDEMPOTENCY_LOCK_SECONDS", "60"))
+
+# Ключ хранится вместе с владельцем (заголовок Authorization): одинаковые ключи
+# разных клиентов не пересекаются, а токены не сохраняются в открытом виде
+def storage_key(owner: str, key: str) -> str:
+    return hashlib.sha256(f"{owner}\n{key}".encode("utf-8")).hexdigest()
+
+class IdempotentRequest:
+    def __init__(self, key: Optional[str], scope: str, owner: str = ""):
+        self.key = key
+        self.scope = scope
+        self.owner = owner
+
+    # Ключ занимается строкой без ответа (status_code IS NULL) до выполнения действия:
+    # параллельный повтор с тем же ключом видит её и получает 409, а не выполняет
+    # действие второй раз. Возвращает None, если ключ занят этим запросом, иначе
+    # сохранённую строку
+    def _reserve(self, db: Session, key: str, fingerprint: str, now: datetime):
+        try:
+            db.add(models.IdempotencyKey(
+                key=key,
+                scope=self.scope,
+                request_hash=fingerprint,
+                created_at=now,
+                expires_at=now + timedelta(seconds=IDEMPOTENCY_LOCK_SECONDS)
+            ))
+            db.commit()
+            return None
+        except IntegrityError:
+            db.rollback()
+
+        # Просроченный ключ (или брошенный упавшим процессом) занимается заново
+        # условным UPDATE: из параллельных запросов это удаётся только одному
+        taken = db.query(models.IdempotencyKey).filter(
+            models.IdempotencyKey.key == key,
+            models.IdempotencyKey.expires_at <= now
+        ).update({
+            "scope": self.scope,
+            "request_hash": fingerprint,
+            "status_code": None,
+            "response_body": None,
+            "created_at": now,
+            "expires_at": now + timedelta(seconds=IDEMPOTENCY_LOCK_SECONDS),
+        }, synchronize_session=False)
+        db.commit()
+        if taken:
+            return None
+        stored = db.get(models.IdempotencyKey, key, populate_existing=True)
+        if stored is None:
+            return self._reserve(db, key, fingerprint, now)
+        return stored
+
+    def _release(self, db: Session, key: str):
+        db.rollback()
+        db.query(models.IdempotencyKey).filter(
+            models.IdempotencyKey.key == key,
+            models.IdempotencyKey.status_code.is_(None)
+        ).delete(synchronize_session=False)
+        db.commit()
+
+    # Выполняет действие один раз для данного ключа. Успешный ответ сохраняется,
+    # повтор получает его без обращения к таблицам бронирований, номеров и уборок.
+    # Ошибки (HTTPException) не сохраняются, поэтому запрос можно повторить после исправления
+    def run(self, db: Session, payload, response_schema, action):
+        if not self.key:
+            return action()
+
+        key = storage_key(self.owner, self.key)
+        fingerprint = request_fingerprint(payload)
+        now = datetime.utcnow()
+
+        stored = self._reserve(db, key, fingerprint, now)
+        if stored is not None:
+            if stored.scope != self.scope or stored.request_hash != fingerprint:
+                raise HTTPException(
+                    status_code=422,
+                    detail="Ключ идемпотентности уже использован для другого запроса"
+                )
+            if stored.status_code is None:
+                raise HTTPException(
+                    status_code=409,
+                    detail="Запрос с этим ключом идемпотентности ещё выполняется, повторите его позже",
+                    headers={"Retry-After": "1"}
+                )
+            return _replay(stored)
+
+        # Действие и сохранение его ответа - одна транзакция: commit() внутри
+        # действия только отправляет изменения (см. database.AppSession), а события
+        # уходят подписчикам после фиксации. Если транзакция не зафиксирована,
+        # изменения откатываются вместе с ответом и ключ освобождается для повтора;
+        # после фиксации ключ уже не освобождается
+        try:
+            with events.deferred() as pending:
+                db.info[DEFER_COMMIT] = True
+                try:
+                    result = action()
+                    body = jsonable_encoder(response_schema.model_validate(result))
+                finally:
+                    db.info.pop(DEFER_COMMIT, None)
+
+                # Сохраняем ответ в занятой строке и удаляем просроченные ключи
+                done = datetime.utcnow()
+                db.query(models.IdempotencyKey).filter(
+                    models.IdempotencyKey.key == key
+                ).update({
+                    "status_code": 200,
+                    "response_body": json.dumps(body, ensure_ascii=False),
+                    "expires_at": done + timedelta(hours=IDEMPOTENCY_TTL_HOURS),
+                }, synchronize_session=False)
+                db.query(models.IdempotencyKey).filter(
+                    models.IdempotencyKey.expires_at <= done,
+                    models.IdempotencyKey.status_code.isnot(None)
+                ).delete(synchronize_session=False)
+                db.commit()
+        except BaseException:
+            self._release(db, key)
+            raise
+
+        events.send(pending)
+        return body
+
+# Зависимость FastAPI: читает заголовок Idempotency-Key, область действия ключа
+# (метод и путь) и его владельца (заголовок Authorization)
+def idempotent_request(request: Request, idempotency_key: Optional[str] = Header(None)) -> IdempotentRequest:
+    if idempotency_key is not None and len(idempotency_key) > 255:
+        raise HTTPException(status_code=400, detail="Слишком длинный ключ идемпотентности")
+    return IdempotentRequest(
+        idempotency_key,
+        f"{request.method} {request.url.path}",
+        request.headers.get("authorization", "")
+    )
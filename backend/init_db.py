@@ -1,6 +1,6 @@
 from sqlalchemy.orm import Session
 from database import engine, SessionLocal, Base
-import models, crud, schemas
+import models, crud, schemas, partitions
 import logging
 
 # Настройка логирования
@@ -12,6 +12,10 @@ def init_db():
     Base.metadata.create_all(bind=engine)
     logger.info("Таблицы созданы успешно")
     
+    # Создаем секции для секционированных таблиц
+    with engine.begin() as conn:
+        partitions.ensure_partitions(conn)
+    
     # Открываем сессию
     db = SessionLocal()
     try:
@@ -0,0 +1,314 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import event, inspect, select, insert, update, func, cast, and_, literal_column, Date
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from collections import Counter, namedtuple
+from datetime import date, timedelta
+from database import SessionLocal
+import models
+import crud
+import logging
+import sys
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Таблица inventory: на каждую ночь (гостиница, тип номера) число номеров
+# и число ночей, занятых действующими бронированиями. Бронирование занимает
+# ночи с даты заезда до даты выезда (не включая её). Таблица ведётся только
+# с сегодняшнего дня: прошлые ночи для проверки доступности не нужны.
+# Изменения вносятся в той же транзакции, что и изменения бронирований:
+# перед flush запоминаем старое и новое состояние, после flush применяем
+# разницу одним INSERT ... ON CONFLICT на все затронутые ночи
+
+# Состояние бронирования, влияющее на учёт
+BookingState = namedtuple("BookingState", "room_id check_in_date check_out_date active")
+
+def is_active(status: str) -> bool:
+    return status not in crud.INACTIVE_BOOKING_STATUSES
+
+def _values(obj, attr):
+    history = inspect(obj).attrs[attr].history
+    unchanged = list(history.unchanged or ())
+    old = list(history.deleted or ()) or unchanged
+    new = list(history.added or ()) or unchanged
+    return (old[0] if old else None), (new[0] if new else None)
+
+def _booking_states(session, obj):
+    attrs = ("room_id", "check_in_date", "check_out_date", "status")
+    # Удаляемое бронирование могло устареть после commit (например, в цикле
+    # удаления): без загрузки его ночи не освободились бы в inventory
+    expired = inspect(obj).expired_attributes.intersection(attrs)
+    if obj in session.deleted and expired:
+        session.refresh(obj, list(expired))
+    values = {attr: _values(obj, attr) for attr in attrs}
+    old = {attr: old for attr, (old, _) in values.items()}
+    new = {attr: new for attr, (_, new) in values.items()}
+    # Прежнее значение неизвестно, если атрибут был изменён без загрузки
+    # записи: читаем его из базы, пока строка ещё не обновлена
+    if obj in session.dirty and any(old[attr] is None for attr in attrs):
+        row = session.connection().execute(
+            select(models.Booking.room_id, models.Booking.check_in_date,
+                   models.Booking.check_out_date, models.Booking.status)
+            .where(models.Booking.booking_id == obj.booking_id)
+        ).first()
+        if row is not None:
+            old = dict(zip(attrs, row))
+    return (
+        BookingState(old["room_id"], old["check_in_date"], old["check_out_date"], is_active(old["status"])),
+        BookingState(new["room_id"], new["check_in_date"], new["check_out_date"], is_active(new["status"])),
+    )
+
+@event.listens_for(Session, "before_flush")
+def track_inventory(session, flush_context, instances):
+    changes = []
+    room_keys = set()
+    moved = []
+    for obj in session.new:
+        if isinstance(obj, models.Booking):
+            changes.append((None, _booking_states(session, obj)[1]))
+        elif isinstance(obj, models.Room):
+            room_keys.add((obj.hotel_id, obj.type_id))
+    for obj in session.deleted:
+        if isinstance(obj, models.Booking):
+            changes.append((_booking_states(session, obj)[0], None))
+        elif isinstance(obj, models.Room):
+            room_keys.add((obj.hotel_id, obj.type_id))
+    for obj in session.dirty:
+        if not session.is_modified(obj, include_collections=False):
+            continue
+        if isinstance(obj, models.Booking):
+            old, new = _booking_states(session, obj)
+            if old != new:
+                changes.append((old, new))
+        elif isinstance(obj, models.Room):
+            old_hotel, new_hotel = _values(obj, "hotel_id")
+            old_type, new_type = _values(obj, "type_id")
+            if (old_hotel, old_type) != (new_hotel, new_type):
+                room_keys.update({(old_hotel, old_type), (new_hotel, new_type)})
+                moved.append((obj.room_id, (old_hotel, old_type), (new_hotel, new_type)))
+    if changes or room_keys:
+        session.info.setdefault("inventory_changes", []).extend(changes)
+        session.info.setdefault("inventory_room_keys", set()).update(room_keys)
+        session.info.setdefault("inventory_moved_rooms", []).extend(moved)
+
+@event.listens_for(Session, "after_flush")
+def apply_inventory(session, flush_context):
+    changes = session.info.pop("inventory_changes", None)
+    room_keys = session.info.pop("inventory_room_keys", None)
+    moved = session.info.pop("inventory_moved_rooms", None)
+    if not changes and not room_keys:
+        return
+    conn = session.connection()
+    deltas = Counter()
+    if moved:
+        _add_moved_rooms(conn, moved, deltas)
+    if changes:
+        _add_booking_changes(conn, changes, deltas)
+    if room_keys:
+        refresh_totals(conn, room_keys)
+    apply_deltas(conn, deltas)
+
+@event.listens_for(Session, "after_rollback")
+def discard_inventory(session):
+    for key in ("inventory_changes", "inventory_room_keys", "inventory_moved_rooms"):
+        session.info.pop(key, None)
+
+def _nights(check_in: date, check_out: date, today: date):
+    day = max(check_in, today)
+    while day < check_out:
+        yield day
+        day += timedelta(days=1)
+
+# Изменения бронирований -> изменения числа занятых номеров по ночам.
+# changes - пары (старое, новое) BookingState, None - бронирования не было / не стало
+def _add_booking_changes(conn, changes, deltas: Counter):
+    room_ids = {state.room_id for pair in changes for state in pair if state is not None}
+    room_keys = dict(
+        (room_id, (hotel_id, type_id)) for room_id, hotel_id, type_id in conn.execute(
+            select(models.Room.room_id, models.Room.hotel_id, models.Room.type_id)
+            .where(models.Room.room_id.in_(room_ids))
+        )
+    ) if room_ids else {}
+    today = date.today()
+    for old, new in changes:
+        for state, sign in ((old, -1), (new, 1)):
+            if state is None or not state.active or state.check_in_date is None or state.check_out_date is None:
+                continue
+            key = room_keys.get(state.room_id)
+            if key is None:
+                continue
+            for day in _nights(state.check_in_date, state.check_out_date, today):
+                deltas[key + (day,)] += sign
+
+# Номер перенесён в другой тип или гостиницу: его будущие бронирования переходят вместе с ним
+def _add_moved_rooms(conn, moved, deltas: Counter):
+    today = date.today()
+    keys = {room_id: (old_key, new_key) for room_id, old_key, new_key in moved}
+    rows = conn.execute(
+        select(models.Booking.room_id, models.Booking.check_in_date, models.Booking.check_out_date).where(
+            models.Booking.room_id.in_(keys),
+            models.Booking.check_out_date > today,
+            models.Booking.check_in_date >= today - timedelta(days=crud.MAX_STAY_DAYS),
+            models.Booking.status.notin_(crud.INACTIVE_BOOKING_STATUSES)
+        )
+    )
+    for room_id, check_in, check_out in rows:
+        old_key, new_key = keys[room_id]
+        for day in _nights(check_in, check_out, today):
+            deltas[old_key + (day,)] -= 1
+            deltas[new_key + (day,)] += 1
+
+def _room_counts(conn, keys):
+    hotel_ids = {hotel_id for hotel_id, _ in keys}
+    type_ids = {type_id for _, type_id in keys}
+    rows = conn.execute(
+        select(models.Room.hotel_id, models.Room.type_id, func.count(models.Room.room_id))
+        .where(models.Room.hotel_id.in_(hotel_ids), models.Room.type_id.in_(type_ids))
+        .group_by(models.Room.hotel_id, models.Room.type_id)
+    )
+    return {(hotel_id, type_id): count for hotel_id, type_id, count in rows}
+
+# Применение изменений: {(hotel_id, type_id, day): изменение числа занятых}
+def apply_deltas(conn, deltas: Counter):
+    rows = [
+        {"hotel_id": hotel_id, "type_id": type_id, "day": day, "booked": delta}
+        for (hotel_id, type_id, day), delta in deltas.items()
+        if delta and hotel_id is not None and type_id is not None
+    ]
+    if not rows:
+        return
+    totals = _room_counts(conn, {(row["hotel_id"], row["type_id"]) for row in rows})
+    for row in rows:
+        row["total"] = totals.get((row["hotel_id"], row["type_id"]), 0)
+    stmt = pg_insert(models.Inventory).values(rows)
+    conn.execute(stmt.on_conflict_do_update(
+        index_elements=[models.Inventory.hotel_id, models.Inventory.type_id, models.Inventory.day],
+        set_={"booked": models.Inventory.booked + stmt.excluded.booked}
+    ))
+
+# Изменения в обход ORM (массовые UPDATE): changes - пары (старое, новое) BookingState
+def apply_booking_changes(db: Session, changes):
+    deltas = Counter()
+    conn = db.connection()
+    _add_booking_changes(conn, changes, deltas)
+    apply_deltas(conn, deltas)
+
+# Номера перенесены в другой тип или гостиницу в обход ORM (массовый UPDATE):
+# moved - тройки (room_id, (старая гостиница, тип), (новая гостиница, тип))
+def apply_room_moves(db: Session, moved):
+    deltas = Counter()
+    conn = db.connection()
+    _add_moved_rooms(conn, moved, deltas)
+    refresh_totals(conn, {key for _, old_key, new_key in moved for key in (old_key, new_key)})
+    apply_deltas(conn, deltas)
+
+# Число номеров типа изменилось: обновляем его во всех строках
+def refresh_totals(conn, keys):
+    keys = {key for key in keys if None not in key}
+    if not keys:
+        return
+    totals = _room_counts(conn, keys)
+    for hotel_id, type_id in keys:
+        conn.execute(
+            update(models.Inventory)
+            .where(models.Inventory.hotel_id == hotel_id, models.Inventory.type_id == type_id)
+            .values(total=totals.get((hotel_id, type_id), 0))
+        )
+
+# Свободные номера по типам на каждую ночь периода [start, end)
+def get_type_availability(db: Session, start: date, end: date, hotel_id: int = None):
+    types_query = db.query(
+        models.Room.hotel_id, models.Room.type_id, models.RoomType.name, func.count(models.Room.room_id)
+    ).join(
+        models.RoomType, models.RoomType.type_id == models.Room.type_id
+    ).group_by(models.Room.hotel_id, models.Room.type_id, models.RoomType.name)
+    ledger_query = db.query(
+        models.Inventory.hotel_id, models.Inventory.type_id, models.Inventory.day,
+        models.Inventory.total, models.Inventory.booked
+    ).filter(models.Inventory.day >= start, models.Inventory.day < end)
+    if hotel_id is not None:
+        types_query = types_query.filter(models.Room.hotel_id == hotel_id)
+        ledger_query = ledger_query.filter(models.Inventory.hotel_id == hotel_id)
+
+    ledger = {}
+    for row_hotel, row_type, day, total, booked in ledger_query:
+        ledger[(row_hotel, row_type, day)] = (total, booked)
+
+    days = [start + timedelta(days=offset) for offset in range((end - start).days)]
+    result = []
+    for row_hotel, row_type, name, rooms in types_query.order_by(models.Room.hotel_id, models.Room.type_id):
+        nights = []
+        for day in days:
+            total, booked = ledger.get((row_hotel, row_type, day), (rooms, 0))
+            nights.append({"date": day, "total": total, "booked": booked, "available": max(total - booked, 0)})
+        result.append({
+            "hotel_id": row_hotel,
+            "type_id": row_type,
+            "type_name": name,
+            "total": rooms,
+            "available": min(night["available"] for night in nights) if nights else rooms,
+            "nights": nights,
+        })
+    return result
+
+# Полный пересчёт учёта по бронированиям за период (по умолчанию с сегодняшнего дня
+# до последней даты выезда). Прошлые ночи удаляются. Возвращает число строк
+def rebuild(db: Session, start: date = None, end: date = None):
+    today = date.today()
+    start = max(start or today, today)
+    if end is None:
+        end = db.query(func.max(models.Booking.check_out_date)).filter(
+            models.Booking.status.notin_(crud.INACTIVE_BOOKING_STATUSES)
+        ).scalar() or today
+    db.query(models.Inventory).filter(
+        (models.Inventory.day < today) | and_(models.Inventory.day >= start, models.Inventory.day < end)
+    ).delete(synchronize_session=False)
+    if end <= start:
+        db.commit()
+        return 0
+
+    days = select(
+        cast(func.generate_series(start, end - timedelta(days=1), literal_column("interval '1 day'")), Date).label("day")
+    ).subquery("days")
+    totals = select(
+        models.Room.hotel_id, models.Room.type_id, func.count(models.Room.room_id).label("total")
+    ).group_by(models.Room.hotel_id, models.Room.type_id).subquery("totals")
+    booked = select(
+        models.Room.hotel_id, models.Room.type_id, days.c.day,
+        func.count(models.Booking.booking_id).label("booked")
+    ).select_from(days).join(
+        models.Booking, and_(
+            models.Booking.check_in_date <= days.c.day,
+            models.Booking.check_out_date > days.c.day,
+            models.Booking.check_in_date >= start - timedelta(days=crud.MAX_STAY_DAYS),
+            models.Booking.status.notin_(crud.INACTIVE_BOOKING_STATUSES)
+        )
+    ).join(
+        models.Room, models.Room.room_id == models.Booking.room_id
+    ).group_by(models.Room.hotel_id, models.Room.type_id, days.c.day).subquery("booked")
+    rows = select(
+        booked.c.hotel_id, booked.c.type_id, booked.c.day, totals.c.total, booked.c.booked
+    ).select_from(booked).join(
+        totals, and_(totals.c.hotel_id == booked.c.hotel_id, totals.c.type_id == booked.c.type_id)
+    )
+    result = db.execute(insert(models.Inventory).from_select(
+        ["hotel_id", "type_id", "day", "total", "booked"], rows
+    ))
+    db.commit()
+    return result.rowcount
+
+# Сверка учёта с бронированиями (например, после ручных правок в БД или из cron):
+#   python inventory.py rebuild [YYYY-MM-DD YYYY-MM-DD]
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != "rebuild":
+        logger.error("Использование: python inventory.py rebuild [начало конец]")
+        sys.exit(1)
+    start = date.fromisoformat(sys.argv[2]) if len(sys.argv) > 2 else None
+    end = date.fromisoformat(sys.argv[3]) if len(sys.argv) > 3 else None
+    db = SessionLocal()
+    try:
+        count = rebuild(db, start, end)
+        logger.info(f"Учёт номерного фонда пересчитан, строк: {count}")
+    finally:
+        db.close()
@@ -0,0 +1,307 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import or_, and_
+from fastapi import HTTPException
+from datetime import datetime, timedelta
+from database import SessionLocal
+import json
+import logging
+import os
+import socket
+import sys
+import threading
+import time
+import models
+import tenancy
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Где выполняются задачи: local - в потоках процесса API (по умолчанию, удобно
+# для разработки и тестов), worker - в отдельном процессе "python jobs.py worker"
+JOBS_EXECUTOR = os.getenv("JOBS_EXECUTOR", "local")
+
+# Сколько задач процесс выполняет одновременно. Каждая задача держит одно
+# соединение с БД, поэтому тяжёлые операции не вытесняют обычные запросы
+JOB_CONCURRENCY = int(os.getenv("JOB_CONCURRENCY", "2"))
+
+# Число попыток и пауза перед повтором (удваивается с каждой попыткой)
+JOB_MAX_ATTEMPTS = 3
+JOB_RETRY_DELAY_SECONDS = 5
+
+# Как часто свободный исполнитель проверяет очередь
+JOB_POLL_SECONDS = 1
+
+# Задача без отметки о ходе выполнения дольше этого времени считается
+# зависшей (процесс исполнителя завершился) и запускается снова
+JOB_STALE_MINUTES = 15
+
+# Как часто выполняющаяся задача отмечается живой (см. Heartbeat)
+JOB_HEARTBEAT_SECONDS = 60
+
+# Сколько исполнитель при остановке ждёт завершения текущих задач. Задачи,
+# не успевшие завершиться, после JOB_STALE_MINUTES запустит другой исполнитель
+JOB_STOP_TIMEOUT_SECONDS = 30
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_SUCCEEDED = "succeeded"
+STATUS_FAILED = "failed"
+
+# Обработчики задач по типу: функция (db, params, context) -> результат (JSON)
+_handlers = {}
+
+def handler(kind: str):
+    def register(func):
+        _handlers[kind] = func
+        return func
+    return register
+
+# Передаётся обработчику: сообщает о ходе выполнения. Запись идёт в отдельной
+# сессии, чтобы прогресс был виден сразу, а не после завершения задачи
+class JobContext:
+    PROGRESS_INTERVAL_SECONDS = 0.5
+
+    def __init__(self, job_id: int):
+        self.job_id = job_id
+        self._last_update = 0.0
+
+    def progress(self, done: int, total: int, message: str = None):
+        now = time.monotonic()
+        if done < total and now - self._last_update < self.PROGRESS_INTERVAL_SECONDS:
+            return
+        self._last_update = now
+        db = SessionLocal()
+        try:
+            db.query(models.Job).filter(models.Job.job_id == self.job_id).update({
+                "progress": int(done * 100 / total) if total else 100,
+                "message": message,
+                "heartbeat_at": datetime.utcnow(),
+            }, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+# Отметка о том, что задача ещё выполняется: отдельный поток обновляет heartbeat_at
+# каждые JOB_HEARTBEAT_SECONDS, даже если обработчик долго не сообщает о ходе
+# выполнения (например, выполняет один долгий запрос). Иначе через
+# JOB_STALE_MINUTES задачу захватил бы второй исполнитель
+class Heartbeat:
+    def __init__(self, job_id: int):
+        self.job_id = job_id
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name=f"job-{job_id}-heartbeat", daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stopped.set()
+        self._thread.join()
+        return False
+
+    def _loop(self):
+        while not self._stopped.wait(JOB_HEARTBEAT_SECONDS):
+            db = SessionLocal()
+            try:
+                db.query(models.Job).filter(
+                    models.Job.job_id == self.job_id,
+                    models.Job.status == STATUS_RUNNING
+                ).update({"heartbeat_at": datetime.utcnow()}, synchronize_session=False)
+                db.commit()
+            except Exception as e:
+                logger.warning(f"Не удалось обновить отметку задачи {self.job_id}: {e}")
+            finally:
+                db.close()
+
+# Задача наследует гостиницу пользователя из сессии запроса
+def enqueue(db: Session, kind: str, params: dict = None, max_attempts: int = JOB_MAX_ATTEMPTS):
+    if kind not in _handlers:
+        raise ValueError(f"Неизвестный тип задачи: {kind}")
+    job = models.Job(
+        kind=kind,
+        status=STATUS_QUEUED,
+        params=json.dumps(params or {}, ensure_ascii=False, default=str),
+        hotel_id=tenancy.current_hotel_id(db),
+        max_attempts=max_attempts,
+        run_after=datetime.utcnow()
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    runner.wake()
+    return job
+
+# Задача, поставленная пользователем другой гостиницы, не видна
+def get_job(db: Session, job_id: int):
+    job = db.get(models.Job, job_id)
+    hotel_id = tenancy.current_hotel_id(db)
+    if job is None or (hotel_id is not None and job.hotel_id != hotel_id):
+        return None
+    return job
+
+def job_status(job: models.Job) -> dict:
+    return {
+        "job_id": job.job_id,
+        "kind": job.kind,
+        "status": job.status,
+        "progress": job.progress or 0,
+        "message": job.message,
+        "attempts": job.attempts or 0,
+        "result": json.loads(job.result) if job.result else None,
+        "error": job.error,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+    }
+
+# Захват следующей задачи. Строка блокируется с SKIP LOCKED, поэтому несколько
+# исполнителей (потоков и процессов) никогда не берут одну задачу дважды
+def claim_next(db: Session, worker_id: str):
+    now = datetime.utcnow()
+    job = db.query(models.Job).filter(or_(
+        and_(models.Job.status == STATUS_QUEUED, models.Job.run_after <= now),
+        and_(
+            models.Job.status == STATUS_RUNNING,
+            models.Job.heartbeat_at < now - timedelta(minutes=JOB_STALE_MINUTES)
+        )
+    )).order_by(models.Job.job_id).with_for_update(skip_locked=True).first()
+    if job is None:
+        db.rollback()
+        return None
+    job.status = STATUS_RUNNING
+    job.attempts = (job.attempts or 0) + 1
+    job.locked_by = worker_id
+    job.started_at = now
+    job.heartbeat_at = now
+    job_id = job.job_id
+    db.commit()
+    return job_id
+
+def run_job(job_id: int):
+    db = SessionLocal()
+    try:
+        job = db.get(models.Job, job_id)
+        # Обработчик работает с данными гостиницы пользователя, поставившего задачу
+        tenancy.scope_session(db, job.hotel_id)
+        func = _handlers.get(job.kind)
+        params = json.loads(job.params or "{}")
+        try:
+            if func is None:
+                raise HTTPException(status_code=400, detail=f"Неизвестный тип задачи: {job.kind}")
+            with Heartbeat(job_id):
+                result = func(db, params, JobContext(job_id))
+        except Exception as e:
+            db.rollback()
+            job = db.get(models.Job, job_id)
+            # Ошибки в данных (HTTPException) повторять бессмысленно
+            retry = not isinstance(e, HTTPException) and job.attempts < job.max_attempts
+            job.error = e.detail if isinstance(e, HTTPException) else str(e)
+            if retry:
+                job.status = STATUS_QUEUED
+                job.run_after = datetime.utcnow() + timedelta(seconds=JOB_RETRY_DELAY_SECONDS * 2 ** (job.attempts - 1))
+                logger.warning(f"Задача {job_id} ({job.kind}) завершилась с ошибкой, будет повторена: {e}")
+            else:
+                job.status = STATUS_FAILED
+                job.finished_at = datetime.utcnow()
+                logger.error(f"Задача {job_id} ({job.kind}) завершилась с ошибкой: {e}")
+            db.commit()
+            return
+
+        job = db.get(models.Job, job_id)
+        job.status = STATUS_SUCCEEDED
+        job.progress = 100
+        job.result = json.dumps(result, ensure_ascii=False, default=str)
+        job.error = None
+        job.finished_at = datetime.utcnow()
+        db.commit()
+    finally:
+        db.close()
+
+# Выполнение всех готовых задач в текущем потоке (для тестов и ручного запуска)
+def run_pending(worker_id: str = "inline"):
+    count = 0
+    while True:
+        db = SessionLocal()
+        try:
+            job_id = claim_next(db, worker_id)
+        finally:
+            db.close()
+        if job_id is None:
+            return count
+        run_job(job_id)
+        count += 1
+
+# Исполнитель: JOB_CONCURRENCY потоков, каждый берёт задачи из очереди по одной
+class JobRunner:
+    def __init__(self, concurrency: int):
+        self.concurrency = concurrency
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._threads = []
+
+    def start(self):
+        if self._threads:
+            return
+        self._stopped.clear()
+        for number in range(self.concurrency):
+            thread = threading.Thread(target=self._loop, name=f"jobs-{number}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"Исполнитель задач запущен ({self.concurrency} потоков)")
+
+    # Потоки завершаются после текущей задачи; ожидание ограничено JOB_STOP_TIMEOUT_SECONDS
+    def stop(self):
+        self._stopped.set()
+        self._wake.set()
+        deadline = time.monotonic() + JOB_STOP_TIMEOUT_SECONDS
+        for thread in self._threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+        alive = [thread.name for thread in self._threads if thread.is_alive()]
+        if alive:
+            logger.warning(f"Задачи не завершились до остановки исполнителя: {', '.join(alive)}")
+        self._threads = []
+
+    # Новая задача в очереди: свободный поток берёт её без ожидания опроса
+    def wake(self):
+        self._wake.set()
+
+    def _loop(self):
+        while not self._stopped.is_set():
+            db = SessionLocal()
+            try:
+                job_id = claim_next(db, self.worker_id)
+            except Exception as e:
+                logger.error(f"Ошибка при получении задачи из очереди: {e}")
+                job_id = None
+            finally:
+                db.close()
+
+            if job_id is None:
+                self._wake.wait(JOB_POLL_SECONDS)
+                self._wake.clear()
+                continue
+            try:
+                run_job(job_id)
+            except Exception as e:
+                logger.error(f"Ошибка при выполнении задачи {job_id}: {e}")
+
+runner = JobRunner(JOB_CONCURRENCY)
+
+# Отдельный процесс исполнителя: python jobs.py worker
+if __name__ == "__main__":
+    # Модуль импортируется под своим именем, чтобы обработчики из tasks.py
+    # регистрировались в том же реестре, с которым работает исполнитель
+    import jobs
+    import tasks
+    if len(sys.argv) < 2 or sys.argv[1] != "worker":
+        logger.error("Использование: python jobs.py worker")
+        sys.exit(1)
+    jobs.runner.start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        jobs.runner.stop()
@@ -1,13 +1,21 @@
-from fastapi import FastAPI, Depends, HTTPException, status, Request, Response, Query
-from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, Depends, HTTPException, status, Request, Response, Query, Header
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse
+from fastapi.encoders import jsonable_encoder
 from sqlalchemy.orm import Session
+from sqlalchemy import event
+from sqlalchemy.orm.exc import StaleDataError
+from sqlalchemy.exc import OperationalError
 from typing import List, Optional
-import models, schemas, crud
-from database import engine, SessionLocal
+import models, schemas, crud, analytics, etl, events, partitions, pricing, sync, jobs, tasks, admission, metrics, middleware, profiling, querylog, coalesce, inventory, batch, exports, tenancy, dedupe, budgets, migrations
+from idempotency import IdempotentRequest, idempotent_request
+from database import engine, SessionLocal, get_read_session
 import uvicorn
 import logging
 import traceback
+import asyncio
+import json
+import os
+import time
 from datetime import date, timedelta, datetime
 from fastapi.security import OAuth2PasswordRequestForm
 
@@ -19,6 +27,27 @@ logger.setLevel(logging.DEBUG)
 # Создание таблиц
 models.Base.metadata.create_all(bind=engine)
 
+# Колонки, добавленные в существующие таблицы (см. migrations.py)
+with engine.begin() as conn:
+    migrations.migrate(conn)
+
+# Колонки hotel_id и индексы по гостиницам в базе, созданной до их появления (см. tenancy.py)
+with engine.begin() as conn:
+    tenancy.migrate(conn)
+
+# Ключ витрины уборок с гостиницей в базе, созданной до его изменения (см. etl.py)
+with engine.begin() as conn:
+    etl.migrate(conn)
+
+# Ключи поиска дублей клиентов (см. dedupe.py)
+with engine.begin() as conn:
+    dedupe.migrate(conn)
+
+# Секции таблиц bookings и cleaning_logs на текущий месяц и горизонт вперёд
+if engine.dialect.name == "postgresql":
+    with engine.begin() as conn:
+        partitions.ensure_partitions(conn)
+
 # Создание гостиницы по умолчанию, если она не существует
 def create_default_hotel():
     db = SessionLocal()
@@ -45,47 +74,175 @@ create_default_hotel()
 # Создание приложения FastAPI
 app = FastAPI(title="InnControl API", description="API для системы администрирования гостиниц")
 
-# Настройка CORS для работы с фронтендом
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],  # Разрешаем запросы с любого источника
-    allow_credentials=False,  # Не используем credentials, чтобы разрешить '*' для origins
-    allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS", "PATCH"],
-    allow_headers=["*"],  # Разрешаем любые заголовки
-    expose_headers=["Content-Length", "Access-Control-Allow-Origin"],
-    max_age=600,  # Время кеширования предзапросов (в секундах)
-)
-
-# Специальный мидлвар для добавления CORS заголовков к каждому ответу
-@app.middleware("http")
-async def add_cors_headers(request, call_next):
-    response = await call_next(request)
-    response.headers["Access-Control-Allow-Origin"] = "*"
-    response.headers["Access-Control-Allow-Methods"] = "GET, POST, PUT, DELETE, OPTIONS, PATCH"
-    response.headers["Access-Control-Allow-Headers"] = "*"
-    return response
+# Счётчик SQL-запросов каждого HTTP-запроса и поиск N+1 (см. querylog.py)
+app.add_middleware(querylog.QueryInspectorMiddleware)
+
+# Профилирование отдельных запросов по заголовку X-Profile или выборке (см. profiling.py).
+# Находится внутри контроля нагрузки: отклонённые запросы не профилируются
+app.add_middleware(profiling.ProfilingMiddleware)
+
+# Контроль нагрузки: лимиты одновременных запросов по классам и частоты по клиентам
+# (см. admission.py)
+app.add_middleware(admission.AdmissionMiddleware)
+
+# Объединение одинаковых одновременных GET-запросов (см. coalesce.py). Снаружи контроля
+# нагрузки: ожидающие копию ответа не занимают места в очереди
+app.add_middleware(coalesce.CoalescingMiddleware)
+
+# CORS, X-Request-ID, Server-Timing и gzip (см. middleware.py). Добавляется последним,
+# чтобы быть внешним слоем: отказы 429/503 тоже получают CORS-заголовки,
+# а предзапросы не доходят до контроля нагрузки
+app.add_middleware(middleware.HTTPMiddleware)
 
 # Тестовый эндпоинт для проверки CORS
 @app.get("/api-test")
 def test_api():
     return {"message": "API работает корректно!", "cors": "настроен"}
 
-# Зависимость для получения сессии БД
-def get_db():
-    db = SessionLocal()
+# Чтение своих записей: ответ на запрос, изменивший данные, несёт заголовок
+# X-Last-Write со временем изменения (см. middleware.py). Клиент возвращает его
+# в следующих запросах, и в течение READ_YOUR_WRITES_SECONDS после изменения
+# чтение идёт с основного сервера, пока реплика его не догонит. Время хранит
+# клиент, поэтому правило действует во всех процессах API. Заголовок
+# "X-Read-Primary: 1" явно направляет чтение на основной сервер
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", "5"))
+
+# Отметка об изменении данных: сессия запроса, кроме GET, хранит в info состояние
+# запроса (scope["state"]), и первый flush с изменениями отмечает в нём запись
+@event.listens_for(Session, "after_flush")
+def remember_write(session, flush_context):
+    request_state = session.info.get(middleware.WRITE_STATE)
+    if request_state is not None:
+        request_state[middleware.WRITE_STATE] = True
+
+def wrote_recently(request: Request) -> bool:
+    try:
+        written_at = float(request.headers.get(middleware.LAST_WRITE_HEADER, ""))
+    except ValueError:
+        return False
+    return time.time() - written_at < READ_YOUR_WRITES_SECONDS
+
+# Зависимость для получения сессии БД (основной сервер, для изменений).
+# Запросы сессии ограничены гостиницей пользователя (см. tenancy.py)
+# и бюджетом времени и строк своего класса запросов (см. budgets.py)
+def get_db(request: Request):
+    hotel_id = tenancy.request_hotel_id(request)
+    db = tenancy.scope_session(SessionLocal(), hotel_id)
+    if request.method != "GET":
+        db.info[middleware.WRITE_STATE] = request.scope.setdefault("state", {})
+    try:
+        budgets.apply(db, request)
+        yield db
+    finally:
+        db.close()
+
+# Зависимость для эндпоинтов только на чтение: реплика, если она настроена,
+# не отстаёт и клиент недавно ничего не менял
+def get_read_db(request: Request):
+    hotel_id = tenancy.request_hotel_id(request)
+    use_primary = request.headers.get("x-read-primary") == "1" or wrote_recently(request)
+    db = tenancy.scope_session(get_read_session(use_primary), hotel_id)
+    try:
+        budgets.apply(db, request)
+        yield db
+    finally:
+        db.close()
+
+# Синхронизация читает с основного сервера: на отстающей реплике изменения,
+# сделанные до выдачи курсора, могли бы ещё отсутствовать и потеряться
+def get_sync_db(request: Request):
+    hotel_id = tenancy.request_hotel_id(request)
+    db = tenancy.scope_session(get_read_session(use_primary=True), hotel_id)
     try:
+        budgets.apply(db, request)
         yield db
     finally:
         db.close()
 
+# Оптимистическая блокировка: версия записи отдаётся в заголовке ETag,
+# при изменении клиент передаёт её в If-Match. Если запись успела измениться,
+# возвращается 412 вместо молчаливой перезаписи чужих правок
+def etag_for(obj) -> str:
+    return f'"{obj.version}"'
+
+def check_if_match(if_match: Optional[str], obj):
+    if if_match is None or if_match.strip() == "*":
+        return
+    versions = [tag.strip().replace("W/", "", 1).strip('"') for tag in if_match.split(",")]
+    if str(obj.version) not in versions:
+        raise HTTPException(
+            status_code=status.HTTP_412_PRECONDITION_FAILED,
+            detail="Запись была изменена другим пользователем. Обновите данные и повторите попытку"
+        )
+
+# Конфликт версий, обнаруженный при сохранении (параллельное изменение той же записи)
+@app.exception_handler(StaleDataError)
+async def stale_data_handler(request: Request, exc: StaleDataError):
+    return JSONResponse(
+        status_code=status.HTTP_412_PRECONDITION_FAILED,
+        content={"detail": "Запись была изменена другим пользователем. Обновите данные и повторите попытку"}
+    )
+
+# SQL-запрос отменён по истечении бюджета времени (statement_timeout, см. budgets.py)
+@app.exception_handler(OperationalError)
+async def query_timeout_handler(request: Request, exc: OperationalError):
+    if not budgets.is_timeout(exc):
+        raise exc
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": budgets.timeout_detail(request)},
+        headers={"Retry-After": str(budgets.QUERY_TIMEOUT_RETRY_AFTER)}
+    )
+
+# Публикация изменений в ленту событий (/events): клиенты применяют изменения
+# к своим спискам вместо полной перезагрузки
+def notify_room(action: str, db_room):
+    events.publish("room", action, db_room.room_id, db_room.hotel_id,
+                   jsonable_encoder(schemas.Room.model_validate(db_room)))
+
+def notify_booking(db: Session, action: str, db_booking, room=None):
+    room = room or crud.get_room(db, room_id=db_booking.room_id)
+    events.publish("booking", action, db_booking.booking_id, db_booking.hotel_id,
+                   jsonable_encoder(schemas.Booking.model_validate(db_booking)))
+    # Бронирование могло изменить статус номера
+    if room is not None and action != "deleted":
+        notify_room("updated", room)
+
+def notify_cleaning_log(db: Session, action: str, db_log):
+    events.publish("cleaning_log", action, db_log.log_id, db_log.hotel_id,
+                   jsonable_encoder(schemas.CleaningLog.model_validate(db_log)))
+
+# Потоковая выдача больших списков в формате NDJSON (одна JSON-запись на строку).
+# Включается заголовком "Accept: application/x-ndjson"
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+def wants_ndjson(request: Request) -> bool:
+    return NDJSON_MEDIA_TYPE in request.headers.get("accept", "")
+
+def ndjson_response(db: Session, query_func, schema, **params):
+    # Поток использует собственную сессию на том же сервере, что и запрос: она живёт,
+    # пока клиент читает ответ, и закрывается сразу после отправки последней строки.
+    # Ограничение по гостинице пользователя и бюджет запроса переносятся в неё
+    bind = db.get_bind()
+    hotel_id = tenancy.current_hotel_id(db)
+    source = db
+    def generate():
+        db = budgets.copy_budget(source, tenancy.scope_session(Session(bind=bind), hotel_id))
+        try:
+            for row in query_func(db, **params):
+                yield schema.model_validate(row).model_dump_json() + "\n"
+        finally:
+            db.close()
+    return StreamingResponse(generate(), media_type=NDJSON_MEDIA_TYPE)
+
 # Эндпоинты для гостиниц
 @app.get("/hotels/", response_model=List[schemas.Hotel])
-def read_hotels(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+def read_hotels(skip: int = 0, limit: int = 100, db: Session = Depends(get_read_db)):
     hotels = crud.get_hotels(db, skip=skip, limit=limit)
     return hotels
 
 @app.get("/hotels/{hotel_id}", response_model=schemas.Hotel)
-def read_hotel(hotel_id: int, db: Session = Depends(get_db)):
+def read_hotel(hotel_id: int, db: Session = Depends(get_read_db)):
     db_hotel = crud.get_hotel(db, hotel_id=hotel_id)
     if db_hotel is None:
         raise HTTPException(status_code=404, detail="Гостиница не найдена")
@@ -97,12 +254,12 @@ def create_hotel(hotel: schemas.HotelCreate, db: Session = Depends(get_db)):
 
 # Эндпоинты для типов номеров
 @app.get("/room-types/", response_model=List[schemas.RoomType])
-def read_room_types(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+def read_room_types(skip: int = 0, limit: int = 100, db: Session = Depends(get_read_db)):
     room_types = crud.get_room_types(db, skip=skip, limit=limit)
     return room_types
 
 @app.get("/room-types/{type_id}", response_model=schemas.RoomType)
-def read_room_type(type_id: int, db: Session = Depends(get_db)):
+def read_room_type(type_id: int, db: Session = Depends(get_read_db)):
     db_room_type = crud.get_room_type(db, type_id=type_id)
     if db_room_type is None:
         raise HTTPException(status_code=404, detail="Тип номера не найден")
@@ -112,28 +269,70 @@ def read_room_type(type_id: int, db: Session = Depends(get_db)):
 def create_room_type(room_type: schemas.RoomTypeCreate, db: Session = Depends(get_db)):
     return crud.create_room_type(db=db, room_type=room_type)
 
+# Цены типа номера на даты (сезонные, по дням недели и т.п.)
+@app.get("/room-types/{type_id}/rates", response_model=List[schemas.RoomRate])
+def read_room_rates(type_id: int, start: str, end: str, db: Session = Depends(get_read_db)):
+    return crud.get_room_rates(db, type_id, parse_iso_date(start), parse_iso_date(end))
+
+@app.put("/room-types/{type_id}/rates", response_model=List[schemas.RoomRate])
+def update_room_rates(type_id: int, rates: List[schemas.RoomRateBase], db: Session = Depends(get_db)):
+    if crud.get_room_type(db, type_id=type_id) is None:
+        raise HTTPException(status_code=404, detail="Тип номера не найден")
+    return crud.set_room_rates(db, type_id, rates)
+
+@app.delete("/room-types/{type_id}/rates/{rate_date}", response_model=schemas.RoomRate)
+def delete_room_rate(type_id: int, rate_date: str, db: Session = Depends(get_db)):
+    return crud.delete_room_rate(db, type_id, parse_iso_date(rate_date))
+
+# Расчёт стоимости нескольких вариантов проживания по календарю цен
+@app.post("/quotes", response_model=List[schemas.Quote])
+def create_quotes(quote_request: schemas.QuoteRequest, db: Session = Depends(get_read_db)):
+    return crud.quote_stays(db, quote_request.stays)
+
+# Свободные номера по типам на каждую ночь периода [start, end) по таблице inventory:
+# одна строка на ночь и тип независимо от числа бронирований
+@app.get("/availability/types", response_model=List[schemas.TypeAvailability])
+def read_type_availability(start: str, end: str, hotel_id: Optional[int] = None, db: Session = Depends(get_read_db)):
+    start_date = parse_iso_date(start)
+    end_date = parse_iso_date(end)
+    if end_date <= start_date:
+        raise HTTPException(status_code=400, detail="Дата окончания должна быть позже даты начала")
+    crud.check_stay_length(start_date, end_date)
+    hotel_id = tenancy.resolve_hotel_id(tenancy.current_hotel_id(db), hotel_id)
+    return inventory.get_type_availability(db, start_date, end_date, hotel_id)
+
 # Эндпоинты для номеров
 @app.get("/rooms/", response_model=List[schemas.Room])
-def read_rooms(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+def read_rooms(skip: int = 0, limit: int = 100, db: Session = Depends(get_read_db)):
     rooms = crud.get_rooms(db, skip=skip, limit=limit)
     return rooms
 
 @app.get("/rooms/{room_id}", response_model=schemas.RoomWithDetails)
-def read_room(room_id: int, db: Session = Depends(get_db)):
+def read_room(room_id: int, response: Response, db: Session = Depends(get_read_db)):
     db_room = crud.get_room(db, room_id=room_id)
     if db_room is None:
         raise HTTPException(status_code=404, detail="Номер не найден")
+    response.headers["ETag"] = etag_for(db_room)
     return db_room
 
 @app.post("/rooms/", response_model=schemas.Room)
 def create_room(room: schemas.RoomCreate, db: Session = Depends(get_db)):
-    return crud.create_room(db=db, room=room)
+    db_room = crud.create_room(db=db, room=room)
+    notify_room("created", db_room)
+    return db_room
 
 @app.put("/rooms/{room_id}", response_model=schemas.Room)
-def update_room(room_id: int, room: schemas.RoomCreate, db: Session = Depends(get_db)):
+def update_room(
+    room_id: int,
+    room: schemas.RoomCreate,
+    response: Response,
+    if_match: Optional[str] = Header(None),
+    db: Session = Depends(get_db)
+):
     db_room = crud.get_room(db, room_id=room_id)
     if db_room is None:
         raise HTTPException(status_code=404, detail="Номер не найден")
+    check_if_match(if_match, db_room)
     
     # Обновляем поля номера
     db_room.hotel_id = room.hotel_id
@@ -146,8 +345,30 @@ def update_room(room_id: int, room: schemas.RoomCreate, db: Session = Depends(ge
     
     db.commit()
     db.refresh(db_room)
+    notify_room("updated", db_room)
+    response.headers["ETag"] = etag_for(db_room)
     return db_room
 
+# Одинаковое изменение нескольких номеров (гостиница, тип, этаж) в одной транзакции
+@app.patch("/rooms", response_model=schemas.BatchResult)
+def update_rooms(
+    rooms: schemas.RoomBatchUpdate,
+    idempotency: IdempotentRequest = Depends(idempotent_request),
+    db: Session = Depends(get_db)
+):
+    return idempotency.run(db, rooms, schemas.BatchResult, lambda: update_rooms_checked(db, rooms))
+
+def update_rooms_checked(db: Session, rooms: schemas.RoomBatchUpdate):
+    changes = rooms.model_dump(exclude={"room_ids"}, exclude_none=True)
+    if not changes:
+        raise HTTPException(status_code=400, detail="Не указаны изменяемые поля")
+    result, changed_rooms = batch.update_rooms(db, rooms.room_ids, changes)
+    events.publish_many([
+        ("room", "updated", room.room_id, room.hotel_id, jsonable_encoder(room))
+        for room in changed_rooms
+    ])
+    return result
+
 @app.delete("/rooms/{room_id}", response_model=schemas.Room)
 def delete_room(room_id: int, db: Session = Depends(get_db)):
     db_room = crud.get_room(db, room_id=room_id)
@@ -167,24 +388,25 @@ def delete_room(room_id: int, db: Session = Depends(get_db)):
     # Удаляем номер
     db.delete(db_room)
     db.commit()
+    notify_room("deleted", db_room)
     return db_room
 
 @app.get("/hotels/{hotel_id}/rooms/", response_model=List[schemas.Room])
-def read_hotel_rooms(hotel_id: int, db: Session = Depends(get_db)):
+def read_hotel_rooms(hotel_id: int, db: Session = Depends(get_read_db)):
     db_hotel = crud.get_hotel(db, hotel_id=hotel_id)
     if db_hotel is None:
         raise HTTPException(status_code=404, detail="Гостиница не найдена")
     return crud.get_rooms_by_hotel(db, hotel_id=hotel_id)
 
 @app.get("/hotels/{hotel_id}/employees/", response_model=List[schemas.Employee])
-def read_hotel_employees(hotel_id: int, db: Session = Depends(get_db)):
+def read_hotel_employees(hotel_id: int, db: Session = Depends(get_read_db)):
     db_hotel = crud.get_hotel(db, hotel_id=hotel_id)
     if db_hotel is None:
         raise HTTPException(status_code=404, detail="Гостиница не найдена")
     return crud.get_employees_by_hotel(db, hotel_id=hotel_id)
 
 @app.get("/available-rooms/", response_model=List[schemas.Room])
-def read_available_rooms(check_in_date: str, check_out_date: str, db: Session = Depends(get_db)):
+def read_available_rooms(check_in_date: str, check_out_date: str, db: Session = Depends(get_read_db)):
     from datetime import date, datetime
     
     try:
@@ -197,19 +419,58 @@ def read_available_rooms(check_in_date: str, check_out_date: str, db: Session =
 
 # Эндпоинты для клиентов
 @app.get("/clients/", response_model=List[schemas.Client])
-def read_clients(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+def read_clients(skip: int = 0, limit: int = 100, db: Session = Depends(get_read_db)):
     clients = crud.get_clients(db, skip=skip, limit=limit)
     return clients
 
+# Возможные дубли клиентов: by=passport - одинаковый номер паспорта после
+# нормализации, by=name - одинаковые фамилия и имя и почти совпадающий паспорт.
+# Следующая страница: after = key последней группы
+@app.get("/clients/duplicates", response_model=List[schemas.DuplicateGroup])
+def read_client_duplicates(
+    by: str = Query("passport", pattern="^(passport|name)$"),
+    after: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    db: Session = Depends(get_read_db)
+):
+    return dedupe.find_duplicates(db, by=by, after=after, limit=limit)
+
+# Объединение дублей: бронирования source_ids переносятся на target_id,
+# клиенты source_ids удаляются. Всё выполняется в одной транзакции
+@app.post("/clients/merge", response_model=schemas.ClientMergeResult)
+def merge_clients(
+    merge: schemas.ClientMerge,
+    idempotency: IdempotentRequest = Depends(idempotent_request),
+    db: Session = Depends(get_db)
+):
+    return idempotency.run(db, merge, schemas.ClientMergeResult, lambda: merge_clients_checked(db, merge))
+
+def merge_clients_checked(db: Session, merge: schemas.ClientMerge):
+    result, bookings = dedupe.merge_clients(db, merge.target_id, merge.source_ids)
+    events.publish_many([
+        ("booking", "updated", booking.booking_id, hotel_id, jsonable_encoder(booking))
+        for booking, hotel_id in bookings
+    ])
+    return result
+
 @app.get("/clients/{client_id}", response_model=schemas.Client)
-def read_client(client_id: int, db: Session = Depends(get_db)):
+def read_client(client_id: int, db: Session = Depends(get_read_db)):
     db_client = crud.get_client(db, client_id=client_id)
     if db_client is None:
         raise HTTPException(status_code=404, detail="Клиент не найден")
     return db_client
 
 @app.post("/clients/", response_model=schemas.Client)
-def create_client(client: schemas.ClientCreate, db: Session = Depends(get_db)):
+def create_client(
+    client: schemas.ClientCreate,
+    idempotency: IdempotentRequest = Depends(idempotent_request),
+    db: Session = Depends(get_db)
+):
+    return idempotency.run(db, client, schemas.Client, lambda: create_client_checked(db, client))
+
+# Повторно пришедший гость не заводится второй раз: 409 с ID существующего клиента
+def create_client_checked(db: Session, client: schemas.ClientCreate):
+    dedupe.check_duplicate(db, client.passport_number)
     return crud.create_client(db=db, client=client)
 
 @app.put("/clients/{client_id}", response_model=schemas.Client)
@@ -217,53 +478,36 @@ def update_client(client_id: int, client: schemas.ClientCreate, db: Session = De
     db_client = crud.get_client(db, client_id=client_id)
     if db_client is None:
         raise HTTPException(status_code=404, detail="Клиент не найден")
+    # Уже существующие дубли можно редактировать, пока не меняется номер паспорта
+    if dedupe.normalize_passport(client.passport_number) != db_client.passport_norm:
+        dedupe.check_duplicate(db, client.passport_number, exclude_client_id=client_id)
     
     # Обновляем поля клиента
     db_client.first_name = client.first_name
     db_client.last_name = client.last_name
     db_client.passport_number = client.passport_number
     db_client.city = client.city
+    if client.hotel_id is not None:
+        db_client.hotel_id = client.hotel_id
     
     db.commit()
     db.refresh(db_client)
     return db_client
 
-@app.delete("/clients/{client_id}", response_model=schemas.Client)
-def delete_client(client_id: int, db: Session = Depends(get_db)):
+# Удаление клиента вместе со всеми его бронированиями выполняется фоновой задачей:
+# ответ 202 содержит задачу, её состояние доступно через GET /jobs/{job_id}
+@app.delete("/clients/{client_id}", response_model=schemas.Job, status_code=status.HTTP_202_ACCEPTED)
+def delete_client(client_id: int, response: Response, db: Session = Depends(get_db)):
     db_client = crud.get_client(db, client_id=client_id)
     if db_client is None:
         raise HTTPException(status_code=404, detail="Клиент не найден")
     
-    # Получаем все бронирования клиента
-    client_bookings = crud.get_bookings_by_client(db, client_id=client_id)
-    
-    # Удаляем все бронирования клиента
-    for booking in client_bookings:
-        # Если номер был занят этим бронированием, обновляем его статус
-        room = crud.get_room(db, room_id=booking.room_id)
-        if room and room.status == "Занят":
-            # Проверяем, есть ли другие активные бронирования для этого номера
-            other_bookings = db.query(models.Booking).filter(
-                models.Booking.room_id == booking.room_id,
-                models.Booking.booking_id != booking.booking_id,
-                models.Booking.status.in_(["Активно", "Подтверждено"])
-            ).first()
-            
-            if not other_bookings:
-                room.status = "Свободен"
-                db.commit()
-        
-        # Удаляем бронирование
-        db.delete(booking)
-    
-    # Удаляем клиента
-    db.delete(db_client)
-    db.commit()
-    
-    return db_client
+    job = jobs.enqueue(db, "delete_client", {"client_id": client_id})
+    response.headers["Location"] = f"/jobs/{job.job_id}"
+    return jobs.job_status(job)
 
 @app.get("/clients/city/{city}", response_model=List[schemas.Client])
-def read_clients_by_city(city: str, skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+def read_clients_by_city(city: str, skip: int = 0, limit: int = 100, db: Session = Depends(get_read_db)):
     return crud.get_clients_by_city(db, city=city, skip=skip, limit=limit)
 
 # Эндпоинт для получения бронирований из БД с обработкой ошибок и фильтрацией
@@ -272,7 +516,7 @@ def read_bookings(
     skip: int = 0, 
     limit: int = 100, 
     status: Optional[str] = Query(None, description="Фильтр по статусу бронирования: Заселен, Подтверждено, Выселен, Отменено"),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     try:
         logger.info(f"Запрос бронирований из БД: skip={skip}, limit={limit}, status={status}")
@@ -288,20 +532,32 @@ def read_bookings(
         
         return bookings
     except Exception as e:
+        # Отмена по бюджету времени - не пустой список, а 503 (см. query_timeout_handler)
+        if budgets.is_timeout(e):
+            raise
         logger.error(f"Ошибка при получении бронирований из БД: {str(e)}")
         logger.error(traceback.format_exc())
         # В случае ошибки возвращаем пустой список вместо HTTP ошибки
         return []
 
 @app.get("/bookings/{booking_id}", response_model=schemas.BookingWithDetails)
-def read_booking(booking_id: int, db: Session = Depends(get_db)):
+def read_booking(booking_id: int, response: Response, db: Session = Depends(get_read_db)):
     db_booking = crud.get_booking(db, booking_id=booking_id)
     if db_booking is None:
         raise HTTPException(status_code=404, detail="Бронирование не найдено")
+    response.headers["ETag"] = etag_for(db_booking)
     return db_booking
 
 @app.post("/bookings/", response_model=schemas.Booking)
-def create_booking(booking: schemas.BookingCreate, db: Session = Depends(get_db)):
+def create_booking(
+    booking: schemas.BookingCreate,
+    idempotency: IdempotentRequest = Depends(idempotent_request),
+    db: Session = Depends(get_db)
+):
+    # Повтор запроса с тем же Idempotency-Key возвращает исходное бронирование
+    return idempotency.run(db, booking, schemas.Booking, lambda: create_booking_checked(db, booking))
+
+def create_booking_checked(db: Session, booking: schemas.BookingCreate):
     # Проверяем доступность номера
     try:
         # Проверяем, существует ли номер
@@ -315,36 +571,68 @@ def create_booking(booking: schemas.BookingCreate, db: Session = Depends(get_db)
             raise HTTPException(status_code=404, detail="Указанный клиент не найден")
             
         # Создаем бронирование
-        return crud.create_booking(db=db, booking=booking)
+        db_booking = crud.create_booking(db=db, booking=booking)
+        notify_booking(db, "created", db_booking)
+        return db_booking
     except HTTPException as e:
         # Пробрасываем исключение дальше
         raise e
     except Exception as e:
+        if budgets.is_timeout(e):
+            raise
         # Логируем непредвиденную ошибку
         print(f"Ошибка при создании бронирования: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Не удалось создать бронирование: {str(e)}")
 
+# Автоматический подбор номеров для одиночного или группового бронирования:
+# по типу номера (или вместимости), датам и количеству. Подбор и создание всех
+# бронирований выполняются в одной транзакции, без повторных попыток при конфликтах
+@app.post("/bookings/allocate", response_model=schemas.BookingAllocation)
+def allocate_bookings(
+    allocation: schemas.BookingAllocationRequest,
+    idempotency: IdempotentRequest = Depends(idempotent_request),
+    db: Session = Depends(get_db)
+):
+    return idempotency.run(db, allocation, schemas.BookingAllocation, lambda: allocate_bookings_checked(db, allocation))
+
+def allocate_bookings_checked(db: Session, allocation: schemas.BookingAllocationRequest):
+    result, rooms = crud.allocate_rooms(db, allocation)
+    items = [
+        ("booking", "created", booking.booking_id, booking.hotel_id, jsonable_encoder(booking))
+        for booking in result.bookings
+    ]
+    items += [("room", "updated", room.room_id, room.hotel_id, jsonable_encoder(room)) for room in rooms]
+    events.publish_many(items)
+    return result
+
 @app.put("/bookings/{booking_id}", response_model=schemas.Booking)
-def update_booking(booking_id: int, booking: schemas.BookingCreate, db: Session = Depends(get_db)):
+def update_booking(
+    booking_id: int,
+    booking: schemas.BookingCreate,
+    response: Response,
+    if_match: Optional[str] = Header(None),
+    db: Session = Depends(get_db)
+):
     db_booking = crud.get_booking(db, booking_id=booking_id)
     if db_booking is None:
         raise HTTPException(status_code=404, detail="Бронирование не найдено")
+    check_if_match(if_match, db_booking)
     
     # Проверяем, не конфликтует ли новое бронирование с существующими
     if booking.room_id != db_booking.room_id or booking.check_in_date != db_booking.check_in_date or booking.check_out_date != db_booking.check_out_date:
-        conflicts = db.query(models.Booking).filter(
-            models.Booking.room_id == booking.room_id,
-            models.Booking.booking_id != booking_id,
-            models.Booking.check_in_date <= booking.check_out_date,
-            models.Booking.check_out_date >= booking.check_in_date,
-            models.Booking.status.notin_(["Отменено", "Выселен"])
-        ).first()
+        crud.check_stay_length(booking.check_in_date, booking.check_out_date)
+        conflicts = crud.find_booking_conflict(
+            db, booking.room_id, booking.check_in_date, booking.check_out_date, exclude_booking_id=booking_id
+        )
         
         if conflicts:
             raise HTTPException(
                 status_code=400,
                 detail="Номер уже забронирован на указанные даты"
             )
+        
+        # Стоимость пересчитывается только при смене номера или дат
+        db_booking.total_price = pricing.booking_total(db, booking.room_id, booking.check_in_date, booking.check_out_date)
     
     # Сохраняем старый ID номера для обновления статуса
     old_room_id = db_booking.room_id
@@ -361,15 +649,26 @@ def update_booking(booking_id: int, booking: schemas.BookingCreate, db: Session
     
     # Если изменился номер, обновляем статусы обоих номеров
     if old_room_id != booking.room_id:
-        crud.update_room_status_based_on_bookings(db, old_room_id)
+        old_room = crud.update_room_status_based_on_bookings(db, old_room_id)
+        notify_room("updated", old_room)
     
     # Обновляем статус нового/текущего номера
-    crud.update_room_status_based_on_bookings(db, booking.room_id)
+    room = crud.update_room_status_based_on_bookings(db, booking.room_id)
+    notify_booking(db, "updated", db_booking, room)
     
+    response.headers["ETag"] = etag_for(db_booking)
     return db_booking
 
 @app.put("/bookings/{booking_id}/status", response_model=schemas.Booking)
-def update_booking_status(booking_id: int, status: schemas.BookingStatusUpdate, db: Session = Depends(get_db)):
+def update_booking_status(
+    booking_id: int,
+    status: schemas.BookingStatusUpdate,
+    idempotency: IdempotentRequest = Depends(idempotent_request),
+    db: Session = Depends(get_db)
+):
+    return idempotency.run(db, status, schemas.Booking, lambda: set_booking_status(db, booking_id, status))
+
+def set_booking_status(db: Session, booking_id: int, status: schemas.BookingStatusUpdate):
     db_booking = crud.get_booking(db, booking_id=booking_id)
     if db_booking is None:
         raise HTTPException(status_code=404, detail="Бронирование не найдено")
@@ -380,10 +679,31 @@ def update_booking_status(booking_id: int, status: schemas.BookingStatusUpdate,
     db.refresh(db_booking)
     
     # Обновляем статус номера в зависимости от статуса бронирования и текущей даты
-    crud.update_room_status_based_on_bookings(db, db_booking.room_id)
+    room = crud.update_room_status_based_on_bookings(db, db_booking.room_id)
+    notify_booking(db, "updated", db_booking, room)
     
     return db_booking
 
+# Смена статуса нескольких бронирований (например, выселение группы) в одной транзакции.
+# Статусы затронутых номеров пересчитываются один раз
+@app.patch("/bookings/status", response_model=schemas.BatchResult)
+def update_booking_statuses(
+    statuses: schemas.BookingStatusBatch,
+    idempotency: IdempotentRequest = Depends(idempotent_request),
+    db: Session = Depends(get_db)
+):
+    return idempotency.run(db, statuses, schemas.BatchResult, lambda: set_booking_statuses(db, statuses))
+
+def set_booking_statuses(db: Session, statuses: schemas.BookingStatusBatch):
+    result, bookings, rooms = batch.set_booking_statuses(db, statuses.booking_ids, statuses.status)
+    items = [
+        ("booking", "updated", booking.booking_id, hotel_id, jsonable_encoder(booking))
+        for booking, hotel_id in bookings
+    ]
+    items += [("room", "updated", room.room_id, room.hotel_id, jsonable_encoder(room)) for room in rooms]
+    events.publish_many(items)
+    return result
+
 @app.delete("/bookings/{booking_id}", response_model=schemas.Booking)
 def delete_booking(booking_id: int, db: Session = Depends(get_db)):
     db_booking = crud.get_booking(db, booking_id=booking_id)
@@ -397,32 +717,36 @@ def delete_booking(booking_id: int, db: Session = Depends(get_db)):
     db.commit()
     
     # Обновляем статус номера после удаления бронирования
-    crud.update_room_status_based_on_bookings(db, room_id)
+    room = crud.update_room_status_based_on_bookings(db, room_id)
+    notify_booking(db, "deleted", db_booking, room)
+    notify_room("updated", room)
     
     return db_booking
 
 @app.get("/clients/{client_id}/bookings/", response_model=List[schemas.Booking])
-def read_client_bookings(client_id: int, db: Session = Depends(get_db)):
+def read_client_bookings(client_id: int, db: Session = Depends(get_read_db)):
     db_client = crud.get_client(db, client_id=client_id)
     if db_client is None:
         raise HTTPException(status_code=404, detail="Клиент не найден")
     return crud.get_bookings_by_client(db, client_id=client_id)
 
 @app.get("/rooms/{room_id}/bookings/", response_model=List[schemas.Booking])
-def read_room_bookings(room_id: int, db: Session = Depends(get_db)):
+def read_room_bookings(room_id: int, request: Request, db: Session = Depends(get_read_db)):
     db_room = crud.get_room(db, room_id=room_id)
     if db_room is None:
         raise HTTPException(status_code=404, detail="Номер не найден")
+    if wants_ndjson(request):
+        return ndjson_response(db, crud.iter_bookings_by_room, schemas.Booking, room_id=room_id)
     return crud.get_bookings_by_room(db, room_id=room_id)
 
 # Эндпоинты для сотрудников
 @app.get("/employees/", response_model=List[schemas.Employee])
-def read_employees(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+def read_employees(skip: int = 0, limit: int = 100, db: Session = Depends(get_read_db)):
     employees = crud.get_employees(db, skip=skip, limit=limit)
     return employees
 
 @app.get("/employees/{employee_id}", response_model=schemas.Employee)
-def read_employee(employee_id: int, db: Session = Depends(get_db)):
+def read_employee(employee_id: int, db: Session = Depends(get_read_db)):
     db_employee = crud.get_employee(db, employee_id=employee_id)
     if db_employee is None:
         raise HTTPException(status_code=404, detail="Сотрудник не найден")
@@ -468,8 +792,16 @@ def update_employee(employee_id: int, employee: schemas.EmployeeCreate, db: Sess
     return db_employee
 
 @app.put("/employees/{employee_id}/status/", response_model=schemas.Employee)
-def update_employee_status(employee_id: int, status: schemas.EmployeeStatusUpdate, db: Session = Depends(get_db)):
-    return crud.update_employee_status(db, employee_id=employee_id, status=status.status)
+def update_employee_status(
+    employee_id: int,
+    status: schemas.EmployeeStatusUpdate,
+    idempotency: IdempotentRequest = Depends(idempotent_request),
+    db: Session = Depends(get_db)
+):
+    return idempotency.run(
+        db, status, schemas.Employee,
+        lambda: crud.update_employee_status(db, employee_id=employee_id, status=status.status)
+    )
 
 @app.delete("/employees/{employee_id}", response_model=schemas.Employee)
 def delete_employee(employee_id: int, db: Session = Depends(get_db)):
@@ -496,15 +828,16 @@ def delete_employee(employee_id: int, db: Session = Depends(get_db)):
 
 # Эндпоинты для расписания уборок
 @app.get("/cleaning-schedules/", response_model=List[schemas.CleaningSchedule])
-def read_cleaning_schedules(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+def read_cleaning_schedules(skip: int = 0, limit: int = 100, db: Session = Depends(get_read_db)):
     schedules = crud.get_cleaning_schedules_with_details(db, skip=skip, limit=limit)
     return schedules
 
 @app.get("/cleaning-schedules/{schedule_id}", response_model=schemas.CleaningScheduleWithDetails)
-def read_cleaning_schedule(schedule_id: int, db: Session = Depends(get_db)):
+def read_cleaning_schedule(schedule_id: int, response: Response, db: Session = Depends(get_read_db)):
     db_schedule = crud.get_cleaning_schedule(db, schedule_id=schedule_id)
     if db_schedule is None:
         raise HTTPException(status_code=404, detail="Расписание не найдено")
+    response.headers["ETag"] = etag_for(db_schedule)
     return db_schedule
 
 @app.delete("/cleaning-schedules/{schedule_id}", response_model=schemas.CleaningSchedule)
@@ -522,11 +855,45 @@ def delete_cleaning_schedule(schedule_id: int, db: Session = Depends(get_db)):
 def create_cleaning_schedule(schedule: schemas.CleaningScheduleCreate, db: Session = Depends(get_db)):
     return crud.create_cleaning_schedule(db=db, schedule=schedule)
 
+# Автоматическое распределение уборки этажей на дату между активными сотрудниками
+# с учётом выездов и продолжающихся проживаний. Создаёт записи журнала уборок
+@app.post("/cleaning-schedules/optimize", response_model=schemas.CleaningPlan)
+def optimize_cleaning_schedule(
+    date: str,
+    hotel_id: Optional[int] = None,
+    idempotency: IdempotentRequest = Depends(idempotent_request),
+    db: Session = Depends(get_db)
+):
+    cleaning_date = parse_iso_date(date)
+    hotel_id = tenancy.resolve_hotel_id(tenancy.current_hotel_id(db), hotel_id)
+    # Этажи и сотрудники распределяются в пределах одной гостиницы
+    if hotel_id is None:
+        raise HTTPException(status_code=400, detail="Укажите гостиницу (hotel_id)")
+    return idempotency.run(
+        db, {"date": cleaning_date, "hotel_id": hotel_id}, schemas.CleaningPlan,
+        lambda: optimize_cleaning_checked(db, cleaning_date, hotel_id)
+    )
+
+def optimize_cleaning_checked(db: Session, cleaning_date, hotel_id: int):
+    plan = crud.optimize_cleaning_assignments(db, cleaning_date, hotel_id)
+    events.publish_many(
+        ("cleaning_log", "created", log.log_id, log.hotel_id, jsonable_encoder(log))
+        for log in plan.logs
+    )
+    return plan
+
 @app.put("/cleaning-schedules/{schedule_id}", response_model=schemas.CleaningSchedule)
-def update_cleaning_schedule(schedule_id: int, schedule: schemas.CleaningScheduleCreate, db: Session = Depends(get_db)):
+def update_cleaning_schedule(
+    schedule_id: int,
+    schedule: schemas.CleaningScheduleCreate,
+    response: Response,
+    if_match: Optional[str] = Header(None),
+    db: Session = Depends(get_db)
+):
     db_schedule = crud.get_cleaning_schedule(db, schedule_id=schedule_id)
     if db_schedule is None:
         raise HTTPException(status_code=404, detail="Расписание не найдено")
+    check_if_match(if_match, db_schedule)
     
     # Обновляем поля расписания
     db_schedule.employee_id = schedule.employee_id
@@ -535,49 +902,73 @@ def update_cleaning_schedule(schedule_id: int, schedule: schemas.CleaningSchedul
     
     db.commit()
     db.refresh(db_schedule)
+    response.headers["ETag"] = etag_for(db_schedule)
     return db_schedule
 
 @app.get("/employees/{employee_id}/cleaning-schedules/", response_model=List[schemas.CleaningSchedule])
-def read_employee_cleaning_schedules(employee_id: int, db: Session = Depends(get_db)):
+def read_employee_cleaning_schedules(employee_id: int, db: Session = Depends(get_read_db)):
     db_employee = crud.get_employee(db, employee_id=employee_id)
     if db_employee is None:
         raise HTTPException(status_code=404, detail="Сотрудник не найден")
     return crud.get_cleaning_schedules_by_employee(db, employee_id=employee_id)
 
 @app.get("/cleaning-schedules/day/{day}/", response_model=List[schemas.CleaningSchedule])
-def read_cleaning_schedules_by_day(day: str, db: Session = Depends(get_db)):
+def read_cleaning_schedules_by_day(day: str, db: Session = Depends(get_read_db)):
     return crud.get_cleaning_schedules_by_day_with_details(db, day_of_week=day)
 
 # Эндпоинты для журнала уборок
 @app.get("/cleaning-logs/", response_model=List[schemas.CleaningLog])
-def read_cleaning_logs(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+def read_cleaning_logs(skip: int = 0, limit: int = 100, db: Session = Depends(get_read_db)):
     logs = crud.get_cleaning_logs(db, skip=skip, limit=limit)
     return logs
 
 @app.get("/cleaning-logs/{log_id}", response_model=schemas.CleaningLogWithDetails)
-def read_cleaning_log(log_id: int, db: Session = Depends(get_db)):
+def read_cleaning_log(log_id: int, response: Response, db: Session = Depends(get_read_db)):
     db_log = crud.get_cleaning_log(db, log_id=log_id)
     if db_log is None:
         raise HTTPException(status_code=404, detail="Запись не найдена")
+    response.headers["ETag"] = etag_for(db_log)
     return db_log
 
 @app.post("/cleaning-logs/", response_model=schemas.CleaningLog)
-def create_cleaning_log(log: schemas.CleaningLogCreate, db: Session = Depends(get_db)):
-    # Проверяем, нет ли уже записей по этому этажу на эту дату
-    existing_logs = crud.get_cleaning_logs_by_date_and_floor(db, cleaning_date=log.cleaning_date, floor_id=log.floor_id)
+def create_cleaning_log(
+    log: schemas.CleaningLogCreate,
+    idempotency: IdempotentRequest = Depends(idempotent_request),
+    db: Session = Depends(get_db)
+):
+    return idempotency.run(db, log, schemas.CleaningLog, lambda: create_cleaning_log_checked(db, log))
+
+def create_cleaning_log_checked(db: Session, log: schemas.CleaningLogCreate):
+    employee = crud.get_employee(db, employee_id=log.employee_id)
+    if employee is None:
+        raise HTTPException(status_code=404, detail="Сотрудник не найден")
+    
+    # Проверяем, нет ли уже записей по этому этажу гостиницы на эту дату
+    existing_logs = crud.get_cleaning_logs_by_date_and_floor(
+        db, cleaning_date=log.cleaning_date, floor_id=log.floor_id, hotel_id=employee.hotel_id
+    )
     if existing_logs:
         raise HTTPException(
             status_code=400, 
             detail="На этот этаж уже назначен другой сотрудник в этот день"
         )
     
-    return crud.create_cleaning_log(db=db, log=log)
+    db_log = crud.create_cleaning_log(db=db, log=log)
+    notify_cleaning_log(db, "created", db_log)
+    return db_log
 
 @app.put("/cleaning-logs/{log_id}", response_model=schemas.CleaningLog)
-def update_cleaning_log(log_id: int, log: schemas.CleaningLogCreate, db: Session = Depends(get_db)):
+def update_cleaning_log(
+    log_id: int,
+    log: schemas.CleaningLogCreate,
+    response: Response,
+    if_match: Optional[str] = Header(None),
+    db: Session = Depends(get_db)
+):
     db_log = crud.get_cleaning_log(db, log_id=log_id)
     if db_log is None:
         raise HTTPException(status_code=404, detail="Запись не найдена")
+    check_if_match(if_match, db_log)
     
     # Обновляем поля журнала уборок
     db_log.floor_id = log.floor_id
@@ -587,10 +978,20 @@ def update_cleaning_log(log_id: int, log: schemas.CleaningLogCreate, db: Session
     
     db.commit()
     db.refresh(db_log)
+    notify_cleaning_log(db, "updated", db_log)
+    response.headers["ETag"] = etag_for(db_log)
     return db_log
 
 @app.put("/cleaning-logs/{log_id}/status", response_model=schemas.CleaningLog)
-def update_cleaning_log_status(log_id: int, status: schemas.CleaningLogStatusUpdate, db: Session = Depends(get_db)):
+def update_cleaning_log_status(
+    log_id: int,
+    status: schemas.CleaningLogStatusUpdate,
+    idempotency: IdempotentRequest = Depends(idempotent_request),
+    db: Session = Depends(get_db)
+):
+    return idempotency.run(db, status, schemas.CleaningLog, lambda: set_cleaning_log_status(db, log_id, status))
+
+def set_cleaning_log_status(db: Session, log_id: int, status: schemas.CleaningLogStatusUpdate):
     db_log = crud.get_cleaning_log(db, log_id=log_id)
     if db_log is None:
         raise HTTPException(status_code=404, detail="Запись не найдена")
@@ -598,6 +999,7 @@ def update_cleaning_log_status(log_id: int, status: schemas.CleaningLogStatusUpd
     db_log.status = status.status
     db.commit()
     db.refresh(db_log)
+    notify_cleaning_log(db, "updated", db_log)
     return db_log
 
 @app.delete("/cleaning-logs/{log_id}", response_model=schemas.CleaningLog)
@@ -609,24 +1011,27 @@ def delete_cleaning_log(log_id: int, db: Session = Depends(get_db)):
     # Удаляем запись журнала уборок
     db.delete(db_log)
     db.commit()
+    notify_cleaning_log(db, "deleted", db_log)
     return db_log
 
 @app.get("/rooms/{room_id}/cleaning-logs/", response_model=List[schemas.CleaningLog])
-def read_room_cleaning_logs(room_id: int, db: Session = Depends(get_db)):
+def read_room_cleaning_logs(room_id: int, db: Session = Depends(get_read_db)):
     db_room = crud.get_room(db, room_id=room_id)
     if db_room is None:
         raise HTTPException(status_code=404, detail="Номер не найден")
     return crud.get_cleaning_logs_by_room(db, room_id=room_id)
 
 @app.get("/employees/{employee_id}/cleaning-logs/", response_model=List[schemas.CleaningLog])
-def read_employee_cleaning_logs(employee_id: int, db: Session = Depends(get_db)):
+def read_employee_cleaning_logs(employee_id: int, request: Request, db: Session = Depends(get_read_db)):
     db_employee = crud.get_employee(db, employee_id=employee_id)
     if db_employee is None:
         raise HTTPException(status_code=404, detail="Сотрудник не найден")
+    if wants_ndjson(request):
+        return ndjson_response(db, crud.iter_cleaning_logs_by_employee, schemas.CleaningLog, employee_id=employee_id)
     return crud.get_cleaning_logs_by_employee(db, employee_id=employee_id)
 
 @app.get("/cleaning-logs/date/{date}/", response_model=List[schemas.CleaningLog])
-def read_cleaning_logs_by_date(date: str, db: Session = Depends(get_db)):
+def read_cleaning_logs_by_date(date: str, request: Request, db: Session = Depends(get_read_db)):
     from datetime import date as date_type
     
     try:
@@ -634,11 +1039,232 @@ def read_cleaning_logs_by_date(date: str, db: Session = Depends(get_db)):
     except ValueError:
         raise HTTPException(status_code=400, detail="Неверный формат даты. Используйте формат YYYY-MM-DD")
     
+    if wants_ndjson(request):
+        return ndjson_response(db, crud.iter_cleaning_logs_by_date, schemas.CleaningLog, cleaning_date=cleaning_date)
     return crud.get_cleaning_logs_by_date(db, cleaning_date=cleaning_date)
 
 @app.post("/cleaning-logs/{log_id}/complete/", response_model=schemas.CleaningLog)
-def complete_cleaning_log(log_id: int, db: Session = Depends(get_db)):
-    return crud.complete_cleaning(db, log_id=log_id)
+def complete_cleaning_log(
+    log_id: int,
+    idempotency: IdempotentRequest = Depends(idempotent_request),
+    db: Session = Depends(get_db)
+):
+    return idempotency.run(db, None, schemas.CleaningLog, lambda: complete_cleaning_checked(db, log_id))
+
+def complete_cleaning_checked(db: Session, log_id: int):
+    db_log = crud.complete_cleaning(db, log_id=log_id)
+    notify_cleaning_log(db, "updated", db_log)
+    return db_log
+
+# Завершение нескольких уборок (например, всех уборок этажа) в одной транзакции
+@app.post("/cleaning-logs/complete", response_model=schemas.BatchResult)
+def complete_cleaning_logs(
+    logs: schemas.CleaningLogCompleteBatch,
+    idempotency: IdempotentRequest = Depends(idempotent_request),
+    db: Session = Depends(get_db)
+):
+    return idempotency.run(db, logs, schemas.BatchResult, lambda: complete_cleaning_logs_checked(db, logs))
+
+def complete_cleaning_logs_checked(db: Session, logs: schemas.CleaningLogCompleteBatch):
+    result, changed_logs = batch.complete_cleaning_logs(db, logs.log_ids)
+    events.publish_many([
+        ("cleaning_log", "updated", db_log.log_id, hotel_id, jsonable_encoder(db_log))
+        for db_log, hotel_id in changed_logs
+    ])
+    return result
+
+# Разбор даты из параметра запроса в формате YYYY-MM-DD
+def parse_iso_date(value: str) -> date:
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Неверный формат даты. Используйте формат YYYY-MM-DD")
+
+# Общая проверка параметров аналитических эндпоинтов
+def get_analytics_stats(db: Session, start: str, end: str, group_by: str, hotel_id: Optional[int]):
+    start_date = parse_iso_date(start)
+    end_date = parse_iso_date(end)
+    if end_date < start_date:
+        raise HTTPException(status_code=400, detail="Дата окончания периода раньше даты начала")
+    if group_by not in analytics.GROUP_BY_OPTIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Недопустимая группировка. Используйте: {', '.join(analytics.GROUP_BY_OPTIONS)}"
+        )
+    hotel_id = tenancy.resolve_hotel_id(tenancy.current_hotel_id(db), hotel_id)
+    return analytics.get_room_night_stats(db, start_date, end_date, group_by=group_by, hotel_id=hotel_id)
+
+# Эндпоинты аналитики: заполняемость, ADR и RevPAR по периодам, типам номеров и этажам
+@app.get("/analytics/occupancy", response_model=List[schemas.OccupancyStat])
+def read_occupancy_analytics(
+    start: str,
+    end: str,
+    group_by: str = Query("day", description="Группировка: day, week, month, room_type, floor"),
+    hotel_id: Optional[int] = None,
+    db: Session = Depends(get_read_db)
+):
+    return get_analytics_stats(db, start, end, group_by, hotel_id)
+
+@app.get("/analytics/revenue", response_model=List[schemas.RevenueStat])
+def read_revenue_analytics(
+    start: str,
+    end: str,
+    group_by: str = Query("day", description="Группировка: day, week, month, room_type, floor"),
+    hotel_id: Optional[int] = None,
+    db: Session = Depends(get_read_db)
+):
+    return get_analytics_stats(db, start, end, group_by, hotel_id)
+
+@app.get("/analytics/cleaning", response_model=List[schemas.CleaningStat])
+def read_cleaning_analytics(
+    start: str,
+    end: str,
+    group_by: str = Query("day", description="Группировка: day, week, month, floor"),
+    hotel_id: Optional[int] = None,
+    db: Session = Depends(get_read_db)
+):
+    start_date = parse_iso_date(start)
+    end_date = parse_iso_date(end)
+    if end_date < start_date:
+        raise HTTPException(status_code=400, detail="Дата окончания периода раньше даты начала")
+    if group_by not in ("day", "week", "month", "floor"):
+        raise HTTPException(status_code=400, detail="Недопустимая группировка. Используйте: day, week, month, floor")
+    hotel_id = tenancy.resolve_hotel_id(tenancy.current_hotel_id(db), hotel_id)
+    return analytics.get_cleaning_stats(db, start_date, end_date, group_by=group_by, hotel_id=hotel_id)
+
+# Чтение архивных бронирований и записей журнала уборок (секции, выгруженные в Parquet)
+@app.get("/analytics/archive/{table}")
+def read_archive(
+    table: str,
+    start: str,
+    end: str,
+    tenant_hotel_id: Optional[int] = Depends(tenancy.request_hotel_id)
+):
+    start_date = parse_iso_date(start)
+    end_date = parse_iso_date(end)
+    if table not in partitions.PARTITIONED_TABLES:
+        raise HTTPException(status_code=404, detail="Архив для указанной таблицы не ведётся")
+    try:
+        return partitions.read_archive(table, start_date, end_date, tenant_hotel_id)
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+# Внеочередное обновление аналитических витрин (обычно выполняется ночью через etl.py)
+@app.post("/analytics/refresh", response_model=schemas.FactsRefreshResult)
+def refresh_analytics(full: bool = False, db: Session = Depends(get_db)):
+    # Витрины перестраиваются сразу для всех гостиниц
+    tenancy.require_all_hotels(db)
+    result = etl.refresh_facts(db, full=full)
+    analytics.clear_cache()
+    return result
+
+# Выгрузка отчёта в файл (financial, occupancy, cleaning) фоновой задачей.
+# Результат задачи содержит ссылку на файл (GET /reports/exports/{export_id})
+@app.post("/reports/{kind}/export", response_model=schemas.Job, status_code=status.HTTP_202_ACCEPTED)
+def export_report(
+    kind: str,
+    start: str,
+    end: str,
+    response: Response,
+    format: str = Query("csv", pattern="^(csv|xlsx|pdf)$"),
+    group_by: str = Query("day", description="Группировка для occupancy и cleaning"),
+    hotel_id: Optional[int] = None,
+    db: Session = Depends(get_db)
+):
+    hotel_id = tenancy.resolve_hotel_id(tenancy.current_hotel_id(db), hotel_id)
+    params = exports.export_params(kind, format, parse_iso_date(start), parse_iso_date(end), group_by, hotel_id)
+    job = exports.request_export(db, kind, format, params)
+    response.headers["Location"] = f"/jobs/{job.job_id}"
+    return jobs.job_status(job)
+
+# Скачивание готовой выгрузки, с поддержкой докачки (Range, If-Range)
+@app.get("/reports/exports/{export_id}")
+def download_report_export(
+    export_id: str,
+    range: Optional[str] = Header(None),
+    if_range: Optional[str] = Header(None),
+    db: Session = Depends(get_sync_db)
+):
+    return exports.export_file_response(db, export_id, range, if_range)
+
+# Лента изменений (Server-Sent Events). Параметр hotel_id оставляет только события
+# указанной гостиницы. Событие resync означает, что клиент отстал и должен
+# перезагрузить данные целиком
+EVENTS_KEEPALIVE_SECONDS = 15
+
+@app.get("/events")
+async def stream_events(
+    request: Request,
+    hotel_id: Optional[int] = None,
+    tenant_hotel_id: Optional[int] = Depends(tenancy.request_hotel_id)
+):
+    subscription = events.broker.subscribe(tenancy.resolve_hotel_id(tenant_hotel_id, hotel_id))
+
+    async def generate():
+        try:
+            yield "retry: 3000\n\n"
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(subscription.queue.get(), timeout=EVENTS_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if event is None:
+                    yield "event: resync\ndata: {}\n\n"
+                    break
+                yield f"event: {event['entity']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+        finally:
+            events.broker.unsubscribe(subscription)
+
+    return StreamingResponse(
+        generate(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# Инкрементальная синхронизация: бронирования, номера, клиенты, сотрудники и записи
+# журнала уборок, изменённые после курсора, и идентификаторы удалённых записей.
+# Без since возвращается полный набор данных. Курсор из ответа передаётся в следующий запрос
+@app.get("/sync", response_model=schemas.SyncChanges)
+def read_changes(since: Optional[str] = None, db: Session = Depends(get_sync_db)):
+    try:
+        since_cursor = sync.decode_cursor(since) if since else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Неверный курсор синхронизации")
+    return sync.get_changes(db, since_cursor)
+
+# Профилировщику нужен поток, в котором выполняется обработчик запроса (см. profiling.py)
+@app.on_event("startup")
+def instrument_profiled_routes():
+    profiling.instrument_routes(app)
+
+@app.on_event("startup")
+def start_events_listener():
+    events.broker.start()
+
+@app.on_event("shutdown")
+def stop_events_listener():
+    events.broker.stop()
+
+# Ключи поиска дублей у клиентов, созданных до их появления, заполняет
+# фоновая задача (см. dedupe.py)
+@app.on_event("startup")
+def schedule_dedupe_backfill():
+    db = SessionLocal()
+    try:
+        dedupe.schedule_backfill(db)
+    finally:
+        db.close()
+
+# Фоновые задачи выполняются в процессе API, если не настроен отдельный исполнитель
+@app.on_event("startup")
+def start_job_runner():
+    if jobs.JOBS_EXECUTOR == "local":
+        jobs.runner.start()
+
+@app.on_event("shutdown")
+def stop_job_runner():
+    jobs.runner.stop()
 
 # Простой эндпоинт для авторизации
 @app.post("/token")
@@ -660,23 +1286,68 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
 
 # Эндпоинт для проверки текущего пользователя
 @app.get("/users/me", response_model=schemas.User)
-async def read_users_me(db: Session = Depends(get_db)):
+async def read_users_me(db: Session = Depends(get_read_db)):
     # Просто возвращаем фиксированного пользователя admin для совместимости
     user = db.query(models.User).filter(models.User.username == "admin").first()
     if not user:
         raise HTTPException(status_code=404, detail="Пользователь не найден")
     return user
 
+# Метрики в формате Prometheus (очереди и отказы контроля нагрузки и т.п.)
+@app.get("/metrics", response_class=PlainTextResponse)
+def read_metrics():
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+# Отладочные эндпоинты (профили, статистика SQL) доступны только с заголовком X-Profile-Token
+def require_debug_token(x_profile_token: Optional[str] = Header(None)):
+    if not profiling.is_admin_token(x_profile_token):
+        raise HTTPException(status_code=403, detail="Недостаточно прав для просмотра профилей")
+
+@app.get("/debug/profiles", dependencies=[Depends(require_debug_token)])
+def read_profiles(limit: int = Query(50, ge=1, le=500)):
+    return profiling.list_profiles(limit)
+
+# format=collapsed возвращает стеки для flamegraph.pl/speedscope
+@app.get("/debug/profiles/{profile_id}", dependencies=[Depends(require_debug_token)])
+def read_profile(profile_id: str, format: str = Query("json", pattern="^(json|collapsed)$")):
+    data = profiling.load_profile(profile_id)
+    if data is None:
+        raise HTTPException(status_code=404, detail="Профиль не найден")
+    if format == "collapsed":
+        return PlainTextResponse(profiling.collapsed_stacks(data))
+    return data
+
+# Статистика SQL-запросов по маршрутам (среднее и максимальное число, N+1)
+# и последние медленные запросы с планами
+@app.get("/debug/queries", dependencies=[Depends(require_debug_token)])
+def read_query_stats():
+    return querylog.stats.snapshot()
+
+@app.delete("/debug/queries", dependencies=[Depends(require_debug_token)])
+def reset_query_stats():
+    querylog.stats.reset()
+    return {"message": "Статистика SQL-запросов сброшена"}
+
 # Простой эндпоинт для проверки работы API
 @app.get("/")
 def read_root():
     return {"message": "Добро пожаловать в API системы управления гостиницей"}
 
-# Новый эндпоинт для автоматического обновления статусов номеров
-@app.post("/update-room-statuses/")
-def update_room_statuses(db: Session = Depends(get_db)):
-    updated_rooms = crud.update_all_room_statuses(db)
-    return {"updated_rooms_count": len(updated_rooms)}
+# Новый эндпоинт для автоматического обновления статусов номеров.
+# Выполняется фоновой задачей, результат - в GET /jobs/{job_id}
+@app.post("/update-room-statuses/", response_model=schemas.Job, status_code=status.HTTP_202_ACCEPTED)
+def update_room_statuses(response: Response, db: Session = Depends(get_db)):
+    job = jobs.enqueue(db, "update_room_statuses")
+    response.headers["Location"] = f"/jobs/{job.job_id}"
+    return jobs.job_status(job)
+
+# Состояние фоновой задачи: статус, прогресс в процентах, результат или ошибка
+@app.get("/jobs/{job_id}", response_model=schemas.Job)
+def read_job(job_id: int, db: Session = Depends(get_sync_db)):
+    job = jobs.get_job(db, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Задача не найдена")
+    return jobs.job_status(job)
 
 if __name__ == "__main__":
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True) 
\ No newline at end of file
@@ -0,0 +1,175 @@
+import os
+import re
+import time
+import uuid
+import zlib
+
+# Общий ASGI-мидлвар API: CORS, идентификатор запроса, время обработки
+# и сжатие ответов за один проход. Работает напрямую с сообщениями ASGI,
+# без промежуточных Request/Response и дополнительных задач на каждый запрос
+
+CORS_ALLOW_ORIGIN = os.getenv("CORS_ALLOW_ORIGIN", "*")
+CORS_ALLOW_METHODS = "GET, POST, PUT, DELETE, OPTIONS, PATCH"
+CORS_EXPOSE_HEADERS = (
+    "Content-Length, ETag, Location, Retry-After, X-Request-ID, Server-Timing, "
+    "Accept-Ranges, Content-Range, Content-Disposition, X-Last-Write"
+)
+# Время кеширования предзапросов браузером (в секундах)
+CORS_MAX_AGE = 600
+
+# Ответы меньше этого размера не сжимаются: выигрыш меньше затрат
+GZIP_MIN_SIZE = int(os.getenv("GZIP_MIN_SIZE", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "5"))
+GZIP_CONTENT_TYPES = (b"application/json", b"application/x-ndjson", b"text/", b"application/javascript")
+
+# Чтение своих записей (см. main.py): если запрос изменил данные (отметка
+# WRITE_STATE в scope["state"]), ответ получает заголовок X-Last-Write со временем
+# сервера. Клиент передаёт это значение в том же заголовке в следующих запросах
+WRITE_STATE = "wrote"
+LAST_WRITE_HEADER = "x-last-write"
+
+# Входящий X-Request-ID принимается, только если он похож на идентификатор
+REQUEST_ID_PATTERN = re.compile(rb"^[A-Za-z0-9._:-]{1,128}$")
+
+def _header(headers, name: bytes):
+    for key, value in headers:
+        if key == name:
+            return value
+    return None
+
+def _cors_headers():
+    return [
+        (b"access-control-allow-origin", CORS_ALLOW_ORIGIN.encode()),
+        (b"access-control-expose-headers", CORS_EXPOSE_HEADERS.encode()),
+    ]
+
+def _compressible(status: int, headers) -> bool:
+    # Частичные ответы (Range), уже сжатые данные и поток событий (SSE) не трогаем
+    if status < 200 or status in (204, 206, 304):
+        return False
+    if _header(headers, b"content-encoding") is not None or _header(headers, b"content-range") is not None:
+        return False
+    # Файлы с поддержкой докачки: смещения Range считаются по несжатому телу
+    if _header(headers, b"accept-ranges") is not None:
+        return False
+    content_type = _header(headers, b"content-type") or b""
+    if content_type.startswith(b"text/event-stream"):
+        return False
+    return content_type.startswith(GZIP_CONTENT_TYPES)
+
+# Ответ, который мог быть сжат, зависит от Accept-Encoding запроса: кеши
+# должны хранить варианты раздельно, даже если этот ответ отдан без сжатия
+def _add_vary(headers):
+    vary = _header(headers, b"vary")
+    if vary is None:
+        return headers + [(b"vary", b"Accept-Encoding")]
+    if b"accept-encoding" in vary.lower() or vary.strip() == b"*":
+        return headers
+    return [(key, value) for key, value in headers if key != b"vary"] + [(b"vary", vary + b", Accept-Encoding")]
+
+# Сжатый вариант отличается от несжатого побайтно, поэтому его ETag ослабляется
+# (W/"..."): сильный ETag обещает побайтное совпадение. If-Match сравнивает
+# версии без учёта W/ (см. main.check_if_match)
+def _weaken_etag(headers):
+    return [
+        (key, b"W/" + value if key == b"etag" and not value.startswith(b"W/") else value)
+        for key, value in headers
+    ]
+
+class HTTPMiddleware:
+    def __init__(self, app, minimum_size: int = GZIP_MIN_SIZE, compresslevel: int = GZIP_LEVEL):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.compresslevel = compresslevel
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        request_headers = scope["headers"]
+
+        # Предзапрос CORS обрабатывается здесь и до приложения не доходит
+        if scope["method"] == "OPTIONS" and _header(request_headers, b"access-control-request-method") is not None:
+            requested_headers = _header(request_headers, b"access-control-request-headers")
+            headers = _cors_headers() + [
+                (b"access-control-allow-methods", CORS_ALLOW_METHODS.encode()),
+                (b"access-control-allow-headers", requested_headers or b"*"),
+                (b"access-control-max-age", str(CORS_MAX_AGE).encode()),
+                (b"content-length", b"0"),
+            ]
+            await send({"type": "http.response.start", "status": 204, "headers": headers})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        request_id = _header(request_headers, b"x-request-id")
+        if request_id is None or not REQUEST_ID_PATTERN.match(request_id):
+            request_id = uuid.uuid4().hex.encode()
+        scope.setdefault("state", {})["request_id"] = request_id.decode()
+
+        accept_encoding = _header(request_headers, b"accept-encoding") or b""
+        accepts_gzip = b"gzip" in accept_encoding
+
+        # Состояние ответа между сообщениями http.response.start и http.response.body
+        start_message = None
+        compressor = None
+
+        async def send_wrapper(message):
+            nonlocal start_message, compressor
+            if message["type"] == "http.response.start":
+                headers = [
+                    (key, value) for key, value in message.get("headers", ())
+                    if not key.startswith(b"access-control-")
+                ]
+                headers += _cors_headers()
+                headers.append((b"x-request-id", request_id))
+                elapsed = (time.perf_counter() - started) * 1000
+                headers.append((b"server-timing", f"app;dur={elapsed:.1f}".encode()))
+                if scope["state"].get(WRITE_STATE):
+                    headers.append((LAST_WRITE_HEADER.encode(), f"{time.time():.3f}".encode()))
+                compressible = _compressible(message["status"], headers)
+                if compressible:
+                    headers = _add_vary(headers)
+                message = {**message, "headers": headers}
+                if accepts_gzip and compressible:
+                    # Решение о сжатии принимается по первому фрагменту тела
+                    start_message = message
+                    return
+                await send(message)
+                return
+
+            if message["type"] != "http.response.body" or start_message is None and compressor is None:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            if start_message is not None:
+                start, start_message = start_message, None
+                headers = start["headers"]
+                if not more_body and len(body) < self.minimum_size:
+                    await send(start)
+                    await send(message)
+                    return
+                headers = _weaken_etag([(key, value) for key, value in headers if key != b"content-length"])
+                headers.append((b"content-encoding", b"gzip"))
+                compressor = zlib.compressobj(self.compresslevel, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+                if not more_body:
+                    data = compressor.compress(body) + compressor.flush()
+                    headers.append((b"content-length", str(len(data)).encode()))
+                    await send({**start, "headers": headers})
+                    await send({"type": "http.response.body", "body": data})
+                    return
+                await send({**start, "headers": headers})
+
+            # Потоковый ответ (NDJSON): каждый фрагмент сбрасывается сразу,
+            # чтобы клиент получал строки по мере формирования
+            if more_body:
+                data = compressor.compress(body) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            else:
+                data = compressor.compress(body) + compressor.flush()
+            await send({"type": "http.response.body", "body": data, "more_body": more_body})
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,71 @@
+from sqlalchemy import inspect, text
+from database import engine
+import models
+import logging
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Колонки, добавленные в существующие таблицы: create_all создаёт только
+# недостающие таблицы, поэтому в базе, созданной раньше, они добавляются
+# здесь при запуске API. Для каждой колонки - таблица, имя, определение
+# и необязательный запрос заполнения уже существующих строк
+ADDED_COLUMNS = [
+    # Версия записи для оптимистической блокировки (ETag / If-Match)
+    ("rooms", "version", "INTEGER NOT NULL DEFAULT 1", None),
+    ("bookings", "version", "INTEGER NOT NULL DEFAULT 1", None),
+    ("cleaning_schedules", "version", "INTEGER NOT NULL DEFAULT 1", None),
+    ("cleaning_logs", "version", "INTEGER NOT NULL DEFAULT 1", None),
+    # Стоимость проживания по календарю цен. У старых бронирований остаётся пустой:
+    # аналитика и отчёты считают их по базовой цене типа номера
+    ("bookings", "total_price", "DOUBLE PRECISION", None),
+    # Время последнего изменения для GET /sync. Существующие записи получают время
+    # добавления колонки и приходят клиентам при следующей синхронизации
+    ("rooms", "updated_at", "TIMESTAMP", "UPDATE rooms SET updated_at = CURRENT_TIMESTAMP WHERE updated_at IS NULL"),
+    ("clients", "updated_at", "TIMESTAMP", "UPDATE clients SET updated_at = CURRENT_TIMESTAMP WHERE updated_at IS NULL"),
+    ("bookings", "updated_at", "TIMESTAMP", "UPDATE bookings SET updated_at = CURRENT_TIMESTAMP WHERE updated_at IS NULL"),
+    ("employees", "updated_at", "TIMESTAMP", "UPDATE employees SET updated_at = CURRENT_TIMESTAMP WHERE updated_at IS NULL"),
+    ("cleaning_logs", "updated_at", "TIMESTAMP", "UPDATE cleaning_logs SET updated_at = CURRENT_TIMESTAMP WHERE updated_at IS NULL"),
+    # Номер изменения для курсора GET /sync (см. models.current_change_id). Существующие
+    # записи получают 0: курсоры прежнего формата (по времени) приводят к полной
+    # синхронизации, после неё эти записи уже есть у клиента
+    ("rooms", "change_id", "BIGINT NOT NULL DEFAULT 0", None),
+    ("clients", "change_id", "BIGINT NOT NULL DEFAULT 0", None),
+    ("bookings", "change_id", "BIGINT NOT NULL DEFAULT 0", None),
+    ("employees", "change_id", "BIGINT NOT NULL DEFAULT 0", None),
+    ("cleaning_logs", "change_id", "BIGINT NOT NULL DEFAULT 0", None),
+    ("deleted_records", "change_id", "BIGINT NOT NULL DEFAULT 0", None),
+    # Гостиница пользователя, поставившего фоновую задачу (см. jobs.py)
+    ("jobs", "hotel_id", "INTEGER", None),
+    # Гостиница удалённой записи (см. sync.py). У отметок, сделанных раньше,
+    # гостиница неизвестна: они видны только администраторам сети
+    ("deleted_records", "hotel_id", "INTEGER", None),
+]
+
+def migrate(conn):
+    inspector = inspect(conn)
+    columns = {}
+    for table_name, name, definition, backfill in ADDED_COLUMNS:
+        if table_name not in columns:
+            columns[table_name] = {column["name"] for column in inspector.get_columns(table_name)}
+        if name in columns[table_name]:
+            continue
+        logger.info(f"Добавление колонки {name} в таблицу {table_name}")
+        conn.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {name} {definition}"))
+        if backfill is not None:
+            conn.execute(text(backfill))
+        columns[table_name].add(name)
+
+    # Индексы по добавленным колонкам (например, по updated_at для GET /sync)
+    added = {(table_name, name) for table_name, name, _, _ in ADDED_COLUMNS}
+    for table_name in {table_name for table_name, _, _, _ in ADDED_COLUMNS}:
+        for index in models.Base.metadata.tables[table_name].indexes:
+            if any((table_name, column.name) in added for column in index.columns):
+                index.create(conn, checkfirst=True)
+
+# Добавление колонок без запуска API: python migrations.py
+if __name__ == "__main__":
+    with engine.begin() as conn:
+        migrate(conn)
+    logger.info("Колонки существующих таблиц обновлены")
@@ -1,9 +1,28 @@
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, Float, Date, DateTime, Enum, Time
-from sqlalchemy.orm import relationship
+from sqlalchemy import Boolean, Column, ForeignKey, Integer, BigInteger, String, Float, Date, DateTime, Enum, Time, Index, Text
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, relationship
 from sqlalchemy.sql import func
+from sqlalchemy.sql.expression import FunctionElement
+from sqlalchemy.ext.compiler import compiles
 import enum
 from database import Base
-from datetime import date
+from datetime import date, datetime
+
+# Номер изменения записи для курсора GET /sync (см. sync.py). В PostgreSQL это
+# идентификатор транзакции, которая изменила запись: курсор строится по снимку
+# читающей транзакции и не пропускает изменения, зафиксированные позже
+# начатых после них. В других СУБД (SQLite в тестах) - время в микросекундах
+class current_change_id(FunctionElement):
+    type = BigInteger()
+    inherit_cache = True
+
+@compiles(current_change_id)
+def _compile_change_id(element, compiler, **kw):
+    return "CAST((julianday('now') - 2440587.5) * 86400000000 AS INTEGER)"
+
+@compiles(current_change_id, "postgresql")
+def _compile_change_id_postgresql(element, compiler, **kw):
+    return "txid_current()"
 
 # Перечисление для статуса номера
 class RoomStatus(str, enum.Enum):
@@ -63,6 +82,20 @@ class RoomType(Base):
     
     # Отношения
     rooms = relationship("Room", back_populates="room_type")
+    rates = relationship("RoomRate", back_populates="room_type")
+
+# Модель цены типа номера на дату (переопределяет базовую цену price_per_night)
+class RoomRate(Base):
+    __tablename__ = "room_rates"
+
+    type_id = Column(Integer, ForeignKey("room_types.type_id"), primary_key=True)
+    rate_date = Column(Date, primary_key=True)
+    price = Column(Float, nullable=False)
+    # Время изменения: по нему кеш календаря цен (pricing.py) узнаёт о правках
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # Отношения
+    room_type = relationship("RoomType", back_populates="rates")
 
 # Модель номера
 class Room(Base):
@@ -74,12 +107,37 @@ class Room(Base):
     floor = Column(Integer)
     room_number = Column(String(10), index=True)
     status = Column(String(20), default="Свободен")
+    # Время и номер последнего изменения (для GET /sync)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+    change_id = Column(BigInteger, default=current_change_id(), onupdate=current_change_id(), index=True)
+    version = Column(Integer, nullable=False, default=1)
+    
+    # Номера гостиницы по типам (запросы пользователей гостиницы, см. tenancy.py)
+    __table_args__ = (Index("ix_rooms_hotel_type", "hotel_id", "type_id"),)
+    
+    # Версия записи для оптимистической блокировки (ETag / If-Match). Версия
+    # проверяется при каждом UPDATE, но увеличивается только при изменении полей
+    # номера (см. bump_room_versions): статус пересчитывается автоматически
+    # по бронированиям и не должен делать устаревшим ETag, полученный клиентом
+    __mapper_args__ = {"version_id_col": version, "version_id_generator": False}
     
     # Отношения
     hotel = relationship("Hotel", back_populates="rooms")
     room_type = relationship("RoomType", back_populates="rooms")
     bookings = relationship("Booking", back_populates="room")
 
+# Поля номера, изменение которых увеличивает его версию
+ROOM_VERSIONED_FIELDS = ("hotel_id", "type_id", "floor", "room_number")
+
+@event.listens_for(Session, "before_flush")
+def bump_room_versions(session, flush_context, instances):
+    for obj in session.dirty:
+        if not isinstance(obj, Room):
+            continue
+        state = inspect(obj)
+        if any(state.attrs[field].history.has_changes() for field in ROOM_VERSIONED_FIELDS):
+            obj.version = obj.version + 1
+
 # Модель клиента
 class Client(Base):
     __tablename__ = "clients"
@@ -89,6 +147,20 @@ class Client(Base):
     last_name = Column(String(50), index=True)
     passport_number = Column(String(20))
     city = Column(String(100))
+    # Гостиница, в которой клиент зарегистрирован (см. tenancy.py)
+    hotel_id = Column(Integer, ForeignKey("hotels.hotel_id"), nullable=True)
+    # Ключи поиска дублей: нормализованные номер паспорта и фамилия с именем (см. dedupe.py)
+    passport_norm = Column(String(20), nullable=True)
+    name_key = Column(String(120), nullable=True)
+    # Время и номер последнего изменения (для GET /sync)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+    change_id = Column(BigInteger, default=current_change_id(), onupdate=current_change_id(), index=True)
+    
+    __table_args__ = (
+        Index("ix_clients_hotel_name", "hotel_id", "last_name", "first_name"),
+        Index("ix_clients_passport_norm", "passport_norm", "hotel_id"),
+        Index("ix_clients_name_key", "name_key", "hotel_id"),
+    )
     
     # Отношения
     bookings = relationship("Booking", back_populates="client")
@@ -97,12 +169,35 @@ class Client(Base):
 class Booking(Base):
     __tablename__ = "bookings"
 
-    booking_id = Column(Integer, primary_key=True, index=True)
+    booking_id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     room_id = Column(Integer, ForeignKey("rooms.room_id"))
     client_id = Column(Integer, ForeignKey("clients.client_id"))
-    check_in_date = Column(Date)
+    # Гостиница номера (денормализация для запросов по гостинице, см. tenancy.py)
+    hotel_id = Column(Integer, ForeignKey("hotels.hotel_id"), nullable=True)
+    # Дата заезда входит в первичный ключ таблицы: по ней таблица разбита на секции (см. partitions.py)
+    check_in_date = Column(Date, primary_key=True)
     check_out_date = Column(Date)
     status = Column(String(20), default="Подтверждено")
+    # Стоимость проживания по календарю цен на момент бронирования
+    total_price = Column(Float, nullable=True)
+    # Время и номер последнего изменения (для GET /sync)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+    change_id = Column(BigInteger, default=current_change_id(), onupdate=current_change_id(), index=True)
+    version = Column(Integer, nullable=False, default=1)
+    
+    # Индекс для проверок пересечения дат и календарной аналитики по номеру.
+    # Таблица секционирована по месяцам даты заезда
+    __table_args__ = (
+        Index("ix_bookings_room_dates", "room_id", "check_in_date", "check_out_date"),
+        Index("ix_bookings_hotel_dates", "hotel_id", "check_in_date", "check_out_date"),
+        # Бронирования клиента и перенос их при объединении клиентов
+        Index("ix_bookings_client", "client_id"),
+        {"postgresql_partition_by": "RANGE (check_in_date)"},
+    )
+    
+    # Для ORM запись по-прежнему определяется только booking_id.
+    # Версия записи - для оптимистической блокировки (ETag / If-Match)
+    __mapper_args__ = {"version_id_col": version, "primary_key": [booking_id]}
     
     # Отношения
     room = relationship("Room", back_populates="bookings")
@@ -117,6 +212,11 @@ class Employee(Base):
     first_name = Column(String(50), index=True)
     last_name = Column(String(50), index=True)
     status = Column(String(20), default="Активен")
+    # Время и номер последнего изменения (для GET /sync)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+    change_id = Column(BigInteger, default=current_change_id(), onupdate=current_change_id(), index=True)
+    
+    __table_args__ = (Index("ix_employees_hotel_status", "hotel_id", "status"),)
     
     # Отношения
     hotel = relationship("Hotel", back_populates="employees")
@@ -129,8 +229,16 @@ class CleaningSchedule(Base):
 
     schedule_id = Column(Integer, primary_key=True, index=True)
     employee_id = Column(Integer, ForeignKey("employees.employee_id"))
+    # Гостиница сотрудника (денормализация для запросов по гостинице, см. tenancy.py)
+    hotel_id = Column(Integer, ForeignKey("hotels.hotel_id"), nullable=True)
     floor = Column(Integer)
     day_of_week = Column(String(20))
+    version = Column(Integer, nullable=False, default=1)
+    
+    __table_args__ = (Index("ix_cleaning_schedules_hotel_day", "hotel_id", "day_of_week", "floor"),)
+    
+    # Версия записи для оптимистической блокировки (ETag / If-Match)
+    __mapper_args__ = {"version_id_col": version}
     
     # Отношения
     employee = relationship("Employee", back_populates="cleaning_schedules")
@@ -139,11 +247,157 @@ class CleaningSchedule(Base):
 class CleaningLog(Base):
     __tablename__ = "cleaning_logs"
 
-    log_id = Column(Integer, primary_key=True, index=True)
+    log_id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     floor_id = Column(Integer)
     employee_id = Column(Integer, ForeignKey("employees.employee_id"))
-    cleaning_date = Column(Date, default=date.today)
+    # Гостиница сотрудника (денормализация для запросов по гостинице, см. tenancy.py)
+    hotel_id = Column(Integer, ForeignKey("hotels.hotel_id"), nullable=True)
+    # Дата уборки входит в первичный ключ таблицы: по ней таблица разбита на секции (см. partitions.py)
+    cleaning_date = Column(Date, primary_key=True, default=date.today)
     status = Column(String(50), default="Не начато")
+    # Время и номер последнего изменения (для GET /sync)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+    change_id = Column(BigInteger, default=current_change_id(), onupdate=current_change_id(), index=True)
+    version = Column(Integer, nullable=False, default=1)
+    
+    __table_args__ = (
+        Index("ix_cleaning_logs_hotel_date", "hotel_id", "cleaning_date", "floor_id"),
+        {"postgresql_partition_by": "RANGE (cleaning_date)"},
+    )
+    
+    # Для ORM запись по-прежнему определяется только log_id.
+    # Версия записи - для оптимистической блокировки (ETag / If-Match)
+    __mapper_args__ = {"version_id_col": version, "primary_key": [log_id]}
     
     # Отношения
-    employee = relationship("Employee", back_populates="cleaning_logs") 
\ No newline at end of file
+    employee = relationship("Employee", back_populates="cleaning_logs")
+
+# Витрина занятости: одна строка на номер и дату, с бронированием и долей выручки за ночь
+class DailyRoomOccupancy(Base):
+    __tablename__ = "daily_room_occupancy"
+
+    day = Column(Date, primary_key=True)
+    room_id = Column(Integer, primary_key=True)
+    hotel_id = Column(Integer, index=True)
+    type_id = Column(Integer)
+    floor = Column(Integer)
+    booking_id = Column(Integer, nullable=True)
+    revenue = Column(Float, default=0)
+
+# Витрина уборок: одна строка на этаж гостиницы и дату с ответственным сотрудником и статусом.
+# Номера этажей в разных гостиницах повторяются, поэтому гостиница входит в ключ
+class DailyCleaningSummary(Base):
+    __tablename__ = "daily_cleaning_summary"
+
+    day = Column(Date, primary_key=True)
+    hotel_id = Column(Integer, primary_key=True, index=True)
+    floor = Column(Integer, primary_key=True)
+    log_id = Column(Integer)
+    employee_id = Column(Integer)
+    status = Column(String(50))
+
+# Учёт номерного фонда по типам: на каждую ночь число номеров типа в гостинице
+# и число занятых действующими бронированиями. Поддерживается при каждом
+# изменении бронирований и номеров (см. inventory.py)
+class Inventory(Base):
+    __tablename__ = "inventory"
+
+    hotel_id = Column(Integer, primary_key=True)
+    type_id = Column(Integer, primary_key=True)
+    day = Column(Date, primary_key=True)
+    total = Column(Integer, nullable=False, default=0)
+    booked = Column(Integer, nullable=False, default=0)
+
+# Диапазоны дат, затронутые изменениями бронирований, номеров и уборок
+# с момента последнего обновления витрин
+class EtlDirtyRange(Base):
+    __tablename__ = "etl_dirty_ranges"
+
+    id = Column(Integer, primary_key=True, index=True)
+    source = Column(String(20))
+    start_date = Column(Date)
+    end_date = Column(Date)
+    created_at = Column(DateTime, server_default=func.now())
+
+# Состояние витрин: покрытый период и время последнего обновления
+class EtlState(Base):
+    __tablename__ = "etl_state"
+
+    name = Column(String(50), primary_key=True)
+    facts_start = Column(Date)
+    facts_end = Column(Date)
+    last_run = Column(DateTime)
+
+# Сохранённые ответы для запросов с заголовком Idempotency-Key: повтор запроса
+# с тем же ключом возвращает исходный ответ без повторного выполнения
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+
+    key = Column(String(255), primary_key=True)
+    scope = Column(String(255))
+    request_hash = Column(String(64))
+    status_code = Column(Integer)
+    response_body = Column(Text)
+    created_at = Column(DateTime)
+    expires_at = Column(DateTime, index=True)
+
+# Отметки об удалённых записях для GET /sync: клиент узнаёт, какие записи убрать
+# из своих списков. Хранятся SYNC_TOMBSTONE_DAYS дней (см. sync.py)
+class DeletedRecord(Base):
+    __tablename__ = "deleted_records"
+
+    id = Column(Integer, primary_key=True, index=True)
+    entity = Column(String(30))
+    entity_id = Column(Integer)
+    # Гостиница удалённой записи: пользователь гостиницы получает только её
+    # удаления (см. tenancy.py). Без внешнего ключа - отметка переживает гостиницу
+    hotel_id = Column(Integer, nullable=True, index=True)
+    deleted_at = Column(DateTime, default=datetime.utcnow, index=True)
+    change_id = Column(BigInteger, default=current_change_id(), index=True)
+
+# Фоновые задачи (см. jobs.py): долгие операции выполняются вне потока запроса,
+# клиент опрашивает состояние через GET /jobs/{job_id}
+class Job(Base):
+    __tablename__ = "jobs"
+
+    job_id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String(50))
+    status = Column(String(20), default="queued")
+    params = Column(Text)
+    # Гостиница пользователя, поставившего задачу: задача выполняется в пределах
+    # этой гостиницы и видна только её пользователям (см. tenancy.py)
+    hotel_id = Column(Integer, nullable=True)
+    result = Column(Text, nullable=True)
+    error = Column(Text, nullable=True)
+    progress = Column(Integer, default=0)
+    message = Column(String(255), nullable=True)
+    attempts = Column(Integer, default=0)
+    max_attempts = Column(Integer, default=3)
+    run_after = Column(DateTime)
+    locked_by = Column(String(100), nullable=True)
+    heartbeat_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    
+    # Индекс для выбора следующей задачи из очереди
+    __table_args__ = (Index("ix_jobs_status_run_after", "status", "run_after"),)
+
+# Выгрузки отчётов в файлы (см. exports.py). Файл хранится на диске под именем
+# по хешу содержимого, поэтому одинаковые выгрузки занимают место один раз
+class ReportExport(Base):
+    __tablename__ = "report_exports"
+
+    export_id = Column(String(32), primary_key=True)
+    kind = Column(String(30))
+    format = Column(String(10))
+    params = Column(Text)
+    # Хеш параметров: повторная выгрузка закрытого периода берётся готовой
+    request_hash = Column(String(64), index=True)
+    closed = Column(Boolean, default=False)
+    job_id = Column(Integer, nullable=True)
+    content_hash = Column(String(64), nullable=True, index=True)
+    size = Column(Integer, nullable=True)
+    rows = Column(Integer, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime, index=True)
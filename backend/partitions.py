@@ -0,0 +1,329 @@
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection
+from datetime import date, datetime
+from decimal import Decimal
+from database import engine
+import models
+import logging
+import os
+import re
+import sys
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Секционируемые таблицы и столбец, по которому идёт разбиение (по месяцам)
+PARTITIONED_TABLES = {
+    "bookings": "check_in_date",
+    "cleaning_logs": "cleaning_date",
+}
+
+# Сколько месяцев вперёд держать готовые секции
+PARTITION_MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", "12"))
+
+# Секции старше этого числа месяцев отсоединяются от рабочих таблиц
+PARTITION_RETENTION_MONTHS = int(os.getenv("PARTITION_RETENTION_MONTHS", "24"))
+
+# Каталог для архивных файлов Parquet
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", os.path.join(os.path.dirname(__file__), "archive"))
+
+# Размер пачки строк при выгрузке секции в архив
+ARCHIVE_BATCH_SIZE = 10000
+
+PARTITION_NAME_RE = re.compile(r"^(?P<table>[a-z_]+)_p(?P<year>\d{4})_(?P<month>\d{2})$")
+
+def _month_start(value: date) -> date:
+    return value.replace(day=1)
+
+def _add_months(value: date, months: int) -> date:
+    month = value.month - 1 + months
+    return date(value.year + month // 12, month % 12 + 1, 1)
+
+def partition_name(table: str, month: date) -> str:
+    return f"{table}_p{month.year}_{month.month:02d}"
+
+def _parse_partition(name: str):
+    match = PARTITION_NAME_RE.match(name)
+    if not match:
+        return None, None
+    return match.group("table"), date(int(match.group("year")), int(match.group("month")), 1)
+
+def is_partitioned(conn: Connection, table: str) -> bool:
+    return conn.execute(text(
+        "SELECT 1 FROM pg_partitioned_table pt JOIN pg_class c ON c.oid = pt.partrelid "
+        "WHERE c.relname = :table"
+    ), {"table": table}).first() is not None
+
+# Секции, присоединённые к таблице
+def attached_partitions(conn: Connection, table: str):
+    rows = conn.execute(text(
+        "SELECT child.relname FROM pg_inherits i "
+        "JOIN pg_class parent ON parent.oid = i.inhparent "
+        "JOIN pg_class child ON child.oid = i.inhrelid "
+        "WHERE parent.relname = :table"
+    ), {"table": table})
+    return [name for (name,) in rows]
+
+# Отсоединённые, но ещё не выгруженные в архив секции
+def detached_partitions(conn: Connection, table: str):
+    rows = conn.execute(text(
+        "SELECT c.relname FROM pg_class c "
+        "JOIN pg_namespace n ON n.oid = c.relnamespace "
+        "WHERE c.relkind = 'r' AND n.nspname = current_schema() AND c.relname LIKE :pattern "
+        "AND NOT EXISTS (SELECT 1 FROM pg_inherits i WHERE i.inhrelid = c.oid)"
+    ), {"pattern": f"{table}_p%"})
+    return sorted(name for (name,) in rows if _parse_partition(name)[0] == table)
+
+def _create_partition(conn: Connection, table: str, month: date):
+    name = partition_name(table, month)
+    conn.execute(text(
+        f"CREATE TABLE {name} PARTITION OF {table} "
+        f"FOR VALUES FROM ('{month.isoformat()}') TO ('{_add_months(month, 1).isoformat()}')"
+    ))
+    logger.info(f"Создана секция {name}")
+
+# Месяцы, строки которых попали в секцию по умолчанию (исторические данные
+# или даты за горизонтом готовых секций)
+def _default_months(conn: Connection, table: str):
+    column = PARTITIONED_TABLES[table]
+    rows = conn.execute(text(
+        f"SELECT DISTINCT date_trunc('month', {column})::date FROM {table}_default WHERE {column} IS NOT NULL"
+    ))
+    return {month for (month,) in rows}
+
+# Перенос строк из секции по умолчанию в помесячные секции. PostgreSQL не даёт
+# создать секцию, строки которой уже лежат в секции по умолчанию, поэтому она
+# на время отсоединяется: секции создаются, строки переносятся через
+# родительскую таблицу, и секция по умолчанию присоединяется обратно
+def _split_default(conn: Connection, table: str, months):
+    column = PARTITIONED_TABLES[table]
+    default = f"{table}_default"
+    columns = ", ".join(row["name"] for row in inspect(conn).get_columns(table))
+    conn.execute(text(f"ALTER TABLE {table} DETACH PARTITION {default}"))
+    for month in sorted(months):
+        _create_partition(conn, table, month)
+        bounds = {"start": month, "end": _add_months(month, 1)}
+        where = f"{column} >= :start AND {column} < :end"
+        moved = conn.execute(text(
+            f"INSERT INTO {table} ({columns}) SELECT {columns} FROM {default} WHERE {where}"
+        ), bounds).rowcount
+        conn.execute(text(f"DELETE FROM {default} WHERE {where}"), bounds)
+        logger.info(f"В секцию {partition_name(table, month)} перенесено строк: {moved}")
+    conn.execute(text(f"ALTER TABLE {table} ATTACH PARTITION {default} DEFAULT"))
+
+# Создаёт секцию по умолчанию и помесячные секции от start до end (включительно),
+# а также секции для месяцев, строки которых оказались в секции по умолчанию.
+# Ошибки не подавляются: без нужной секции строки копились бы в секции по умолчанию
+def ensure_partitions(conn: Connection, start: date = None, end: date = None, tables=None):
+    today = date.today()
+    start = _month_start(start or today)
+    end = _month_start(end or _add_months(today, PARTITION_MONTHS_AHEAD))
+
+    for table in tables or PARTITIONED_TABLES:
+        if not is_partitioned(conn, table):
+            logger.error(
+                f"Таблица {table} создана без секционирования: секции не создаются, а запросы "
+                f"по датам читают всю таблицу. Перенесите её командой: python partitions.py migrate"
+            )
+            continue
+
+        conn.execute(text(f"CREATE TABLE IF NOT EXISTS {table}_default PARTITION OF {table} DEFAULT"))
+
+        existing = set(attached_partitions(conn, table))
+        months = set()
+        month = start
+        while month <= end:
+            months.add(month)
+            month = _add_months(month, 1)
+        default_months = _default_months(conn, table)
+        missing = {month for month in months | default_months if partition_name(table, month) not in existing}
+
+        in_default = missing & default_months
+        if in_default:
+            _split_default(conn, table, in_default)
+        for month in sorted(missing - in_default):
+            _create_partition(conn, table, month)
+
+# Перенос таблицы, созданной без секционирования (база старше partitions.py).
+# Таблица переименовывается вместе с индексами и последовательностью
+# идентификаторов, на её месте по модели создаётся секционированная таблица
+# с секциями на весь период данных, строки копируются одним INSERT ... SELECT,
+# последовательность продолжает прежнюю нумерацию, а старая таблица удаляется.
+# Всё выполняется в одной транзакции: при ошибке база остаётся прежней
+def migrate_table(conn: Connection, table: str) -> bool:
+    if is_partitioned(conn, table):
+        return False
+    column = PARTITIONED_TABLES[table]
+    legacy = f"{table}_unpartitioned"
+    id_column = next(c.name for c in models.Base.metadata.tables[table].primary_key if c.name != column)
+    logger.info(f"Перенос таблицы {table} в секционированную")
+
+    old_sequence = conn.execute(text("SELECT pg_get_serial_sequence(:table, :column)"), {"table": table, "column": id_column}).scalar()
+    conn.execute(text(f"ALTER TABLE {table} RENAME TO {legacy}"))
+    index_names = conn.execute(text(
+        "SELECT indexname FROM pg_indexes WHERE schemaname = current_schema() AND tablename = :table"
+    ), {"table": legacy}).scalars().all()
+    # Индекс первичного ключа переименовывается вместе с ограничением
+    for index_name in index_names:
+        conn.execute(text(f'ALTER INDEX "{index_name}" RENAME TO "{index_name[:48]}_unpartitioned"'))
+    sequence_state = None
+    if old_sequence is not None:
+        sequence_state = conn.execute(text(f"SELECT last_value, is_called FROM {old_sequence}")).one()
+        sequence_name = old_sequence.split(".")[-1].strip('"')
+        conn.execute(text(f'ALTER SEQUENCE {old_sequence} RENAME TO "{sequence_name[:48]}_unpartitioned"'))
+
+    models.Base.metadata.tables[table].create(conn)
+    first_day, last_day = conn.execute(text(f"SELECT MIN({column}), MAX({column}) FROM {legacy}")).one()
+    horizon = _add_months(date.today(), PARTITION_MONTHS_AHEAD)
+    ensure_partitions(conn, start=first_day, end=max(last_day or horizon, horizon), tables=[table])
+
+    # Колонки, которых нет в старой таблице, получают значения по умолчанию
+    new_columns = {c["name"] for c in inspect(conn).get_columns(table)}
+    columns = ", ".join(c["name"] for c in inspect(conn).get_columns(legacy) if c["name"] in new_columns)
+    moved = conn.execute(text(f"INSERT INTO {table} ({columns}) SELECT {columns} FROM {legacy}")).rowcount
+    if sequence_state is not None:
+        conn.execute(
+            text("SELECT setval(pg_get_serial_sequence(:table, :column), :value, :is_called)"),
+            {"table": table, "column": id_column, "value": sequence_state.last_value, "is_called": sequence_state.is_called}
+        )
+    conn.execute(text(f"DROP TABLE {legacy}"))
+    logger.info(f"Таблица {table} перенесена в секционированную, строк: {moved}")
+    return True
+
+def migrate(conn: Connection):
+    return [table for table in PARTITIONED_TABLES if migrate_table(conn, table)]
+
+# Отсоединяет помесячные секции старше PARTITION_RETENTION_MONTHS. Данные остаются
+# в отдельных таблицах до выгрузки в архив, рабочие запросы их больше не читают
+def detach_old_partitions(conn: Connection, retention_months: int = PARTITION_RETENTION_MONTHS):
+    cutoff = _add_months(_month_start(date.today()), -retention_months)
+    detached = []
+    for table in PARTITIONED_TABLES:
+        if not is_partitioned(conn, table):
+            continue
+        for name in attached_partitions(conn, table):
+            _, month = _parse_partition(name)
+            if month is not None and month < cutoff:
+                conn.execute(text(f"ALTER TABLE {table} DETACH PARTITION {name}"))
+                detached.append(name)
+                logger.info(f"Секция {name} отсоединена")
+    return detached
+
+def _archive_path(table: str, name: str) -> str:
+    return os.path.join(ARCHIVE_DIR, table, f"{name}.parquet")
+
+# Схема файла Parquet по типам колонок секции. Она задаётся явно: при выводе
+# из значений пачка, где колонка целиком пустая (например, total_price старых
+# бронирований), получила бы тип null и не совпала бы со следующими пачками
+def _arrow_schema(conn: Connection, name: str):
+    import pyarrow as pa
+    types = {
+        bool: pa.bool_(),
+        int: pa.int64(),
+        float: pa.float64(),
+        Decimal: pa.float64(),
+        str: pa.string(),
+        date: pa.date32(),
+        datetime: pa.timestamp("us"),
+    }
+    fields = []
+    for column in inspect(conn).get_columns(name):
+        try:
+            python_type = column["type"].python_type
+        except NotImplementedError:
+            python_type = str
+        fields.append(pa.field(column["name"], types.get(python_type, pa.string())))
+    return pa.schema(fields)
+
+# Выгружает отсоединённые секции в сжатые файлы Parquet и удаляет их из БД.
+# Строки читаются серверным курсором пачками, поэтому память не зависит от размера секции
+def archive_detached_partitions(conn: Connection):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Для архивации требуется пакет pyarrow")
+
+    archived = []
+    for table in PARTITIONED_TABLES:
+        for name in detached_partitions(conn, table):
+            path = _archive_path(table, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = path + ".tmp"
+
+            schema = _arrow_schema(conn, name)
+            result = conn.execute(text(f"SELECT * FROM {name}").execution_options(yield_per=ARCHIVE_BATCH_SIZE))
+            columns = list(result.keys())
+            rows_count = 0
+            with pq.ParquetWriter(tmp_path, schema, compression="zstd") as writer:
+                for batch in result.partitions():
+                    data = {column: [row[i] for row in batch] for i, column in enumerate(columns)}
+                    writer.write_table(pa.table(data, schema=schema))
+                    rows_count += len(batch)
+
+            os.replace(tmp_path, path)
+            conn.execute(text(f"DROP TABLE {name}"))
+            archived.append(name)
+            logger.info(f"Секция {name} выгружена в архив ({rows_count} строк)")
+    return archived
+
+# Чтение архивных строк за период. Фильтр по дате применяется при чтении
+# файлов Parquet, поэтому читаются только нужные группы строк
+def read_archive(table: str, start: date, end: date, hotel_id: int = None):
+    if table not in PARTITIONED_TABLES:
+        raise ValueError(f"Таблица {table} не архивируется")
+    directory = os.path.join(ARCHIVE_DIR, table)
+    if not os.path.isdir(directory):
+        return []
+    try:
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Для чтения архива требуется пакет pyarrow")
+
+    column = PARTITIONED_TABLES[table]
+    # Файлы секций, выгруженных до добавления колонки (например, hotel_id), читаются
+    # по общей схеме: отсутствующие в них колонки пустые
+    files = sorted(
+        os.path.join(directory, file_name) for file_name in os.listdir(directory) if file_name.endswith(".parquet")
+    )
+    if not files:
+        return []
+    schema = pa.unify_schemas([pq.read_schema(path) for path in files])
+    dataset = ds.dataset(files, schema=schema, format="parquet")
+    condition = (ds.field(column) >= start) & (ds.field(column) <= end)
+    if hotel_id is not None:
+        # В секциях, выгруженных до появления колонки hotel_id, гостиница неизвестна
+        if "hotel_id" not in dataset.schema.names:
+            return []
+        condition = condition & (ds.field("hotel_id") == hotel_id)
+    rows = dataset.to_table(filter=condition)
+    return rows.to_pylist()
+
+# Плановое обслуживание: новые секции на горизонте и отсоединение старых
+def maintain():
+    with engine.begin() as conn:
+        ensure_partitions(conn)
+        detach_old_partitions(conn)
+
+# Запуск из cron:
+#   python partitions.py maintain  - создать будущие секции и отсоединить старые
+#   python partitions.py archive   - выгрузить отсоединённые секции в Parquet
+# Однократно при обновлении базы, созданной без секционирования (API остановлен):
+#   python partitions.py migrate   - перенести таблицы в секционированные
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "maintain"
+    if command == "maintain":
+        maintain()
+    elif command == "migrate":
+        with engine.begin() as conn:
+            migrated = migrate(conn)
+        logger.info(f"Перенесены таблицы: {', '.join(migrated) or 'нет'}")
+    elif command == "archive":
+        with engine.begin() as conn:
+            archive_detached_partitions(conn)
+    else:
+        logger.error(f"Неизвестная команда: {command}")
+        sys.exit(1)
@@ -0,0 +1,114 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import func, cast, Float
+from datetime import date, timedelta
+from itertools import accumulate
+import threading
+import models
+
+# Календарь цен строится минимум на столько дней вперёд от сегодняшнего
+RATE_CALENDAR_DAYS = 400
+
+# Календарь цен одного типа номера: цена каждой ночи - из room_rates,
+# иначе базовая цена типа. Хранятся накопленные суммы по дням, поэтому
+# стоимость любого проживания внутри календаря - разность двух элементов
+class RateCalendar:
+    def __init__(self, start: date, stamp, prefix):
+        self.start = start
+        self.end = start + timedelta(days=len(prefix) - 1)
+        self.stamp = stamp
+        self.prefix = prefix
+
+    def covers(self, check_in: date, check_out: date) -> bool:
+        return self.start <= check_in and check_out <= self.end
+
+    def total(self, check_in: date, check_out: date) -> float:
+        return round(self.prefix[(check_out - self.start).days] - self.prefix[(check_in - self.start).days], 2)
+
+_calendars = {}
+_lock = threading.Lock()
+
+def invalidate(type_id: int = None):
+    with _lock:
+        if type_id is None:
+            _calendars.clear()
+        else:
+            _calendars.pop(type_id, None)
+
+# Отпечаток цен по типам: базовая цена, число цен на даты и время последней правки.
+# Если он изменился (в том числе в другом процессе API), календарь строится заново
+def _stamps(db: Session, type_ids):
+    rows = db.query(
+        models.RoomType.type_id,
+        models.RoomType.price_per_night,
+        func.count(models.RoomRate.rate_date),
+        func.max(models.RoomRate.updated_at)
+    ).outerjoin(
+        models.RoomRate, models.RoomRate.type_id == models.RoomType.type_id
+    ).filter(
+        models.RoomType.type_id.in_(list(type_ids))
+    ).group_by(models.RoomType.type_id, models.RoomType.price_per_night).all()
+    return {type_id: (price, count, updated_at) for type_id, price, count, updated_at in rows}
+
+def _build(db: Session, type_id: int, stamp, start: date, end: date) -> RateCalendar:
+    base_price = float(stamp[0] or 0)
+    prices = [base_price] * (end - start).days
+    rates = db.query(models.RoomRate.rate_date, models.RoomRate.price).filter(
+        models.RoomRate.type_id == type_id,
+        models.RoomRate.rate_date >= start,
+        models.RoomRate.rate_date < end
+    ).all()
+    for rate_date, price in rates:
+        prices[(rate_date - start).days] = price
+    return RateCalendar(start, stamp, [0.0] + list(accumulate(prices)))
+
+# Календари цен для типов, покрывающие запрошенные периоды.
+# periods: {type_id: (самая ранняя дата заезда, самая поздняя дата выезда)}.
+# Типы, которых нет в базе, в результат не попадают
+def get_calendars(db: Session, periods: dict):
+    if not periods:
+        return {}
+    stamps = _stamps(db, periods.keys())
+    today = date.today()
+    result = {}
+    for type_id, (first_day, last_day) in periods.items():
+        stamp = stamps.get(type_id)
+        if stamp is None:
+            continue
+        with _lock:
+            calendar = _calendars.get(type_id)
+        if calendar is not None and calendar.stamp == stamp and calendar.covers(first_day, last_day):
+            result[type_id] = calendar
+            continue
+
+        start = min(first_day, today)
+        end = max(last_day, today + timedelta(days=RATE_CALENDAR_DAYS))
+        if calendar is not None and calendar.stamp == stamp:
+            # Цены не менялись, расширяем уже построенный период
+            start, end = min(start, calendar.start), max(end, calendar.end)
+        calendar = _build(db, type_id, stamp, start, end)
+        with _lock:
+            _calendars[type_id] = calendar
+        result[type_id] = calendar
+    return result
+
+# Стоимость проживания в номере типа type_id (None, если тип не найден)
+def stay_total(db: Session, type_id: int, check_in: date, check_out: date):
+    calendar = get_calendars(db, {type_id: (check_in, check_out)}).get(type_id)
+    return calendar.total(check_in, check_out) if calendar is not None else None
+
+# Стоимость проживания в конкретном номере
+def booking_total(db: Session, room_id: int, check_in: date, check_out: date):
+    room = db.get(models.Room, room_id)
+    if room is None:
+        return None
+    return stay_total(db, room.type_id, check_in, check_out)
+
+# Выручка за одну ночь бронирования для аналитики: сохранённая стоимость,
+# делённая на число ночей. Для бронирований без сохранённой стоимости - базовая цена типа
+def night_revenue():
+    nights = models.Booking.check_out_date - models.Booking.check_in_date
+    return func.coalesce(
+        models.Booking.total_price / func.nullif(cast(nights, Float), 0),
+        models.RoomType.price_per_night,
+        0
+    )
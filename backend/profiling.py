@@ -0,0 +1,325 @@
+from collections import Counter
+from contextvars import ContextVar
+from datetime import datetime
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+import asyncio
+import functools
+import hmac
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Профилирование отдельных запросов. Запрос с заголовками "X-Profile: 1"
+# и "X-Profile-Token: <PROFILE_ADMIN_TOKEN>" или попавший в выборку
+# PROFILE_SAMPLE_RATE выполняется под статистическим профилировщиком: отдельный
+# поток раз в PROFILE_INTERVAL_MS снимает стек потока, в котором выполняется
+# обработчик маршрута этого запроса. Результат (стеки для flame graph, самые
+# затратные функции и SQL-запросы с временем) сохраняется в PROFILE_DIR и
+# доступен на /debug/profiles/{id}
+
+# Без токена профилирование по запросу и /debug/profiles отключены
+PROFILE_ADMIN_TOKEN = os.getenv("PROFILE_ADMIN_TOKEN", "")
+
+# Доля запросов, профилируемых без заголовка (0 - только по запросу)
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "2"))
+
+# Каталог общий для всех процессов API, поэтому профиль можно получить
+# через любой из них. Хранятся последние PROFILE_KEEP профилей
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "profiles"))
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "100"))
+
+# Сколько SQL-запросов и функций сохранять в одном профиле
+PROFILE_MAX_STATEMENTS = 500
+PROFILE_TOP_FUNCTIONS = 30
+
+# Текущий профиль запроса. Переменная контекста копируется в потоки пула,
+# в которых FastAPI выполняет синхронные обработчики, поэтому SQL-запросы
+# обработчика попадают в профиль своего запроса
+_current = ContextVar("profile", default=None)
+
+def is_admin_token(token: str) -> bool:
+    return bool(PROFILE_ADMIN_TOKEN) and token is not None and hmac.compare_digest(token, PROFILE_ADMIN_TOKEN)
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+class Profile:
+    def __init__(self, method: str, path: str, reason: str):
+        self.profile_id = uuid.uuid4().hex
+        self.method = method
+        self.path = path
+        self.reason = reason
+        self.started_at = datetime.utcnow()
+        self.started = time.perf_counter()
+        self.duration_ms = None
+        self.status_code = None
+        self.request_id = None
+        self.endpoint_code = None
+        self.thread_id = None
+        self.route = None
+        self.stacks = Counter()
+        self.own_time = Counter()
+        self.samples = 0
+        self.statements = []
+        self._stopped = threading.Event()
+        self._sampler = None
+
+    def start(self):
+        self._sampler = threading.Thread(target=self._sample, name=f"profile-{self.profile_id[:8]}", daemon=True)
+        self._sampler.start()
+
+    def stop(self):
+        self.duration_ms = round((time.perf_counter() - self.started) * 1000, 3)
+        self._stopped.set()
+        if self._sampler is not None:
+            self._sampler.join()
+
+    # Снимается только стек потока, в который вошёл обработчик маршрута этого
+    # запроса (синхронный - поток пула, асинхронный - цикл событий, см.
+    # instrument_routes): тот же обработчик других запросов в профиль не попадает
+    def _sample(self):
+        interval = PROFILE_INTERVAL_MS / 1000
+        while not self._stopped.wait(interval):
+            if self.endpoint_code is None or self.thread_id is None:
+                continue
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            in_endpoint = False
+            while frame is not None:
+                stack.append(frame)
+                if frame.f_code is self.endpoint_code:
+                    in_endpoint = True
+                    break
+                frame = frame.f_back
+            if not in_endpoint:
+                continue
+            names = [_frame_name(item) for item in reversed(stack)]
+            self.stacks[";".join(names)] += 1
+            self.own_time[names[-1]] += 1
+            self.samples += 1
+
+    def add_statement(self, started: float, duration: float, statement: str, rows: int):
+        if len(self.statements) >= PROFILE_MAX_STATEMENTS:
+            return
+        self.statements.append({
+            "start_ms": round((started - self.started) * 1000, 3),
+            "duration_ms": round(duration * 1000, 3),
+            "statement": statement,
+            "rows": rows,
+        })
+
+    def to_dict(self) -> dict:
+        interval = PROFILE_INTERVAL_MS
+        return {
+            "profile_id": self.profile_id,
+            "request_id": self.request_id,
+            "method": self.method,
+            "path": self.path,
+            "route": self.route,
+            "reason": self.reason,
+            "status_code": self.status_code,
+            "started_at": self.started_at.isoformat(),
+            "duration_ms": self.duration_ms,
+            "sample_interval_ms": interval,
+            "samples": self.samples,
+            "sql_count": len(self.statements),
+            "sql_time_ms": round(sum(item["duration_ms"] for item in self.statements), 3),
+            "top_functions": [
+                {"function": name, "samples": count, "time_ms": round(count * interval, 1)}
+                for name, count in self.own_time.most_common(PROFILE_TOP_FUNCTIONS)
+            ],
+            "stacks": dict(self.stacks.most_common()),
+            "sql": self.statements,
+        }
+
+# Время SQL-запросов профилируемого запроса. Для остальных запросов это
+# одно чтение переменной контекста
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info.setdefault("profile_started", []).append(time.perf_counter())
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = _current.get()
+    if profile is None or not conn.info.get("profile_started"):
+        return
+    started = conn.info["profile_started"].pop()
+    rows = cursor.rowcount if cursor.rowcount >= 0 else None
+    profile.add_statement(started, time.perf_counter() - started, statement, rows)
+
+# Поток, в котором начал выполняться обработчик профилируемого запроса
+def _enter_endpoint():
+    profile = _current.get()
+    if profile is not None and profile.thread_id is None:
+        profile.thread_id = threading.get_ident()
+
+def _track_thread(call):
+    if asyncio.iscoroutinefunction(call):
+        @functools.wraps(call)
+        async def endpoint(*args, **kwargs):
+            _enter_endpoint()
+            return await call(*args, **kwargs)
+    else:
+        @functools.wraps(call)
+        def endpoint(*args, **kwargs):
+            _enter_endpoint()
+            return call(*args, **kwargs)
+    endpoint.profiling_tracked = True
+    return endpoint
+
+# Обработчики маршрутов приложения оборачиваются после объявления всех маршрутов:
+# FastAPI вызывает dependant.call, а разбор параметров уже выполнен по исходной функции
+def instrument_routes(app):
+    for route in app.routes:
+        dependant = getattr(route, "dependant", None)
+        if dependant is None or dependant.call is None or getattr(dependant.call, "profiling_tracked", False):
+            continue
+        dependant.call = _track_thread(dependant.call)
+
+def _profile_path(profile_id: str) -> str:
+    return os.path.join(PROFILE_DIR, f"{profile_id}.json")
+
+def save_profile(profile: Profile):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    with open(_profile_path(profile.profile_id), "w", encoding="utf-8") as f:
+        json.dump(profile.to_dict(), f, ensure_ascii=False)
+    # Старые профили удаляются
+    files = sorted(
+        (entry for entry in os.scandir(PROFILE_DIR) if entry.name.endswith(".json")),
+        key=lambda entry: entry.stat().st_mtime
+    )
+    for entry in files[:-PROFILE_KEEP]:
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass
+
+def load_profile(profile_id: str):
+    # Идентификатор - uuid4 в hex, иначе профиль не существует
+    if len(profile_id) != 32 or any(c not in "0123456789abcdef" for c in profile_id):
+        return None
+    try:
+        with open(_profile_path(profile_id), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def list_profiles(limit: int = 50):
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    files = sorted(
+        (entry for entry in os.scandir(PROFILE_DIR) if entry.name.endswith(".json")),
+        key=lambda entry: entry.stat().st_mtime,
+        reverse=True
+    )
+    result = []
+    for entry in files[:limit]:
+        with open(entry.path, encoding="utf-8") as f:
+            data = json.load(f)
+        result.append({key: data[key] for key in (
+            "profile_id", "request_id", "method", "path", "route", "reason",
+            "status_code", "started_at", "duration_ms", "samples", "sql_count"
+        )})
+    return result
+
+# Стеки в "свёрнутом" формате (строка "функция;функция;... число"), который
+# понимают flamegraph.pl, speedscope и аналогичные инструменты
+def collapsed_stacks(data: dict) -> str:
+    return "".join(f"{stack} {count}\n" for stack, count in data["stacks"].items())
+
+def _header(headers, name: bytes):
+    for key, value in headers:
+        if key == name:
+            return value
+    return None
+
+# ASGI-мидлвар профилирования. В выключенном состоянии проверяет один заголовок
+class ProfilingMiddleware:
+    def __init__(self, app, sample_rate: float = PROFILE_SAMPLE_RATE):
+        self.app = app
+        self.sample_rate = sample_rate
+
+    def _reason(self, scope):
+        headers = scope["headers"]
+        if _header(headers, b"x-profile") == b"1":
+            token = _header(headers, b"x-profile-token")
+            if token is not None and is_admin_token(token.decode("latin-1")):
+                return "header"
+        if self.sample_rate and random.random() < self.sample_rate:
+            return "sample"
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith("/debug/"):
+            await self.app(scope, receive, send)
+            return
+        reason = self._reason(scope)
+        if reason is None:
+            await self.app(scope, receive, send)
+            return
+
+        profile = Profile(scope["method"], scope["path"], reason)
+        profile.request_id = scope.get("state", {}).get("request_id")
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                profile.status_code = message["status"]
+                headers = list(message.get("headers", ()))
+                headers.append((b"x-profile-id", profile.profile_id.encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        # Обработчик маршрута становится известен после маршрутизации,
+        # поэтому профилировщик ждёт его в scope
+        scope = _ScopeDict(scope)
+        scope.profile = profile
+        token = _current.set(profile)
+        profile.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            profile.stop()
+            try:
+                # Запись файла и удаление старых профилей - вне цикла событий
+                await run_in_threadpool(save_profile, profile)
+                logger.info(f"Профиль {profile.profile_id}: {profile.method} {profile.path} {profile.duration_ms} мс")
+            except OSError as e:
+                logger.error(f"Не удалось сохранить профиль {profile.profile_id}: {e}")
+
+# Словарь scope, который сообщает профилю обработчик маршрута, как только
+# маршрутизатор Starlette запишет его в scope["endpoint"]
+class _ScopeDict(dict):
+    profile = None
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        if key == "endpoint":
+            self._set_endpoint(value)
+
+    def update(self, *args, **kwargs):
+        super().update(*args, **kwargs)
+        if "endpoint" in self:
+            self._set_endpoint(self["endpoint"])
+
+    def _set_endpoint(self, endpoint):
+        code = getattr(getattr(endpoint, "__wrapped__", endpoint), "__code__", None)
+        if code is not None and self.profile.endpoint_code is None:
+            self.profile.endpoint_code = code
+            route = self.get("route")
+            self.profile.route = getattr(route, "path", None)
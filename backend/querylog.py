@@ -0,0 +1,323 @@
+from collections import Counter, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+import logging
+import os
+import queue
+import re
+import threading
+import time
+import metrics
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Инспектор SQL-запросов на событиях SQLAlchemy:
+# - запросы дольше SLOW_QUERY_MS пишутся в журнал, а для чтения из таблиц
+#   в фоновом потоке снимается план EXPLAIN (ANALYZE, BUFFERS). Значения
+#   параметров (паспорта, телефоны, пароли) по умолчанию скрыты - в журнале
+#   и на /debug/queries видны только их типы;
+# - в рамках одного HTTP-запроса считаются одинаковые (после нормализации)
+#   запросы: повтор N_PLUS_ONE_THRESHOLD и более раз - признак N+1, он
+#   записывается в статистику маршрута (GET /debug/queries);
+# - query_budget() в тестах проверяет, что код укладывается в число запросов
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+N_PLUS_ONE_THRESHOLD = int(os.getenv("N_PLUS_ONE_THRESHOLD", "10"))
+
+# EXPLAIN ANALYZE выполняет запрос повторно, поэтому план одного и того же
+# запроса снимается не чаще раза в EXPLAIN_COOLDOWN_SECONDS, очередь ограничена,
+# а время выполнения плана - EXPLAIN_TIMEOUT_MS
+EXPLAIN_ENABLED = os.getenv("SLOW_QUERY_EXPLAIN", "1") == "1"
+EXPLAIN_COOLDOWN_SECONDS = 300
+EXPLAIN_QUEUE_SIZE = 20
+EXPLAIN_TIMEOUT_MS = 10000
+
+# Сколько медленных запросов хранить для /debug/queries
+SLOW_QUERY_KEEP = 200
+# Значения параметров в журнале и на /debug/queries - только для отладки
+# на стенде без персональных данных
+SLOW_QUERY_LOG_PARAMETERS = os.getenv("SLOW_QUERY_LOG_PARAMETERS", "0") == "1"
+# Ограничение длины параметров в журнале
+PARAMETERS_MAX_LENGTH = 500
+
+slow_query_counter = metrics.counter(
+    "inncontrol_slow_queries_total", "SQL-запросы дольше SLOW_QUERY_MS"
+)
+n_plus_one_counter = metrics.counter(
+    "inncontrol_n_plus_one_total", "HTTP-запросы с повторяющимися SQL-запросами (N+1) по маршрутам", ("route",)
+)
+
+_PARAMETER = re.compile(r"%\(\w+\)s|\?|\$\d+")
+_NUMBER = re.compile(r"\b\d+(\.\d+)?\b")
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_IN_LIST = re.compile(r"\((\s*\?\s*,)+\s*\?\s*\)")
+_SPACES = re.compile(r"\s+")
+_FROM = re.compile(r"\bFROM\b", re.IGNORECASE)
+# Функции, которые что-то меняют или ждут: EXPLAIN ANALYZE вызвал бы их повторно
+_SIDE_EFFECTS = re.compile(
+    r"\b(pg_(try_)?advisory\w*|pg_notify|pg_sleep\w*|nextval|setval|txid_current|lo_\w+)\s*\(",
+    re.IGNORECASE
+)
+
+# Нормализация: параметры и литералы заменяются на ?, списки IN сворачиваются
+def normalize(statement: str) -> str:
+    statement = _STRING.sub("?", statement)
+    statement = _PARAMETER.sub("?", statement)
+    statement = _NUMBER.sub("?", statement)
+    statement = _IN_LIST.sub("(...)", statement)
+    return _SPACES.sub(" ", statement).strip()
+
+# SQL-запросы текущего HTTP-запроса
+class RequestQueries:
+    def __init__(self):
+        self.statements = Counter()
+        self.total = 0
+        self.slow = 0
+
+_request = ContextVar("request_queries", default=None)
+
+# Активные проверки query_budget (для тестов)
+_budgets = []
+_budgets_lock = threading.Lock()
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+class _Budget:
+    def __init__(self, max_queries: int):
+        self.max_queries = max_queries
+        self.statements = []
+        self._lock = threading.Lock()
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    def add(self, statement: str):
+        with self._lock:
+            self.statements.append(statement)
+
+# Проверка в тестах: все SQL-запросы внутри блока (в любом потоке, включая
+# приложение под TestClient) не должны превышать max_queries.
+#     with querylog.query_budget(3):
+#         client.get("/bookings/")
+@contextmanager
+def query_budget(max_queries: int, label: str = ""):
+    budget = _Budget(max_queries)
+    with _budgets_lock:
+        _budgets.append(budget)
+    try:
+        yield budget
+    finally:
+        with _budgets_lock:
+            _budgets.remove(budget)
+    if budget.count > max_queries:
+        repeated = Counter(normalize(statement) for statement in budget.statements).most_common(5)
+        details = "\n".join(f"  {count} x {statement}" for statement, count in repeated)
+        raise QueryBudgetExceeded(
+            f"{label or 'Блок'}: {budget.count} SQL-запросов при бюджете {max_queries}\n{details}"
+        )
+
+# Статистика по маршрутам и последние медленные запросы
+class QueryStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.routes = {}
+        self.slow_queries = deque(maxlen=SLOW_QUERY_KEEP)
+        self._explained = {}
+
+    def record_request(self, route: str, queries: RequestQueries, repeated: dict):
+        with self._lock:
+            stats = self.routes.setdefault(route, {
+                "requests": 0, "queries": 0, "max_queries": 0, "slow_queries": 0,
+                "n_plus_one_requests": 0, "n_plus_one": Counter(),
+            })
+            stats["requests"] += 1
+            stats["queries"] += queries.total
+            stats["max_queries"] = max(stats["max_queries"], queries.total)
+            stats["slow_queries"] += queries.slow
+            if repeated:
+                stats["n_plus_one_requests"] += 1
+                for statement, count in repeated.items():
+                    stats["n_plus_one"][statement] = max(stats["n_plus_one"][statement], count)
+
+    def record_slow(self, entry: dict):
+        with self._lock:
+            self.slow_queries.append(entry)
+
+    # Можно ли снимать план для запроса (не чаще раза в EXPLAIN_COOLDOWN_SECONDS)
+    def should_explain(self, normalized: str) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            last = self._explained.get(normalized)
+            if last is not None and now - last < EXPLAIN_COOLDOWN_SECONDS:
+                return False
+            self._explained[normalized] = now
+            if len(self._explained) > SLOW_QUERY_KEEP * 5:
+                self._explained.clear()
+            return True
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            routes = {
+                route: {
+                    "requests": stats["requests"],
+                    "avg_queries": round(stats["queries"] / stats["requests"], 1),
+                    "max_queries": stats["max_queries"],
+                    "slow_queries": stats["slow_queries"],
+                    "n_plus_one_requests": stats["n_plus_one_requests"],
+                    "n_plus_one": [
+                        {"statement": statement, "max_repeats": count}
+                        for statement, count in stats["n_plus_one"].most_common(10)
+                    ],
+                }
+                for route, stats in self.routes.items()
+            }
+            slow_queries = list(reversed(self.slow_queries))
+        return {"routes": routes, "slow_queries": slow_queries}
+
+    def reset(self):
+        with self._lock:
+            self.routes.clear()
+            self.slow_queries.clear()
+            self._explained.clear()
+
+stats = QueryStats()
+
+def _redact(parameters):
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        # executemany: список наборов параметров
+        if parameters and isinstance(parameters[0], (dict, list, tuple)):
+            return f"{len(parameters)} наборов параметров"
+        return [type(value).__name__ for value in parameters]
+    return type(parameters).__name__
+
+def _format_parameters(parameters) -> str:
+    text = repr(parameters if SLOW_QUERY_LOG_PARAMETERS else _redact(parameters))
+    if len(text) > PARAMETERS_MAX_LENGTH:
+        text = text[:PARAMETERS_MAX_LENGTH] + "..."
+    return text
+
+# Фоновый поток, снимающий планы медленных запросов на отдельном соединении
+class Explainer:
+    def __init__(self):
+        self._queue = queue.Queue(maxsize=EXPLAIN_QUEUE_SIZE)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, engine, statement: str, parameters, entry: dict):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="explain", daemon=True)
+                self._thread.start()
+        try:
+            self._queue.put_nowait((engine, statement, parameters, entry))
+        except queue.Full:
+            entry["plan"] = "Очередь EXPLAIN переполнена, план не снят"
+
+    def _loop(self):
+        while True:
+            engine, statement, parameters, entry = self._queue.get()
+            try:
+                with engine.connect() as conn:
+                    with conn.begin() as transaction:
+                        conn.exec_driver_sql(f"SET LOCAL statement_timeout = {EXPLAIN_TIMEOUT_MS}")
+                        rows = conn.exec_driver_sql(
+                            "EXPLAIN (ANALYZE, BUFFERS) " + statement, parameters
+                        ).fetchall()
+                        transaction.rollback()
+                entry["plan"] = "\n".join(row[0] for row in rows)
+                logger.warning(f"План медленного запроса ({entry['duration_ms']} мс):\n{entry['plan']}")
+            except Exception as e:
+                entry["plan"] = f"Не удалось получить план: {e}"
+
+explainer = Explainer()
+
+def _explainable(conn, statement: str, executemany: bool) -> bool:
+    if not EXPLAIN_ENABLED or executemany or conn.dialect.name != "postgresql":
+        return False
+    # EXPLAIN ANALYZE выполняет запрос, поэтому план снимается только для чтения
+    # из таблиц: без изменений данных, блокировок строк и вызовов функций вроде
+    # pg_advisory_xact_lock (SELECT без FROM - это всегда вызов функции)
+    upper = statement.lstrip().upper()
+    if not upper.startswith("SELECT") or not _FROM.search(upper):
+        return False
+    return " FOR UPDATE" not in upper and " FOR SHARE" not in upper and not _SIDE_EFFECTS.search(statement)
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("querylog_started", []).append(time.perf_counter())
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started_list = conn.info.get("querylog_started")
+    if not started_list:
+        return
+    duration_ms = (time.perf_counter() - started_list.pop()) * 1000
+
+    queries = _request.get()
+    if queries is not None:
+        queries.statements[statement] += 1
+        queries.total += 1
+    if _budgets:
+        with _budgets_lock:
+            for budget in _budgets:
+                budget.add(statement)
+
+    if duration_ms < SLOW_QUERY_MS:
+        return
+    slow_query_counter.inc()
+    if queries is not None:
+        queries.slow += 1
+    entry = {
+        "at": datetime.utcnow().isoformat(),
+        "duration_ms": round(duration_ms, 1),
+        "statement": statement,
+        "parameters": _format_parameters(parameters),
+        "plan": None,
+    }
+    stats.record_slow(entry)
+    logger.warning(f"Медленный SQL-запрос ({entry['duration_ms']} мс): {statement} параметры: {entry['parameters']}")
+    if _explainable(conn, statement, executemany) and stats.should_explain(normalize(statement)):
+        explainer.submit(conn.engine, statement, parameters, entry)
+
+# ASGI-мидлвар: считает SQL-запросы каждого HTTP-запроса и ищет повторы (N+1)
+class QueryInspectorMiddleware:
+    def __init__(self, app, threshold: int = N_PLUS_ONE_THRESHOLD):
+        self.app = app
+        self.threshold = threshold
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        queries = RequestQueries()
+        token = _request.set(queries)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _request.reset(token)
+            route = getattr(scope.get("route"), "path", None)
+            if route is not None:
+                self._finish(scope["method"], route, queries)
+
+    def _finish(self, method: str, route: str, queries: RequestQueries):
+        # Повторы считаются после нормализации: одинаковый запрос с разными
+        # списками IN тоже относится к N+1
+        repeated = Counter()
+        for statement, count in queries.statements.items():
+            repeated[normalize(statement)] += count
+        repeated = {statement: count for statement, count in repeated.items() if count >= self.threshold}
+        name = f"{method} {route}"
+        if repeated:
+            n_plus_one_counter.inc(route=name)
+            worst, count = max(repeated.items(), key=lambda item: item[1])
+            logger.warning(f"Возможный N+1 в {name}: {queries.total} SQL-запросов, {count} раз: {worst}")
+        stats.record_request(name, queries, repeated)
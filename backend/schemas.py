@@ -1,4 +1,4 @@
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 from pydantic import BaseModel, Field
 from datetime import date, datetime
 
@@ -8,6 +8,9 @@ class UserBase(BaseModel):
     email: Optional[str] = None
     is_active: bool = True
     is_admin: bool = False
+    # Гостиница пользователя: он видит только её данные. Без гостиницы
+    # (и у администраторов) - все гостиницы сети
+    hotel_id: Optional[int] = None
 
 class UserCreate(UserBase):
     password: str
@@ -54,6 +57,47 @@ class RoomType(RoomTypeBase):
     class Config:
         from_attributes = True
 
+# Цена типа номера на дату
+class RoomRateBase(BaseModel):
+    rate_date: date
+    price: float = Field(..., ge=0)
+
+class RoomRate(RoomRateBase):
+    type_id: int
+
+    class Config:
+        from_attributes = True
+
+# Расчёт стоимости нескольких вариантов проживания за один запрос
+class QuoteStay(BaseModel):
+    type_id: int
+    check_in_date: date
+    check_out_date: date
+
+class QuoteRequest(BaseModel):
+    stays: List[QuoteStay] = Field(..., max_length=5000)
+
+class Quote(QuoteStay):
+    nights: int
+    total: float
+    average_per_night: float
+
+# Свободные номера по типам на период (GET /availability/types)
+class NightAvailability(BaseModel):
+    date: date
+    total: int
+    booked: int
+    available: int
+
+class TypeAvailability(BaseModel):
+    hotel_id: int
+    type_id: int
+    type_name: Optional[str] = None
+    total: int
+    # Сколько номеров типа свободно на все ночи периода
+    available: int
+    nights: List[NightAvailability]
+
 # Схемы для номеров
 class RoomBase(BaseModel):
     hotel_id: int
@@ -67,6 +111,7 @@ class RoomCreate(RoomBase):
 
 class Room(RoomBase):
     room_id: int
+    version: int = 1
 
     class Config:
         from_attributes = True
@@ -81,6 +126,8 @@ class ClientBase(BaseModel):
     last_name: str
     passport_number: str
     city: str
+    # По умолчанию - гостиница пользователя
+    hotel_id: Optional[int] = None
 
 class ClientCreate(ClientBase):
     pass
@@ -91,6 +138,24 @@ class Client(ClientBase):
     class Config:
         from_attributes = True
 
+# Поиск и объединение дублей клиентов (см. dedupe.py).
+# reason - признак, по которому найдена группа: passport или name
+class DuplicateGroup(BaseModel):
+    reason: str
+    key: str
+    clients: List[Client]
+
+MERGE_MAX_SOURCES = 100
+
+class ClientMerge(BaseModel):
+    target_id: int
+    source_ids: List[int] = Field(..., min_length=1, max_length=MERGE_MAX_SOURCES)
+
+class ClientMergeResult(BaseModel):
+    client: Client
+    merged_client_ids: List[int]
+    bookings_moved: int
+
 # Схемы для бронирований
 class BookingBase(BaseModel):
     room_id: int
@@ -104,6 +169,9 @@ class BookingCreate(BookingBase):
 
 class Booking(BookingBase):
     booking_id: int
+    hotel_id: Optional[int] = None
+    total_price: Optional[float] = None
+    version: int = 1
 
     class Config:
         from_attributes = True
@@ -115,6 +183,47 @@ class BookingWithDetails(Booking):
 class BookingStatusUpdate(BaseModel):
     status: str
 
+# Автоматический подбор номеров: тип номера или минимальная вместимость, даты и количество
+class BookingAllocationRequest(BaseModel):
+    client_id: int
+    check_in_date: date
+    check_out_date: date
+    quantity: int = Field(1, ge=1, le=500)
+    type_id: Optional[int] = None
+    capacity: Optional[int] = None
+    hotel_id: Optional[int] = None
+    status: str = "Подтверждено"
+
+class BookingAllocation(BaseModel):
+    bookings: List[Booking]
+
+# Массовые изменения по спискам идентификаторов (одна транзакция на запрос)
+BATCH_MAX_ITEMS = 1000
+
+class BookingStatusBatch(BaseModel):
+    booking_ids: List[int] = Field(..., min_length=1, max_length=BATCH_MAX_ITEMS)
+    status: str
+
+class CleaningLogCompleteBatch(BaseModel):
+    log_ids: List[int] = Field(..., min_length=1, max_length=BATCH_MAX_ITEMS)
+
+# Изменяются только переданные поля, одинаково для всех номеров
+class RoomBatchUpdate(BaseModel):
+    room_ids: List[int] = Field(..., min_length=1, max_length=BATCH_MAX_ITEMS)
+    hotel_id: Optional[int] = None
+    type_id: Optional[int] = None
+    floor: Optional[int] = None
+
+# Результат по записи: updated, unchanged (уже в нужном состоянии) или not_found
+class BatchItemResult(BaseModel):
+    id: int
+    result: str
+    version: Optional[int] = None
+
+class BatchResult(BaseModel):
+    updated: int
+    items: List[BatchItemResult]
+
 # Схемы для сотрудников
 class EmployeeBase(BaseModel):
     hotel_id: int
@@ -145,6 +254,8 @@ class CleaningScheduleCreate(CleaningScheduleBase):
 
 class CleaningSchedule(CleaningScheduleBase):
     schedule_id: int
+    hotel_id: Optional[int] = None
+    version: int = 1
 
     class Config:
         from_attributes = True
@@ -164,6 +275,8 @@ class CleaningLogCreate(CleaningLogBase):
 
 class CleaningLog(CleaningLogBase):
     log_id: int
+    hotel_id: Optional[int] = None
+    version: int = 1
 
     class Config:
         from_attributes = True
@@ -174,5 +287,69 @@ class CleaningLogWithDetails(CleaningLog):
 class CleaningLogStatusUpdate(BaseModel):
     status: str
 
+# Результат автоматического распределения уборки на дату
+class EmployeeWorkload(BaseModel):
+    employee_id: int
+    floors: List[int]
+    minutes: int
+
+class CleaningPlan(BaseModel):
+    cleaning_date: date
+    logs: List[CleaningLog]
+    workloads: List[EmployeeWorkload]
+
 class RoomStatusUpdate(BaseModel):
-    status: str 
\ No newline at end of file
+    status: str
+
+# Схемы для аналитики заполняемости и выручки
+class OccupancyStat(BaseModel):
+    key: str
+    label: str
+    available_room_nights: int
+    sold_room_nights: int
+    occupancy: float
+
+class RevenueStat(BaseModel):
+    key: str
+    label: str
+    available_room_nights: int
+    sold_room_nights: int
+    revenue: float
+    adr: float
+    revpar: float
+
+class CleaningStat(BaseModel):
+    key: str
+    label: str
+    assigned: int
+    completed: int
+    completion: float
+
+class FactsRefreshResult(BaseModel):
+    occupancy_days: int
+    cleaning_days: int
+
+# Изменения для инкрементального обновления данных клиента (GET /sync)
+class SyncChanges(BaseModel):
+    cursor: str
+    full: bool
+    bookings: List[Booking]
+    rooms: List[Room]
+    clients: List[Client]
+    employees: List[Employee]
+    cleaning_logs: List[CleaningLog]
+    deleted: Dict[str, List[int]]
+
+# Состояние фоновой задачи (GET /jobs/{job_id})
+class Job(BaseModel):
+    job_id: int
+    kind: str
+    status: str
+    progress: int
+    message: Optional[str] = None
+    attempts: int
+    result: Optional[Any] = None
+    error: Optional[str] = None
+    created_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
@@ -0,0 +1,102 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import event, select, text
+from datetime import datetime, timedelta
+import logging
+import os
+import models
+import schemas
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Сущности, изменения которых отдаёт GET /sync: модель, схема ответа и первичный ключ
+SYNC_ENTITIES = {
+    "bookings": (models.Booking, schemas.Booking, "booking_id"),
+    "rooms": (models.Room, schemas.Room, "room_id"),
+    "clients": (models.Client, schemas.Client, "client_id"),
+    "employees": (models.Employee, schemas.Employee, "employee_id"),
+    "cleaning_logs": (models.CleaningLog, schemas.CleaningLog, "log_id"),
+}
+
+# Сколько дней хранятся отметки об удалении. Клиент с более старым курсором
+# получает полный набор данных вместо изменений
+SYNC_TOMBSTONE_DAYS = int(os.getenv("SYNC_TOMBSTONE_DAYS", "30"))
+
+_entity_by_model = {model: (name, key) for name, (model, _, key) in SYNC_ENTITIES.items()}
+
+# При каждом flush запоминаем удаляемые записи отслеживаемых моделей вместе
+# с их гостиницей: отметки, как и сами записи, разделены по гостиницам
+@event.listens_for(Session, "before_flush")
+def track_deletes(session, flush_context, instances):
+    for obj in list(session.deleted):
+        entity = _entity_by_model.get(type(obj))
+        if entity is not None:
+            name, key = entity
+            session.add(models.DeletedRecord(entity=name, entity_id=getattr(obj, key), hotel_id=obj.hotel_id))
+
+# Курсор - номер изменения (см. models.current_change_id) и время его выдачи:
+# время нужно только для проверки срока хранения отметок об удалении
+def encode_cursor(change_id: int, moment: datetime) -> str:
+    return f"{change_id}@{moment.isoformat()}"
+
+# Курсор прежнего формата (только время) возвращается без номера: по нему
+# отдаётся полный набор данных
+def decode_cursor(cursor: str):
+    change_id, separator, moment = cursor.partition("@")
+    if not separator:
+        return None, datetime.fromisoformat(cursor)
+    return int(change_id), datetime.fromisoformat(moment)
+
+# Номер, с которого начнётся следующее окно изменений. В PostgreSQL - наименьшая
+# транзакция, ещё не завершённая к моменту чтения (xmin снимка): все транзакции
+# с меньшими номерами уже зафиксированы и видны следующим запросам выборки,
+# а записи остальных попадут в окно следующего запроса, когда бы они ни
+# зафиксировались. Курсор получается до выборки данных
+def _next_change_id(db: Session) -> int:
+    if db.get_bind().dialect.name == "postgresql":
+        return db.scalar(text("SELECT txid_snapshot_xmin(txid_current_snapshot())"))
+    return db.scalar(select(models.current_change_id()))
+
+def purge_tombstones(db: Session):
+    db.query(models.DeletedRecord).filter(
+        models.DeletedRecord.deleted_at < datetime.utcnow() - timedelta(days=SYNC_TOMBSTONE_DAYS)
+    ).delete(synchronize_session=False)
+    db.commit()
+
+# Изменения после курсора since (None - полный набор данных). Записи с номером
+# изменения не меньше номера из курсора отдаются заново (в том числе уже
+# полученные), клиент просто заменяет их по ключу
+def get_changes(db: Session, since=None):
+    change_id = _next_change_id(db)
+    moment = datetime.utcnow()
+    since_change_id, since_moment = since if since is not None else (None, None)
+    full = since_change_id is None or since_moment < moment - timedelta(days=SYNC_TOMBSTONE_DAYS)
+
+    changes = {"cursor": encode_cursor(change_id, moment), "full": full}
+    for name, (model, schema, key) in SYNC_ENTITIES.items():
+        query = db.query(model)
+        if not full:
+            query = query.filter(model.change_id >= since_change_id)
+        changes[name] = [schema.model_validate(row) for row in query.order_by(getattr(model, key)).all()]
+
+    deleted = {name: [] for name in SYNC_ENTITIES}
+    if not full:
+        rows = db.query(models.DeletedRecord.entity, models.DeletedRecord.entity_id).filter(
+            models.DeletedRecord.change_id >= since_change_id
+        ).order_by(models.DeletedRecord.id).all()
+        for entity, entity_id in rows:
+            if entity in deleted:
+                deleted[entity].append(entity_id)
+    changes["deleted"] = deleted
+    return changes
+
+# Очистка старых отметок об удалении (например, из cron): python sync.py
+if __name__ == "__main__":
+    from database import SessionLocal
+    db = SessionLocal()
+    try:
+        purge_tombstones(db)
+        logger.info("Старые отметки об удалении очищены")
+    finally:
+        db.close()
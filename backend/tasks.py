@@ -0,0 +1,36 @@
+from sqlalchemy.orm import Session
+from fastapi.encoders import jsonable_encoder
+from jobs import handler, JobContext
+import crud
+import dedupe
+import events
+import exports
+import schemas
+# Обработчики событий сессии (витрины, удаления для /sync, учёт номерного фонда,
+# гостиница записей) должны быть зарегистрированы и в отдельном процессе исполнителя
+import etl, sync, inventory, tenancy
+
+# Обработчики фоновых задач. Модуль импортируется процессом API и отдельным
+# исполнителем (python jobs.py worker), чтобы обработчики были зарегистрированы в обоих
+
+@handler("update_room_statuses")
+def update_room_statuses(db: Session, params: dict, context: JobContext):
+    updated_rooms = crud.update_all_room_statuses(db, progress=context.progress)
+    events.publish_many(
+        ("room", "updated", room.room_id, room.hotel_id, jsonable_encoder(schemas.Room.model_validate(room)))
+        for room in updated_rooms
+    )
+    return {"updated_rooms_count": len(updated_rooms)}
+
+@handler("delete_client")
+def delete_client(db: Session, params: dict, context: JobContext):
+    db_client = crud.delete_client(db, params["client_id"], progress=context.progress)
+    return jsonable_encoder(schemas.Client.model_validate(db_client))
+
+@handler("report_export")
+def report_export(db: Session, params: dict, context: JobContext):
+    return exports.run_export(db, params["export_id"], progress=context.progress)
+
+@handler(dedupe.BACKFILL_JOB)
+def dedupe_backfill(db: Session, params: dict, context: JobContext):
+    return {"clients": dedupe.backfill(db)}
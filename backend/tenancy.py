@@ -0,0 +1,280 @@
+from sqlalchemy.orm import Session, with_loader_criteria
+from sqlalchemy import event, inspect, select, update, text
+from fastapi import HTTPException, Request, status
+from collections import OrderedDict
+from database import SessionLocal, engine
+import logging
+import os
+import sys
+import threading
+import time
+import models
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Разделение данных по гостиницам. Гостиница пользователя (User.hotel_id)
+# определяется по токену из заголовка Authorization и запоминается в сессии БД
+# запроса. Все ORM-запросы такой сессии к моделям из SCOPED_MODELS, включая
+# массовые UPDATE и DELETE, получают условие hotel_id = гостиница пользователя
+# (with_loader_criteria), поэтому списки, поиск по ключу, связанные записи и
+# массовые изменения ограничены одной гостиницей, а запросы идут по индексам,
+# начинающимся с hotel_id.
+# Бронирования, записи журнала и расписания уборок хранят hotel_id своего
+# номера или сотрудника: он выставляется перед flush и переносится при смене
+# гостиницы номера или сотрудника. Администраторы сети и пользователи без
+# гостиницы видят все гостиницы; запросы без токена отклоняются (401)
+
+# Ключ гостиницы пользователя в Session.info
+TENANT_KEY = "tenant_hotel_id"
+
+SCOPED_MODELS = (
+    models.Hotel,
+    models.Room,
+    models.Employee,
+    models.Client,
+    models.Booking,
+    models.CleaningSchedule,
+    models.CleaningLog,
+    models.Inventory,
+    models.DailyRoomOccupancy,
+    models.DailyCleaningSummary,
+    models.DeletedRecord,
+)
+
+# Таблицы, в которые hotel_id добавлен денормализацией
+DENORMALIZED_TABLES = ("bookings", "cleaning_logs", "cleaning_schedules", "clients")
+
+# Эндпоинты, доступные без токена (вход в систему и проверка доступности API)
+PUBLIC_PATHS = ("/", "/token")
+
+# Сколько секунд помнить гостиницу пользователя по токену
+TENANT_CACHE_SECONDS = float(os.getenv("TENANT_CACHE_SECONDS", "60"))
+TENANT_CACHE_SIZE = 10000
+
+_INVALID = object()
+_tokens = OrderedDict()
+_tokens_lock = threading.Lock()
+
+def _unauthorized():
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Недействительный токен авторизации",
+        headers={"WWW-Authenticate": "Bearer"}
+    )
+
+# Токен имеет вид "<имя пользователя>_<id>" (см. POST /token)
+def _load_scope(token: str):
+    username, _, user_id = token.rpartition("_")
+    if not username or not user_id.isdigit():
+        return _INVALID
+    db = SessionLocal()
+    try:
+        user = db.get(models.User, int(user_id))
+        if user is None or user.username != username or not user.is_active:
+            return _INVALID
+        return None if user.is_admin or user.hotel_id is None else user.hotel_id
+    finally:
+        db.close()
+
+# Гостиница пользователя по токену (None - все гостиницы). Результат
+# кешируется на TENANT_CACHE_SECONDS, чтобы не читать пользователя в каждом запросе
+def hotel_for_token(token: str):
+    now = time.monotonic()
+    with _tokens_lock:
+        cached = _tokens.get(token)
+        if cached is not None and cached[1] > now:
+            _tokens.move_to_end(token)
+            scope = cached[0]
+        else:
+            cached = None
+    if cached is None:
+        scope = _load_scope(token)
+        with _tokens_lock:
+            _tokens[token] = (scope, now + TENANT_CACHE_SECONDS)
+            _tokens.move_to_end(token)
+            if len(_tokens) > TENANT_CACHE_SIZE:
+                _tokens.popitem(last=False)
+    if scope is _INVALID:
+        raise _unauthorized()
+    return scope
+
+# Гостиница пользователя запроса. Токен передаётся в заголовке Authorization,
+# а там, где браузер не позволяет задать заголовок (EventSource для /events,
+# ссылка на файл выгрузки), - в параметре access_token. Запрос без токена
+# получает 401; без токена доступны только эндпоинты из PUBLIC_PATHS
+def request_hotel_id(request: Request):
+    authorization = request.headers.get("authorization")
+    if authorization:
+        scheme, _, token = authorization.partition(" ")
+        if scheme.lower() != "bearer" or not token.strip():
+            raise _unauthorized()
+        return hotel_for_token(token.strip())
+    token = request.query_params.get("access_token")
+    if token:
+        return hotel_for_token(token)
+    if request.url.path in PUBLIC_PATHS:
+        return None
+    raise _unauthorized()
+
+def scope_session(db: Session, hotel_id):
+    db.info[TENANT_KEY] = hotel_id
+    return db
+
+def current_hotel_id(db: Session):
+    return db.info.get(TENANT_KEY)
+
+# Гостиница для параметра hotel_id эндпоинтов, которые строят запросы сами
+# (аналитика, выгрузки, лента событий): пользователю гостиницы - только своя
+def resolve_hotel_id(tenant_hotel_id, hotel_id):
+    if tenant_hotel_id is None:
+        return hotel_id
+    if hotel_id is not None and hotel_id != tenant_hotel_id:
+        raise HTTPException(status_code=403, detail="Нет доступа к данным другой гостиницы")
+    return tenant_hotel_id
+
+# Операции над данными всех гостиниц (например, перестроение витрин)
+def require_all_hotels(db: Session):
+    if current_hotel_id(db) is not None:
+        raise HTTPException(status_code=403, detail="Операция доступна только администратору сети гостиниц")
+
+@event.listens_for(Session, "do_orm_execute")
+def filter_by_hotel(execute_state):
+    hotel_id = execute_state.session.info.get(TENANT_KEY)
+    if (
+        hotel_id is None
+        or not (execute_state.is_select or execute_state.is_update or execute_state.is_delete)
+        or execute_state.is_column_load
+        or execute_state.is_relationship_load
+    ):
+        return
+    # Ленивые загрузки связей получают условие вместе с исходным запросом.
+    # Массовые UPDATE / DELETE через db.execute изменяют только строки гостиницы
+    # пользователя, даже если код выбрал идентификаторы без проверки
+    execute_state.statement = execute_state.statement.options(*[
+        with_loader_criteria(model, lambda cls: cls.hotel_id == hotel_id, include_aliases=True)
+        for model in SCOPED_MODELS
+    ])
+
+def _changed(obj, attr: str) -> bool:
+    return inspect(obj).attrs[attr].history.has_changes()
+
+def _parent_hotel(session, model, parent_id):
+    if parent_id is None:
+        return None
+    parent = session.get(model, parent_id)
+    return parent.hotel_id if parent is not None else None
+
+# Перед flush: hotel_id новых и изменённых записей по номеру или сотруднику,
+# проверка, что пользователь гостиницы не пишет в чужую гостиницу
+@event.listens_for(Session, "before_flush")
+def assign_hotels(session, flush_context, instances):
+    tenant_hotel_id = session.info.get(TENANT_KEY)
+    moves = []
+    changed = list(session.new) + [
+        obj for obj in session.dirty if session.is_modified(obj, include_collections=False)
+    ]
+    for obj in changed:
+        if isinstance(obj, models.Booking):
+            if obj.hotel_id is None or _changed(obj, "room_id"):
+                obj.hotel_id = _parent_hotel(session, models.Room, obj.room_id)
+        elif isinstance(obj, (models.CleaningLog, models.CleaningSchedule)):
+            if obj.hotel_id is None or _changed(obj, "employee_id"):
+                obj.hotel_id = _parent_hotel(session, models.Employee, obj.employee_id)
+        elif isinstance(obj, models.Client):
+            if obj.hotel_id is None:
+                obj.hotel_id = tenant_hotel_id
+        elif isinstance(obj, (models.Room, models.Employee)):
+            if obj not in session.new and _changed(obj, "hotel_id"):
+                moves.append((type(obj), inspect(obj).identity[0], obj.hotel_id))
+        if tenant_hotel_id is not None and isinstance(obj, SCOPED_MODELS) and obj.hotel_id != tenant_hotel_id:
+            raise HTTPException(status_code=403, detail="Нет доступа к данным другой гостиницы")
+    if moves:
+        session.info.setdefault("tenancy_moves", []).extend(moves)
+
+@event.listens_for(Session, "after_flush")
+def apply_moves(session, flush_context):
+    moves = session.info.pop("tenancy_moves", None)
+    if not moves:
+        return
+    conn = session.connection()
+    for model, parent_id, hotel_id in moves:
+        if model is models.Room:
+            _move_rooms(conn, [parent_id], hotel_id)
+        else:
+            _move_employees(conn, [parent_id], hotel_id)
+
+@event.listens_for(Session, "after_rollback")
+def discard_moves(session):
+    session.info.pop("tenancy_moves", None)
+
+# Перенос hotel_id на бронирования номеров и на уборки сотрудников
+# при смене их гостиницы
+def _move_rooms(conn, room_ids, hotel_id):
+    conn.execute(
+        update(models.Booking)
+        .where(models.Booking.room_id.in_(room_ids))
+        .values(hotel_id=hotel_id)
+    )
+
+def _move_employees(conn, employee_ids, hotel_id):
+    for model in (models.CleaningLog, models.CleaningSchedule):
+        conn.execute(
+            update(model)
+            .where(model.employee_id.in_(employee_ids))
+            .values(hotel_id=hotel_id)
+        )
+
+# То же для изменений в обход ORM (массовый UPDATE номеров, см. batch.py)
+def move_rooms(db: Session, room_ids, hotel_id):
+    if room_ids:
+        _move_rooms(db.connection(), room_ids, hotel_id)
+
+# Заполняются только строки, для которых гостиница известна: остальные
+# не изменяются (и не получают новое время изменения) при каждом запуске
+def _backfill(conn, model, hotel_id):
+    conn.execute(
+        update(model)
+        .where(model.hotel_id.is_(None), hotel_id.isnot(None))
+        .values(hotel_id=hotel_id)
+    )
+
+# Добавление hotel_id в таблицы существующей базы и заполнение пустых значений.
+# Выполняется при запуске API; новые базы получают колонки и индексы через
+# create_all. Клиенту назначается гостиница его последнего бронирования;
+# клиенты без бронирований остаются без гостиницы и видны только администраторам сети
+def migrate(conn):
+    inspector = inspect(conn)
+    for table_name in DENORMALIZED_TABLES:
+        columns = {column["name"] for column in inspector.get_columns(table_name)}
+        if "hotel_id" in columns:
+            continue
+        logger.info(f"Добавление колонки hotel_id в таблицу {table_name}")
+        conn.execute(text(f"ALTER TABLE {table_name} ADD COLUMN hotel_id INTEGER REFERENCES hotels (hotel_id)"))
+    # Индексы, начинающиеся с hotel_id
+    for model in SCOPED_MODELS:
+        for index in model.__table__.indexes:
+            if list(index.columns)[0].name == "hotel_id":
+                index.create(conn, checkfirst=True)
+
+    _backfill(conn, models.Booking, select(models.Room.hotel_id).where(
+        models.Room.room_id == models.Booking.room_id
+    ).scalar_subquery())
+    for model in (models.CleaningLog, models.CleaningSchedule):
+        _backfill(conn, model, select(models.Employee.hotel_id).where(
+            models.Employee.employee_id == model.employee_id
+        ).scalar_subquery())
+    _backfill(conn, models.Client, select(models.Booking.hotel_id).where(
+        models.Booking.client_id == models.Client.client_id
+    ).order_by(models.Booking.check_in_date.desc()).limit(1).scalar_subquery())
+
+# Перенос без запуска API (например, перед запуском отдельного исполнителя задач):
+#   python tenancy.py migrate
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != "migrate":
+        logger.error("Использование: python tenancy.py migrate")
+        sys.exit(1)
+    with engine.begin() as conn:
+        migrate(conn)
+    logger.info("Колонки hotel_id и индексы по гостиницам готовы")
@@ -0,0 +1,66 @@
+import os
+import sys
+
+# Тесты работают с базой SQLite в памяти вместо PostgreSQL: модули backend
+# импортируются напрямую, а движок подменяется до импорта main.py, который
+# при импорте создаёт таблицы. События доставляются в пределах процесса
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["EVENTS_BACKEND"] = "memory"
+
+import pytest
+from sqlalchemy import PrimaryKeyConstraint, create_engine
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.pool import StaticPool
+import database
+
+def sqlite_engine():
+    return create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+
+database.engine = sqlite_engine()
+database.SessionLocal.configure(bind=database.engine)
+
+import models
+
+# В PostgreSQL первичный ключ секционированных таблиц включает дату секционирования,
+# SQLite же нумерует строки только по ключу из одной колонки
+for table_name, id_column, date_column in (("bookings", "booking_id", "check_in_date"), ("cleaning_logs", "log_id", "cleaning_date")):
+    table = models.Base.metadata.tables[table_name]
+    table.c[date_column].primary_key = False
+    table.append_constraint(PrimaryKeyConstraint(table.c[id_column]))
+
+import inventory
+import main
+import crud
+import schemas
+from fastapi.testclient import TestClient
+
+# Остатки номеров пишутся через INSERT ... ON CONFLICT: в SQLite та же конструкция своего диалекта
+inventory.pg_insert = sqlite.insert
+
+@pytest.fixture(scope="session")
+def client():
+    return TestClient(main.app)
+
+@pytest.fixture
+def db():
+    session = database.SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+# Администратор сети (без гостиницы): токен "{username}_{id}" (см. tenancy.py)
+@pytest.fixture(scope="session")
+def admin_headers():
+    session = database.SessionLocal()
+    try:
+        user = crud.create_user(session, schemas.UserCreate(
+            username="admin", email="admin@example.com", password="admin", is_active=True, is_admin=True
+        ))
+        return {"Authorization": f"Bearer {user.username}_{user.id}"}
+    finally:
+        session.close()
+
+@pytest.fixture
+def room_type(db):
+    return crud.create_room_type(db, schemas.RoomTypeCreate(name="Стандарт", price_per_night=3000, capacity=2))
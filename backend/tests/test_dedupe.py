@@ -0,0 +1,42 @@
+from sqlalchemy import select, update
+import crud
+import dedupe
+import jobs
+import models
+import schemas
+
+def _client(passport, city="Москва"):
+    return models.Client(
+        first_name="Иван", last_name="Петров", passport_number=passport, city=city,
+        passport_norm=dedupe.normalize_passport(passport)
+    )
+
+def test_same_person_needs_second_attribute():
+    # Паспорта указаны у обоих: допускается одна опечатка
+    assert dedupe._same_person(_client("4510 123456"), _client("4510 123465"))
+    assert not dedupe._same_person(_client("4510 123456"), _client("4510 999999"))
+    # Паспорт указан не у обоих: нужен тот же город
+    assert dedupe._same_person(_client(""), _client("4510 123456", city=" москва "))
+    assert not dedupe._same_person(_client(""), _client("4510 123456", city="Казань"))
+    assert not dedupe._same_person(_client("", city=""), _client("", city=""))
+
+def test_backfill_is_scheduled_once(db):
+    client = crud.create_client(db, schemas.ClientCreate(
+        first_name="Анна", last_name="Смирнова", passport_number="4511 000001", city="Тверь", hotel_id=1
+    ))
+    db.execute(
+        update(models.Client)
+        .where(models.Client.client_id == client.client_id)
+        .values(passport_norm=None, name_key=None)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+
+    job = dedupe.schedule_backfill(db)
+    assert job is not None and job.kind == dedupe.BACKFILL_JOB
+    assert dedupe.schedule_backfill(db).job_id == job.job_id
+
+    db.execute(update(models.Job).where(models.Job.job_id == job.job_id).values(status=jobs.STATUS_SUCCEEDED))
+    dedupe.backfill(db)
+    assert db.scalar(select(models.Client.passport_norm).where(models.Client.client_id == client.client_id)) == "4511000001"
+    assert dedupe.schedule_backfill(db) is None
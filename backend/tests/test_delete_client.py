@@ -0,0 +1,52 @@
+from datetime import date, timedelta
+import pytest
+from sqlalchemy import delete, select
+import crud
+import models
+import schemas
+
+@pytest.fixture
+def stay(db, room_type):
+    room = crud.create_room(db, schemas.RoomCreate(
+        hotel_id=1, type_id=room_type.type_id, floor=2, room_number=f"del-{room_type.type_id}", status="Занят"
+    ))
+    client = crud.create_client(db, schemas.ClientCreate(
+        first_name="Иван", last_name="Петров", passport_number=f"4510 {room_type.type_id:06d}", city="Москва", hotel_id=1
+    ))
+    today = date.today()
+    booking = crud.create_booking(db, schemas.BookingCreate(
+        room_id=room.room_id, client_id=client.client_id,
+        check_in_date=today - timedelta(days=1), check_out_date=today + timedelta(days=2), status="Заселен"
+    ))
+    return room, client, booking
+
+def _booked(db, room_type):
+    db.expire_all()
+    return dict(db.execute(
+        select(models.Inventory.day, models.Inventory.booked).where(models.Inventory.type_id == room_type.type_id)
+    ).all())
+
+# Удаление клиента с текущим проживанием освобождает ночи и номер
+def test_delete_client_releases_inventory(db, room_type, stay):
+    room, client, booking = stay
+    today = date.today()
+    assert _booked(db, room_type)[today] == 1
+
+    crud.delete_client(db, client.client_id)
+
+    booked = _booked(db, room_type)
+    assert booked[today] == 0
+    assert booked[today + timedelta(days=1)] == 0
+    assert db.get(models.Room, room.room_id).status == "Свободен"
+
+# Бронирование, устаревшее после commit, при удалении читается из базы
+def test_delete_expired_booking_releases_inventory(db, room_type, stay):
+    _, _, booking = stay
+    check_in = booking.check_in_date
+    db.execute(delete(models.EtlDirtyRange))
+    db.commit()
+    db.delete(booking)
+    db.commit()
+    assert _booked(db, room_type)[date.today()] == 0
+    # Даты удалённого бронирования попали в диапазоны пересчёта витрин
+    assert db.scalar(select(models.EtlDirtyRange.start_date).where(models.EtlDirtyRange.source == "booking")) == check_in
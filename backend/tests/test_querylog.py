@@ -0,0 +1,49 @@
+import pytest
+import querylog
+
+def _create_rooms(client, headers, room_type, prefix, count):
+    for n in range(count):
+        response = client.post("/rooms/", json={
+            "hotel_id": 1, "type_id": room_type.type_id, "floor": 1, "room_number": f"{prefix}-{n}"
+        }, headers=headers)
+        assert response.status_code == 200
+
+# Список номеров читается одним запросом независимо от числа номеров (без N+1)
+def test_rooms_list_fits_query_budget(client, admin_headers, room_type):
+    _create_rooms(client, admin_headers, room_type, "budget", 15)
+    with querylog.query_budget(2, "GET /rooms/") as budget:
+        assert client.get("/rooms/", headers=admin_headers).status_code == 200
+    assert budget.count >= 1
+
+def test_query_budget_reports_repeated_statements(client, admin_headers):
+    with pytest.raises(querylog.QueryBudgetExceeded) as exc_info:
+        with querylog.query_budget(0, "Список"):
+            client.get("/rooms/", headers=admin_headers)
+    assert "Список" in str(exc_info.value)
+    assert "FROM rooms" in str(exc_info.value)
+
+def test_parameters_are_redacted(monkeypatch):
+    monkeypatch.setattr(querylog, "SLOW_QUERY_LOG_PARAMETERS", False)
+    text = querylog._format_parameters({"passport_number": "4510 123456", "limit": 10})
+    assert "4510" not in text
+    assert "'passport_number': 'str'" in text
+    assert "4510" not in querylog._format_parameters(("4510 123456",))
+    monkeypatch.setattr(querylog, "SLOW_QUERY_LOG_PARAMETERS", True)
+    assert "4510 123456" in querylog._format_parameters({"passport_number": "4510 123456"})
+
+class _PostgresConn:
+    class dialect:
+        name = "postgresql"
+
+@pytest.mark.parametrize("statement, expected", [
+    ("SELECT rooms.room_id FROM rooms WHERE rooms.hotel_id = %(hotel_id)s", True),
+    ("SELECT count(*) AS count_1 \nFROM bookings", True),
+    ("SELECT pg_advisory_xact_lock(hashtext(%(key)s))", False),
+    ("SELECT txid_current()", False),
+    ("SELECT pg_advisory_xact_lock(x.id) FROM x", False),
+    ("SELECT clients.client_id FROM clients WHERE clients.client_id IN (1, 2) FOR UPDATE", False),
+    ("UPDATE rooms SET status = %(status)s", False),
+])
+def test_explainable(monkeypatch, statement, expected):
+    monkeypatch.setattr(querylog, "EXPLAIN_ENABLED", True)
+    assert querylog._explainable(_PostgresConn(), statement, False) is expected
@@ -0,0 +1,49 @@
+import time
+import pytest
+from sqlalchemy.orm import sessionmaker
+import database
+import models
+from conftest import sqlite_engine
+
+# Реплика - вторая база SQLite: записи, сделанные через API, в неё не попадают,
+# поэтому по ответу видно, с какого сервера шло чтение
+@pytest.fixture
+def replica(monkeypatch):
+    engine = sqlite_engine()
+    models.Base.metadata.create_all(bind=engine)
+    monkeypatch.setattr(database, "replica_engine", engine)
+    monkeypatch.setattr(database, "ReplicaSessionLocal", sessionmaker(autocommit=False, autoflush=False, bind=engine))
+    monkeypatch.setattr(database, "_replica_state", {"checked_at": None, "healthy": False})
+    return engine
+
+def _create_room(client, headers, room_type, number):
+    response = client.post("/rooms/", json={
+        "hotel_id": 1, "type_id": room_type.type_id, "floor": 1, "room_number": number
+    }, headers=headers)
+    assert response.status_code == 200
+    return response
+
+def _room_numbers(client, headers):
+    return {room["room_number"] for room in client.get("/rooms/", headers=headers).json()}
+
+def test_write_response_carries_last_write(client, admin_headers, room_type, replica):
+    response = _create_room(client, admin_headers, room_type, "ryw-1")
+    written_at = float(response.headers["x-last-write"])
+    assert abs(time.time() - written_at) < 5
+
+    # Без отметки чтение идёт с реплики, где записи ещё нет
+    assert "ryw-1" not in _room_numbers(client, admin_headers)
+    # С отметкой о недавнем изменении - с основного сервера
+    headers = {**admin_headers, "X-Last-Write": response.headers["x-last-write"]}
+    assert "ryw-1" in _room_numbers(client, headers)
+
+def test_old_last_write_reads_replica(client, admin_headers, room_type, replica):
+    _create_room(client, admin_headers, room_type, "ryw-2")
+    headers = {**admin_headers, "X-Last-Write": str(time.time() - 3600)}
+    assert "ryw-2" not in _room_numbers(client, headers)
+
+def test_requests_without_changes_are_not_marked(client, admin_headers):
+    assert "x-last-write" not in client.get("/rooms/", headers=admin_headers).headers
+    response = client.post("/token", data={"username": "admin", "password": "admin"})
+    assert response.status_code == 200
+    assert "x-last-write" not in response.headers
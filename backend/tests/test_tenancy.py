@@ -0,0 +1,75 @@
+import pytest
+from sqlalchemy import select, update
+import crud
+import models
+import schemas
+import tenancy
+
+@pytest.fixture
+def hotels(db, room_type):
+    return [
+        crud.create_hotel(db, schemas.HotelCreate(name=f"{name} {room_type.type_id}", total_rooms=10)).hotel_id
+        for name in ("Север", "Юг")
+    ]
+
+@pytest.fixture
+def rooms(db, room_type, hotels):
+    return [
+        crud.create_room(db, schemas.RoomCreate(
+            hotel_id=hotel_id, type_id=room_type.type_id, floor=1, room_number=f"t-{hotel_id}"
+        )).room_id
+        for hotel_id in hotels
+    ]
+
+# Пользователь первой гостиницы
+@pytest.fixture
+def hotel_headers(db, hotels):
+    user = crud.create_user(db, schemas.UserCreate(
+        username=f"north{hotels[0]}", password="north", is_active=True, hotel_id=hotels[0]
+    ))
+    return {"Authorization": f"Bearer {user.username}_{user.id}"}
+
+def test_batch_update_cannot_move_rooms_to_other_hotel(client, db, hotel_headers, hotels, rooms):
+    response = client.patch("/rooms", json={"room_ids": [rooms[0]], "hotel_id": hotels[1]}, headers=hotel_headers)
+    assert response.status_code == 403
+    db.expire_all()
+    assert db.get(models.Room, rooms[0]).hotel_id == hotels[0]
+
+def test_batch_update_skips_rooms_of_other_hotel(client, db, hotel_headers, rooms):
+    response = client.patch("/rooms", json={"room_ids": rooms, "floor": 7}, headers=hotel_headers)
+    assert response.status_code == 200
+    statuses = {item["id"]: item["result"] for item in response.json()["items"]}
+    assert statuses == {rooms[0]: "updated", rooms[1]: "not_found"}
+    db.expire_all()
+    assert db.get(models.Room, rooms[1]).floor == 1
+
+# Массовый UPDATE в сессии пользователя гостиницы не трогает чужие строки
+def test_bulk_update_is_scoped(db, hotels, rooms):
+    tenancy.scope_session(db, hotels[0])
+    result = db.execute(
+        update(models.Room)
+        .where(models.Room.room_id.in_(rooms))
+        .values(floor=5)
+        .execution_options(synchronize_session=False)
+    )
+    assert result.rowcount == 1
+    db.commit()
+    tenancy.scope_session(db, None)
+    db.expire_all()
+    assert dict(db.execute(select(models.Room.room_id, models.Room.floor).where(models.Room.room_id.in_(rooms))).all()) == {
+        rooms[0]: 5, rooms[1]: 1
+    }
+
+# Отметки об удалении разделены по гостиницам, как и сами записи
+def test_sync_returns_only_own_deletions(client, db, admin_headers, hotel_headers, hotels, rooms):
+    cursor = client.get("/sync", headers=hotel_headers).json()["cursor"]
+    for room_id in rooms:
+        assert client.delete(f"/rooms/{room_id}", headers=admin_headers).status_code == 200
+    response = client.get("/sync", params={"since": cursor}, headers=hotel_headers)
+    assert response.status_code == 200
+    assert response.json()["deleted"]["rooms"] == [rooms[0]]
+    records = db.execute(
+        select(models.DeletedRecord.entity_id, models.DeletedRecord.hotel_id)
+        .where(models.DeletedRecord.entity == "rooms", models.DeletedRecord.entity_id.in_(rooms))
+    ).all()
+    assert sorted(records) == sorted(zip(rooms, hotels))
@@ -161,7 +161,7 @@ export default function BookingsPage() {
             
             // Рассчитываем общую стоимость бронирования
             const nights = calculateNights(booking.check_in_date, booking.check_out_date);
-            const totalPrice = nights * roomType.price_per_night;
+            const totalPrice = booking.total_price ?? nights * roomType.price_per_night;
             
             // Определяем актуальный статус бронирования на основе дат
             const currentStatus = determineBookingStatus(
@@ -312,7 +312,7 @@ export default function BookingsPage() {
       const checkIn = new Date(createdBooking.check_in_date);
       const checkOut = new Date(createdBooking.check_out_date);
       const nights = Math.ceil((checkOut.getTime() - checkIn.getTime()) / (1000 * 60 * 60 * 24));
-      const totalPrice = nights * roomData.room_type.price_per_night;
+      const totalPrice = createdBooking.total_price ?? nights * roomData.room_type.price_per_night;
       
       // Добавляем новое бронирование в список
       const newBookingWithDetails: BookingDisplay = {
@@ -487,7 +487,7 @@ export default function BookingsPage() {
       // Рассчитываем цену
       const nights = calculateNights(updatedBooking.check_in_date, updatedBooking.check_out_date);
       const roomTypeData = await roomService.getRoomType(updatedBooking.room.type_id);
-      const totalPrice = nights * roomTypeData.price_per_night;
+      const totalPrice = updatedBooking.total_price ?? nights * roomTypeData.price_per_night;
       
       // Обновляем бронирование в списке
       setBookings(prevBookings => 
@@ -4,6 +4,7 @@ import { useState, useEffect } from 'react';
 import { FaCalendarAlt, FaSearch, FaFileExport, FaMoneyBillWave } from 'react-icons/fa';
 import { bookingService } from '@/services/bookingService';
 import { roomService } from '@/services/roomService';
+import { reportService } from '@/services/reportService';
 
 // Тип для отображения финансовой информации
 interface FinancialData {
@@ -26,6 +27,7 @@ export default function ReportsPage() {
   const [totalIncome, setTotalIncome] = useState(0);
   const [totalBookings, setTotalBookings] = useState(0);
   const [averageBookingValue, setAverageBookingValue] = useState(0);
+  const [exporting, setExporting] = useState(false);
 
   // Добавляем стили для скрытия боковой панели при печати/экспорте в PDF
   useEffect(() => {
@@ -235,8 +237,8 @@ export default function ReportsPage() {
             const checkOut = new Date(booking.check_out_date);
             const nights = Math.ceil((checkOut.getTime() - checkIn.getTime()) / (1000 * 60 * 60 * 24));
             
-            // Рассчитываем общую стоимость
-            const totalAmount = nights * roomType.price_per_night;
+            // Общая стоимость сохраняется в бронировании по календарю цен
+            const totalAmount = booking.total_price ?? nights * roomType.price_per_night;
             
             return {
               booking_id: booking.booking_id,
@@ -326,6 +328,25 @@ export default function ReportsPage() {
     window.print();
   };
   
+  // Выгрузка отчёта в Excel: файл формируется на сервере
+  const handleExportXlsx = async () => {
+    if (!startDate || !endDate) {
+      setError('Пожалуйста, выберите начальную и конечную даты');
+      return;
+    }
+    try {
+      setExporting(true);
+      setError(null);
+      const result = await reportService.exportReport('financial', 'xlsx', startDate, endDate);
+      window.location.href = reportService.getDownloadUrl(result);
+    } catch (err) {
+      console.error('Ошибка при выгрузке отчета:', err);
+      setError('Не удалось выгрузить отчет');
+    } finally {
+      setExporting(false);
+    }
+  };
+  
   const getCurrentDateString = () => {
     const now = new Date();
     return now.toLocaleDateString('ru-RU', {
@@ -341,13 +362,23 @@ export default function ReportsPage() {
     <div>
       <div className="mb-6 flex justify-between items-center">
         <h2 className="text-2xl font-bold text-gray-800">Финансовые отчеты</h2>
-        <button 
-          className="btn-primary flex items-center space-x-2"
-          onClick={() => window.print()}
-        >
-          <FaFileExport />
-          <span>Экспорт отчета</span>
-        </button>
+        <div className="flex space-x-2">
+          <button 
+            className="btn-primary flex items-center space-x-2"
+            onClick={handleExportXlsx}
+            disabled={exporting}
+          >
+            <FaFileExport />
+            <span>{exporting ? 'Выгрузка...' : 'Выгрузить в Excel'}</span>
+          </button>
+          <button 
+            className="btn-primary flex items-center space-x-2"
+            onClick={() => window.print()}
+          >
+            <FaFileExport />
+            <span>Экспорт отчета</span>
+          </button>
+        </div>
       </div>
       
       {/* Заголовок для печатной версии */}
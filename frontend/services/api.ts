@@ -1,10 +1,10 @@
 // Базовый URL для API
-const API_URL = 'http://localhost:8000';
+export const API_URL = 'http://localhost:8000';
 
 // Функция для выполнения запросов к API
 async function fetchApi<T>(
   endpoint: string,
-  method: 'GET' | 'POST' | 'PUT' | 'DELETE' = 'GET',
+  method: 'GET' | 'POST' | 'PUT' | 'PATCH' | 'DELETE' = 'GET',
   body?: any
 ): Promise<T> {
   const headers: HeadersInit = {
@@ -18,6 +18,13 @@ async function fetchApi<T>(
     headers['Authorization'] = `Bearer ${token}`;
   }
 
+  // Время последнего изменения данных этим клиентом: пока реплика могла его
+  // не получить, сервер читает данные с основной базы
+  const lastWrite = localStorage.getItem('lastWrite');
+  if (lastWrite) {
+    headers['X-Last-Write'] = lastWrite;
+  }
+
   const config: RequestInit = {
     method,
     headers,
@@ -29,6 +36,11 @@ async function fetchApi<T>(
   try {
     // Основной запрос
     const response = await fetch(`${API_URL}${endpoint}`, config);
+
+    const writtenAt = response.headers.get('X-Last-Write');
+    if (writtenAt) {
+      localStorage.setItem('lastWrite', writtenAt);
+    }
     
     if (!response.ok) {
       console.error(`API ошибка: ${response.status} ${response.statusText} (${method} ${endpoint})`);
@@ -65,11 +77,18 @@ async function fetchApi<T>(
   }
 }
 
+// Результат массового изменения: по каждой записи updated, unchanged или not_found
+export interface BatchResult {
+  updated: number;
+  items: { id: number; result: 'updated' | 'unchanged' | 'not_found'; version: number | null }[];
+}
+
 // Экспорт функций для различных типов запросов
 export const api = {
   get: <T>(endpoint: string) => fetchApi<T>(endpoint, 'GET'),
   post: <T>(endpoint: string, body: any) => fetchApi<T>(endpoint, 'POST', body),
   put: <T>(endpoint: string, body: any) => fetchApi<T>(endpoint, 'PUT', body),
+  patch: <T>(endpoint: string, body: any) => fetchApi<T>(endpoint, 'PATCH', body),
   delete: <T>(endpoint: string) => fetchApi<T>(endpoint, 'DELETE'),
 };
 
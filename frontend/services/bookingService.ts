@@ -1,4 +1,4 @@
-import api from './api';
+import api, { BatchResult } from './api';
 import { Client } from './clientService';
 import { Room } from './cleaningService';
 
@@ -10,6 +10,8 @@ export interface Booking {
   check_in_date: string;
   check_out_date: string;
   status: string;
+  total_price?: number | null;
+  hotel_id?: number | null;
 }
 
 export interface BookingWithDetails extends Booking {
@@ -29,6 +31,18 @@ export interface BookingStatusUpdate {
   status: string;
 }
 
+export interface QuoteStay {
+  type_id: number;
+  check_in_date: string;
+  check_out_date: string;
+}
+
+export interface Quote extends QuoteStay {
+  nights: number;
+  total: number;
+  average_per_night: number;
+}
+
 // Сервис для работы с API бронирований
 export const bookingService = {
   // Получить все бронирования
@@ -56,6 +70,11 @@ export const bookingService = {
     return api.put<Booking>(`/bookings/${id}/status`, status);
   },
   
+  // Обновить статус нескольких бронирований одним запросом (например, выселение группы)
+  updateBookingStatuses: (ids: number[], status: string) => {
+    return api.patch<BatchResult>('/bookings/status', { booking_ids: ids, status });
+  },
+  
   // Удалить бронирование
   deleteBooking: (id: number) => {
     return api.delete<Booking>(`/bookings/${id}`);
@@ -71,6 +90,11 @@ export const bookingService = {
     return api.get<Booking[]>(`/rooms/${roomId}/bookings/`);
   },
   
+  // Рассчитать стоимость нескольких вариантов проживания по календарю цен
+  getQuotes: (stays: QuoteStay[]) => {
+    return api.post<Quote[]>('/quotes', { stays });
+  },
+  
   // Получить доступные номера на даты
   getAvailableRooms: (checkInDate: string, checkOutDate: string) => {
     return api.get<Room[]>(`/available-rooms/?check_in_date=${checkInDate}&check_out_date=${checkOutDate}`);
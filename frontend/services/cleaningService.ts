@@ -1,4 +1,4 @@
-import api from './api';
+import api, { BatchResult } from './api';
 import { Employee } from './employeeService';
 
 // Интерфейсы для типов данных
@@ -14,6 +14,7 @@ export interface Room {
 export interface CleaningSchedule {
   schedule_id: number;
   employee_id: number;
+  hotel_id?: number | null;
   floor: number;
   day_of_week: string;
 }
@@ -32,6 +33,7 @@ export interface CleaningLog {
   log_id: number;
   floor_id: number;
   employee_id: number;
+  hotel_id?: number | null;
   cleaning_date: string;
   status: string;
 }
@@ -131,6 +133,11 @@ export const cleaningService = {
   // Завершить уборку
   completeCleaningLog: (id: number) => {
     return api.post<CleaningLog>(`/cleaning-logs/${id}/complete/`, {});
+  },
+  
+  // Завершить несколько уборок одним запросом (например, все уборки этажа)
+  completeCleaningLogs: (ids: number[]) => {
+    return api.post<BatchResult>('/cleaning-logs/complete', { log_ids: ids });
   }
 };
 
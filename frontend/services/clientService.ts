@@ -1,4 +1,5 @@
 import api from './api';
+import jobService, { Job } from './jobService';
 
 // Интерфейсы для типов данных
 export interface Client {
@@ -7,6 +8,7 @@ export interface Client {
   last_name: string;
   passport_number: string;
   city: string;
+  hotel_id?: number | null;
 }
 
 export interface ClientCreate {
@@ -16,6 +18,19 @@ export interface ClientCreate {
   city: string;
 }
 
+// Группа возможных дублей: reason - 'passport' или 'name'
+export interface DuplicateGroup {
+  reason: 'passport' | 'name';
+  key: string;
+  clients: Client[];
+}
+
+export interface ClientMergeResult {
+  client: Client;
+  merged_client_ids: number[];
+  bookings_moved: number;
+}
+
 // Сервис для работы с API клиентов
 export const clientService = {
   // Получить всех клиентов
@@ -38,14 +53,26 @@ export const clientService = {
     return api.put<Client>(`/clients/${id}`, client);
   },
   
-  // Удалить клиента
-  deleteClient: (id: number) => {
-    return api.delete<Client>(`/clients/${id}`);
+  // Удалить клиента (вместе с бронированиями, выполняется фоновой задачей)
+  deleteClient: async (id: number) => {
+    const job = await api.delete<Job<Client>>(`/clients/${id}`);
+    return jobService.waitForJob<Client>(job);
   },
   
   // Получить клиентов по городу
   getClientsByCity: (city: string) => {
     return api.get<Client[]>(`/clients/city/${encodeURIComponent(city)}`);
+  },
+  
+  // Найти возможные дубли (after - key последней группы предыдущей страницы)
+  findDuplicates: (by: 'passport' | 'name' = 'passport', after?: string) => {
+    const query = after !== undefined ? `&after=${encodeURIComponent(after)}` : '';
+    return api.get<DuplicateGroup[]>(`/clients/duplicates?by=${by}${query}`);
+  },
+  
+  // Объединить клиентов sourceIds с клиентом targetId (бронирования переносятся)
+  mergeClients: (targetId: number, sourceIds: number[]) => {
+    return api.post<ClientMergeResult>('/clients/merge', { target_id: targetId, source_ids: sourceIds });
   }
 };
 
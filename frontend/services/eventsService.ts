@@ -0,0 +1,67 @@
+import { API_URL } from './api';
+
+// Событие об изменении записи из ленты /events
+export interface ChangeEvent<T = any> {
+  entity: 'room' | 'booking' | 'cleaning_log';
+  action: 'created' | 'updated' | 'deleted';
+  id: number;
+  hotel_id: number | null;
+  data: T;
+}
+
+// Обработчики событий ленты изменений
+export interface ChangeHandlers {
+  onChange: (event: ChangeEvent) => void;
+  // Клиент отстал от ленты: данные нужно перезагрузить целиком
+  onResync?: () => void;
+}
+
+// Сервис для подписки на изменения номеров, бронирований и уборок
+export const eventsService = {
+  // Подписаться на изменения (опционально только по одной гостинице).
+  // Возвращает функцию для отписки
+  subscribe: (handlers: ChangeHandlers, hotelId?: number) => {
+    // EventSource не передаёт заголовки, поэтому токен идёт параметром access_token
+    const params = new URLSearchParams();
+    const token = localStorage.getItem('accessToken');
+    if (token) {
+      params.set('access_token', token);
+    }
+    if (hotelId !== undefined) {
+      params.set('hotel_id', String(hotelId));
+    }
+    const query = params.toString() ? `?${params.toString()}` : '';
+    const source = new EventSource(`${API_URL}/events${query}`);
+
+    const handleMessage = (message: MessageEvent) => {
+      try {
+        handlers.onChange(JSON.parse(message.data) as ChangeEvent);
+      } catch (error) {
+        console.error('Ошибка разбора события:', error);
+      }
+    };
+
+    source.addEventListener('room', handleMessage);
+    source.addEventListener('booking', handleMessage);
+    source.addEventListener('cleaning_log', handleMessage);
+    source.addEventListener('resync', () => {
+      handlers.onResync?.();
+    });
+
+    return () => source.close();
+  },
+};
+
+// Применить событие к списку записей: добавить, заменить или удалить запись
+export function applyChange<T>(items: T[], event: ChangeEvent<T>, getId: (item: T) => number): T[] {
+  if (event.action === 'deleted') {
+    return items.filter(item => getId(item) !== event.id);
+  }
+  const exists = items.some(item => getId(item) === event.id);
+  if (!exists) {
+    return [...items, event.data];
+  }
+  return items.map(item => (getId(item) === event.id ? event.data : item));
+}
+
+export default eventsService;
@@ -0,0 +1,50 @@
+import api from './api';
+
+// Состояние фоновой задачи (GET /jobs/{id})
+export interface Job<T = any> {
+  job_id: number;
+  kind: string;
+  status: 'queued' | 'running' | 'succeeded' | 'failed';
+  progress: number;
+  message: string | null;
+  attempts: number;
+  result: T | null;
+  error: string | null;
+  created_at: string | null;
+  started_at: string | null;
+  finished_at: string | null;
+}
+
+// Сервис для фоновых задач: долгие операции возвращают 202 с задачей,
+// результат получаем опросом
+export const jobService = {
+  getJob: <T = any>(id: number) => {
+    return api.get<Job<T>>(`/jobs/${id}`);
+  },
+
+  // Дождаться завершения задачи и вернуть её результат.
+  // onProgress вызывается при каждом опросе
+  waitForJob: async <T = any>(
+    job: Job<T>,
+    onProgress?: (job: Job<T>) => void,
+    intervalMs: number = 500,
+    timeoutMs: number = 5 * 60 * 1000
+  ): Promise<T> => {
+    const deadline = Date.now() + timeoutMs;
+    let current = job;
+    while (current.status === 'queued' || current.status === 'running') {
+      if (Date.now() > deadline) {
+        throw new Error('Превышено время ожидания фоновой задачи');
+      }
+      await new Promise(resolve => setTimeout(resolve, intervalMs));
+      current = await jobService.getJob<T>(current.job_id);
+      onProgress?.(current);
+    }
+    if (current.status === 'failed') {
+      throw new Error(current.error || 'Фоновая задача завершилась с ошибкой');
+    }
+    return current.result as T;
+  }
+};
+
+export default jobService;
@@ -0,0 +1,44 @@
+import api, { API_URL } from './api';
+import jobService, { Job } from './jobService';
+
+export type ReportKind = 'financial' | 'occupancy' | 'cleaning';
+export type ExportFormat = 'csv' | 'xlsx' | 'pdf';
+
+// Результат фоновой задачи выгрузки
+export interface ReportExport {
+  export_id: string;
+  kind: ReportKind;
+  format: ExportFormat;
+  rows: number;
+  size: number;
+  content_hash: string;
+  expires_at: string;
+  download_url: string;
+}
+
+// Сервис для выгрузки отчётов в файлы: файл формируется на сервере фоновой
+// задачей, после её завершения браузер скачивает готовый файл
+export const reportService = {
+  exportReport: async (
+    kind: ReportKind,
+    format: ExportFormat,
+    start: string,
+    end: string,
+    onProgress?: (job: Job<ReportExport>) => void
+  ) => {
+    const job = await api.post<Job<ReportExport>>(
+      `/reports/${kind}/export?format=${format}&start=${start}&end=${end}`, {}
+    );
+    return jobService.waitForJob<ReportExport>(job, onProgress);
+  },
+
+  // Ссылка на файл выгрузки. Браузер скачивает файл без заголовка Authorization,
+  // поэтому токен передаётся параметром access_token
+  getDownloadUrl: (result: ReportExport) => {
+    const token = localStorage.getItem('accessToken');
+    const query = token ? `?access_token=${encodeURIComponent(token)}` : '';
+    return `${API_URL}${result.download_url}${query}`;
+  }
+};
+
+export default reportService;
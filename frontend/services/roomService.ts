@@ -1,4 +1,5 @@
-import api from './api';
+import api, { BatchResult } from './api';
+import jobService, { Job } from './jobService';
 import { Room } from './cleaningService';
 
 // Интерфейсы для типов данных
@@ -21,6 +22,14 @@ export interface RoomCreate {
   status?: string;
 }
 
+// Одинаковые изменения нескольких номеров: передаются только изменяемые поля
+export interface RoomBatchUpdate {
+  room_ids: number[];
+  hotel_id?: number;
+  type_id?: number;
+  floor?: number;
+}
+
 export interface RoomStatusUpdate {
   status: string;
 }
@@ -52,6 +61,11 @@ export const roomService = {
     return api.put<Room>(`/rooms/${id}/status`, status);
   },
   
+  // Изменить несколько номеров одним запросом
+  updateRooms: (update: RoomBatchUpdate) => {
+    return api.patch<BatchResult>('/rooms', update);
+  },
+  
   // Удалить номер
   deleteRoom: (id: number) => {
     return api.delete<Room>(`/rooms/${id}`);
@@ -63,8 +77,10 @@ export const roomService = {
   },
   
   // Функция для запуска автоматического обновления статусов всех номеров
-  updateAllRoomStatuses: () => {
-    return api.post<{updated_rooms_count: number}>('/update-room-statuses/', {});
+  // (выполняется фоновой задачей, ждём её результат)
+  updateAllRoomStatuses: async () => {
+    const job = await api.post<Job<{updated_rooms_count: number}>>('/update-room-statuses/', {});
+    return jobService.waitForJob<{updated_rooms_count: number}>(job);
   },
   
   // Получить типы номеров
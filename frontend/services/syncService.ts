@@ -0,0 +1,48 @@
+import api from './api';
+import { Booking } from './bookingService';
+import { Client } from './clientService';
+import { Employee } from './employeeService';
+import { CleaningLog, Room } from './cleaningService';
+
+// Изменения с момента предыдущей синхронизации (GET /sync)
+export interface SyncChanges {
+  // Курсор для следующего запроса
+  cursor: string;
+  // true - пришёл полный набор данных, списки нужно заменить целиком
+  full: boolean;
+  bookings: Booking[];
+  rooms: Room[];
+  clients: Client[];
+  employees: Employee[];
+  cleaning_logs: CleaningLog[];
+  // Идентификаторы удалённых записей по сущностям
+  deleted: Record<string, number[]>;
+}
+
+// Применение изменений к списку: изменённые записи заменяются или добавляются,
+// удалённые убираются
+export function applyChanges<T>(items: T[], changed: T[], deletedIds: number[], getId: (item: T) => number): T[] {
+  const removed = new Set(deletedIds);
+  const updated = new Map(changed.map(item => [getId(item), item]));
+  const result = items
+    .filter(item => !removed.has(getId(item)))
+    .map(item => updated.get(getId(item)) ?? item);
+  const existing = new Set(result.map(getId));
+  changed.forEach(item => {
+    if (!existing.has(getId(item)) && !removed.has(getId(item))) {
+      result.push(item);
+    }
+  });
+  return result;
+}
+
+// Сервис инкрементальной синхронизации: первый запрос без курсора возвращает
+// все данные, следующие - только изменения
+export const syncService = {
+  getChanges: (cursor?: string) => {
+    const query = cursor ? `?since=${encodeURIComponent(cursor)}` : '';
+    return api.get<SyncChanges>(`/sync${query}`);
+  }
+};
+
+export default syncService;